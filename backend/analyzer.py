@@ -1,38 +1,132 @@
 import json
-import requests
-from ollama import chat
-from pydantic import BaseModel
+import os
+from functools import lru_cache
+from typing import Literal, Optional
+from pydantic import BaseModel, create_model
+
+from backend.decoding import RETRY_INSTRUCTIONS, Status, decode_with_retry, retry_options
+from backend.llm_backends import backend_from_env
+from backend.preprocess import normalize_post_text
+from backend.profiles import DEFAULT_PROFILE, load_profiles, is_legacy, profiles_for_item
 
 class Output(BaseModel):
-        status: str
+        status: Status
+        motivation: str
+        # Listing fields extracted in the same call (null when not stated)
+        price: Optional[int]
+        zone: Optional[str]
+        room_type: Optional[Literal['singola', 'doppia', 'monolocale', 'appartamento', 'altro']]
+        available_from: Optional[str]
+
+
+class Verdict(BaseModel):
+        status: Status
         motivation: str
 
 
+@lru_cache(maxsize=64)
+def profiles_output_model(names):
+    """Output schema for one call evaluating the profiles `names` (a tuple):
+    the listing fields once plus one verdict per profile.
+    """
+    verdicts = create_model('ProfileVerdicts', **{n: (Verdict, ...) for n in names})
+    return create_model(
+        'ProfilesOutput',
+        price=(Optional[int], ...),
+        zone=(Optional[str], ...),
+        room_type=(Optional[Literal['singola', 'doppia', 'monolocale', 'appartamento', 'altro']], ...),
+        available_from=(Optional[str], ...),
+        profiles=(verdicts, ...),
+    )
+
+
+# Shared across analyzer instances so the load balancer keeps its
+# queue-depth / latency state between pipeline runs
+_BACKEND = None
+
+
+def get_backend():
+    global _BACKEND
+    if _BACKEND is None:
+        _BACKEND = backend_from_env()
+    return _BACKEND
+
+
 class LLMAnalizer():
-    def __init__(self, llm):
+    def __init__(self, llm, backend=None, preprocess=None):
         # get prompt form file
         with open("backend/prompt.md", "r") as f:
             self.prompt = f.read()
+        # Used instead of prompt.md when search profiles are configured
+        with open("backend/prompt_profiles.md", "r") as f:
+            self.profiles_template = f.read()
+        self._prompts = {}
         self.llm = llm
+        self.backend = backend or get_backend()
+        # Text normalization is on unless PREPROCESS_TEXT=0
+        if preprocess is None:
+            preprocess = os.getenv('PREPROCESS_TEXT', '1') != '0'
+        self.preprocess = preprocess
+
+    def profiles_prompt(self, profiles):
+        """Shared instructions with the criteria of each profile. The text only
+        depends on the set of profiles, so the server can reuse its prompt cache.
+        """
+        key = tuple((p.name, p.criteria) for p in profiles)
+        if key not in self._prompts:
+            blocks = "\n\n".join(f"#### {p.name}\n{p.criteria.strip()}" for p in profiles)
+            self._prompts[key] = self.profiles_template.replace("{profiles}", blocks)
+        return self._prompts[key]
+
+    def _chat(self, system, post_text, model):
+        """Ask for `model` JSON and decode the reply (see backend/decoding.py),
+        retrying with a shorter generation only if it cannot be repaired.
+        """
+        schema = model.model_json_schema()
 
-    def analize_post(self, post):
+        def chat(retry):
+            return self.backend.chat(
+                system=system + RETRY_INSTRUCTIONS if retry else system,
+                user=post_text,
+                schema=schema,
+                model=self.llm,
+                options=retry_options() if retry else None,
+            )
+        return decode_with_retry(chat, model)
 
+    def analize_post(self, post, profiles=None):
+        """Classify a post against the search profiles in a single call.
+        Returns the listing fields, an overall status/motivation (ACCETTATO if
+        any profile accepts), `profiles`: {name: {status, motivation}} and
+        `decode`: how the reply was decoded (repaired, retries, wasted_s).
+        Raises DecodeError when no usable reply could be obtained.
+        """
         try:
             post_text = post["text"]
         except KeyError:
             post_text = post["message"]
+        post_text = post_text or ""
+        if self.preprocess:
+            post_text = normalize_post_text(post_text)
 
-        response = chat(
-        messages=[
-            {'role': 'system', 'content': self.prompt},
-            {'role': 'user', 'content': post_text}
-        ],
-        model=self.llm,
-        format=Output.model_json_schema(),
-        )
+        all_profiles = load_profiles()
+        if is_legacy(all_profiles):
+            analysis, report = self._chat(self.prompt, post_text, Output)
+            analysis_dict = json.loads(analysis.model_dump_json())
+            analysis_dict['profiles'] = {DEFAULT_PROFILE: {'status': analysis.status, 'motivation': analysis.motivation}}
+            analysis_dict['decode'] = report
+            print(analysis_dict)
+            return analysis_dict
 
-        analysis = Output.model_validate_json(response.message.content)
+        profiles = profiles or profiles_for_item(all_profiles, post)
+        model = profiles_output_model(tuple(p.name for p in profiles))
+        analysis, report = self._chat(self.profiles_prompt(profiles), post_text, model)
         analysis_dict = json.loads(analysis.model_dump_json())
+        verdicts = analysis_dict['profiles']
+        accepted = any(v['status'] == 'ACCETTATO' for v in verdicts.values())
+        analysis_dict['status'] = 'ACCETTATO' if accepted else 'SCARTATO'
+        analysis_dict['motivation'] = "\n".join(f"[{n}] {v['status']}: {v['motivation']}" for n, v in verdicts.items())
+        analysis_dict['decode'] = report
         print(analysis_dict)
 
         return analysis_dict
@@ -0,0 +1,251 @@
+"""Images of accepted posts, cached locally as thumbnails.
+
+Every attachment of a scraped post is kept in `post_attachments`; promoting a
+post makes its attachments 'pending'. An AttachmentWorker thread leases
+pending ones, downloads them concurrently (THUMB_CONCURRENCY) through one
+keep-alive `requests.Session` and stores a thumbnail that is:
+
+- content-addressed: named "<sha256 of the original image>.<ext>", so a photo
+  reposted in several groups is stored once;
+- resized to fit THUMB_SIZE px and re-encoded as JPEG when the optional Pillow
+  package is installed, the original image otherwise;
+- bounded: above THUMB_CACHE_MB the least recently served thumbnails are
+  deleted and their posts fall back to the original url.
+
+server.py serves them at /thumbs/<name> with immutable cache headers, since a
+name never changes content. Expired or forbidden links (HTTP 403/404/410),
+non-images and oversized files are given up at once; other errors are retried
+with backoff until THUMB_MAX_ATTEMPTS.
+
+Configuration:
+    THUMB_DIR            cache directory             (default `thumbs` next to DB_PATH)
+    THUMB_CACHE_MB       cache size before eviction  (default 500)
+    THUMB_SIZE           longest side, px            (default 320)
+    THUMB_CONCURRENCY    parallel downloads          (default 4)
+    THUMB_TIMEOUT        per-request timeout, s      (default 15)
+    THUMB_MAX_ATTEMPTS   attempts before giving up   (default 4)
+    THUMB_MAX_SOURCE_MB  largest image downloaded    (default 10)
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+
+import requests
+
+from backend.polling import HttpWorker, backoff
+
+logging.basicConfig(level=logging.INFO)
+
+NAME_RE = re.compile(r'^[0-9a-f]{64}\.(jpg|png|gif|webp)$')
+EXTENSIONS = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp'}
+CONTENT_TYPES = {ext: ctype for ctype, ext in EXTENSIONS.items()}
+PERMANENT_HTTP_ERRORS = (400, 401, 403, 404, 410)
+
+
+class PermanentError(Exception):
+    """The image cannot be fetched, retrying will not help."""
+
+
+def has_pillow():
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def default_thumb_dir():
+    return os.path.join(os.path.dirname(os.path.abspath(os.getenv('DB_PATH', 'facebook_posts.db'))), 'thumbs')
+
+
+def content_type(name):
+    return CONTENT_TYPES[name.rsplit('.', 1)[1]]
+
+
+def make_thumbnail(data, size):
+    """JPEG bytes of `data` resized to fit `size` x `size`. Needs Pillow."""
+    from PIL import Image, ImageOps
+    try:
+        img = Image.open(io.BytesIO(data))
+        # JPEGs are decoded directly at a reduced scale, much cheaper than a full decode
+        img.draft('RGB', (size, size))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        out = io.BytesIO()
+        img.save(out, 'JPEG', quality=80, optimize=True)
+    except (OSError, SyntaxError, ValueError) as e:
+        raise PermanentError(f'not a decodable image: {e}')
+    return out.getvalue()
+
+
+class ThumbnailCache():
+    """Content-addressed thumbnail files under `root`, evicted least recently served first."""
+
+    def __init__(self, root=None, max_bytes=None, size=None):
+        self.root = root or os.getenv('THUMB_DIR') or default_thumb_dir()
+        self.max_bytes = int(max_bytes or float(os.getenv('THUMB_CACHE_MB', '500')) * 2 ** 20)
+        self.size = int(size or os.getenv('THUMB_SIZE', '320'))
+        self.resize = has_pillow()
+        if not self.resize:
+            logging.warning('Pillow not installed; thumbnails are stored as original images')
+        self._accesses = {}
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.root, name[:2], name)
+
+    def store(self, data, ctype):
+        """Save the thumbnail of image `data`. Returns (name, bytes, content type)."""
+        digest = hashlib.sha256(data).hexdigest()
+        if self.resize:
+            name = f'{digest}.jpg'
+        elif ctype in EXTENSIONS:
+            name = f'{digest}.{EXTENSIONS[ctype]}'
+        else:
+            raise PermanentError(f'unsupported image type {ctype}')
+        path = self.path(name)
+        if not os.path.exists(path):
+            thumb = make_thumbnail(data, self.size) if self.resize else data
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(thumb)
+            os.replace(tmp, path)
+        return name, os.path.getsize(path), content_type(name)
+
+    def touch(self, name):
+        """Note that `name` was served; saved to the DB by the worker in batches."""
+        with self._lock:
+            self._accesses[name] = time.time()
+
+    def flush(self, db):
+        with self._lock:
+            accesses, self._accesses = self._accesses, {}
+        if accesses:
+            db.touch_thumbs(accesses)
+
+    def evict(self, db):
+        """Delete least recently served thumbnails until the cache is below 90% of
+        its limit. Returns the number of files deleted.
+        """
+        _, total = db.thumb_cache_size()
+        if total <= self.max_bytes:
+            return 0
+        self.flush(db)
+        target = self.max_bytes * 0.9
+        deleted = 0
+        while total > target:
+            victims = db.least_recent_thumbs(limit=200)
+            if not victims:
+                break
+            names = []
+            for name, size in victims:
+                if total <= target:
+                    break
+                try:
+                    os.remove(self.path(name))
+                except FileNotFoundError:
+                    pass
+                names.append(name)
+                total -= size
+            db.forget_thumbs(names)
+            deleted += len(names)
+        logging.info('Evicted %d thumbnails, cache now %.1f MB', deleted, total / 2 ** 20)
+        return deleted
+
+
+class AttachmentWorker(HttpWorker):
+    """Fetches pending attachments. Call `wake()` after promoting posts."""
+    counters = ('fetched', 'reused', 'retried', 'failed', 'evicted')
+
+    def __init__(self, db_path=None, cache=None, concurrency=None, timeout=None, max_attempts=None,
+                 max_source_bytes=None, poll_interval=60.0):
+        super().__init__('attachment-worker', int(concurrency or os.getenv('THUMB_CONCURRENCY', '4')),
+                         db_path=db_path, poll_interval=poll_interval)
+        self.cache = cache or ThumbnailCache()
+        self.timeout = float(timeout or os.getenv('THUMB_TIMEOUT', '15'))
+        self.max_attempts = int(max_attempts or os.getenv('THUMB_MAX_ATTEMPTS', '4'))
+        self.max_source_bytes = int(max_source_bytes or float(os.getenv('THUMB_MAX_SOURCE_MB', '10')) * 2 ** 20)
+
+    def _download(self, url):
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout) as r:
+                if r.status_code in PERMANENT_HTTP_ERRORS:
+                    raise PermanentError(f'HTTP {r.status_code}')
+                r.raise_for_status()
+                ctype = (r.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+                if not ctype.startswith('image/'):
+                    raise PermanentError(f'not an image ({ctype or "no content type"})')
+                declared = r.headers.get('Content-Length')
+                if declared and declared.isdigit() and int(declared) > self.max_source_bytes:
+                    raise PermanentError(f'image larger than {self.max_source_bytes} bytes')
+                chunks, size = [], 0
+                for chunk in r.iter_content(64 * 1024):
+                    size += len(chunk)
+                    if size > self.max_source_bytes:
+                        raise PermanentError(f'image larger than {self.max_source_bytes} bytes')
+                    chunks.append(chunk)
+                return b''.join(chunks), ctype
+        except requests.RequestException as e:
+            raise IOError(str(e)[:500])
+
+    def _fetch(self, entry):
+        """Download and store one attachment; runs on the pool. Returns (entry, stored, error)."""
+        try:
+            data, ctype = self._download(entry['url'])
+            return entry, self.cache.store(data, ctype), None
+        except PermanentError as e:
+            return entry, None, e
+        except Exception as e:
+            return entry, None, IOError(str(e)[:500])
+
+    def _record(self, db, entry, stored, error):
+        if error is None:
+            db.mark_attachment_done(entry['id'], entry['position'], *stored)
+            key = 'fetched'
+        elif isinstance(error, PermanentError) or entry['attempts'] >= self.max_attempts:
+            logging.info('Giving up on attachment %s/%s: %s', entry['id'], entry['position'], error)
+            db.mark_attachment_failed(entry['id'], entry['position'], str(error))
+            key = 'failed'
+        else:
+            db.mark_attachment_failed(entry['id'], entry['position'], str(error),
+                                      retry_at=time.time() + backoff(entry['attempts'], 30, 3600, factor=4))
+            key = 'retried'
+        self.count(key)
+
+    def run_once(self, db):
+        """Fetch every attachment that is due, then save which thumbnails were
+        served. Returns the number processed.
+        """
+        done = 0
+        while not self._stop_event.is_set():
+            entries = db.claim_attachments(limit=self.concurrency * 4)
+            if not entries:
+                break
+            to_fetch = []
+            for entry in entries:
+                # Same url as an image already cached: no download needed
+                cached = db.cached_thumb_for_url(entry['url'])
+                if cached and os.path.exists(self.cache.path(cached[0])):
+                    db.mark_attachment_done(entry['id'], entry['position'], *cached)
+                    self.count('reused')
+                else:
+                    to_fetch.append(entry)
+            for entry, stored, error in self.pool.map(self._fetch, to_fetch):
+                self._record(db, entry, stored, error)
+            self.count('evicted', self.cache.evict(db))
+            done += len(entries)
+        self.cache.flush(db)
+        return done
+
+    def next_due(self, db):
+        return db.next_attachment_due()
+
+    def stats(self):
+        return dict(super().stats(), resize=self.cache.resize, max_bytes=self.cache.max_bytes)
@@ -1,5 +1,10 @@
 import sqlite3
 import os
+import re
+import hashlib
+import json
+import socket
+import time
 from datetime import datetime, timedelta
 
 from dotenv import load_dotenv  
@@ -8,100 +13,99 @@ load_dotenv()
 import logging
 logging.basicConfig(level=logging.INFO)
 
+from backend.migrations import migrate, current_version
+
+
+def id_hash(post_id):
+    """Signed 64-bit hash of a post id, used for compact tombstones."""
+    if post_id is None:
+        return None
+    digest = hashlib.blake2b(str(post_id).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def item_id(item):
+    """Post id of a scraped item: group-scraper items use `id`, search-scraper items `post_id`."""
+    return item.get('id') or item.get('post_id')
+
+
+def attachment_images(item):
+    """[(image url, kind)] of every attachment of a scraped item, in order.
+    Group-scraper attachments link to the photo page in `url` and to the image
+    itself in `photo_image`/`image`/`thumbnail`; search-scraper items may carry
+    plain url strings or a top-level `image`.
+    """
+    raw = item.get('attachments') if isinstance(item.get('attachments'), list) else []
+    if not raw and item.get('image'):
+        raw = [item.get('image')]
+    out = []
+    for a in raw:
+        if isinstance(a, str):
+            out.append((a, None))
+        elif isinstance(a, dict):
+            url = ((a.get('photo_image') or {}).get('uri') or (a.get('image') or {}).get('uri')
+                   or a.get('thumbnail') or a.get('uri') or a.get('url'))
+            if url:
+                out.append((url, a.get('__typename') or a.get('type')))
+    return out
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%dT%H:%M:%S.000')
+
+
+_owner = (None, None)
+
+
+def process_owner():
+    """Id of this process in `pipeline_runs.owner`, job leases and `workers`:
+    host, pid and a random suffix, so a restarted container reusing pid 1 is a
+    different owner.
+    """
+    global _owner
+    if _owner[0] != os.getpid():
+        _owner = (os.getpid(), f"{socket.gethostname()}-{os.getpid()}-{os.urandom(3).hex()}")
+    return _owner[1]
+
+
+# A worker process whose last heartbeat is older than this is considered dead
+WORKER_STALE_SECONDS = float(os.getenv('WORKER_STALE_SECONDS', '60'))
+
+
+# Analysis queue priorities: lower is served first
+PRIORITY_FRESH = 0     # just scraped by a scheduled/manual run
+PRIORITY_RESUME = 1    # left unanalyzed by an interrupted run
+PRIORITY_BACKLOG = 2   # old unclassified posts, drained in idle time
+QUEUE_SOURCES = {PRIORITY_FRESH: 'scrape', PRIORITY_RESUME: 'resume', PRIORITY_BACKLOG: 'backlog'}
+
+# Columns copied when a post is promoted to good_facebook_posts
+GOOD_COLUMNS = ("url, time, user, text, topReactionsCount, feedbackId, id, legacyId, attachments, "
+                "likesCount, sharesCount, commentsCount, facebookId, groupTitle, inputUrl, status")
+
 
 class DB():
     def __init__(self, path=None):
         # Use a file-based sqlite DB in current working dir by default
         # Choose path from explicit arg or DB_PATH env, defaulting to 'facebook_posts.db'
         db_path = path or os.getenv('DB_PATH', 'facebook_posts.db')
-        # Allow usage across threads in FastAPI context
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        # Allow usage across threads in FastAPI context; wait on locks held by
+        # other connections (analysis workers) instead of failing
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        # WAL lets readers proceed while a worker writes (persistent, no-op when already set)
+        self.conn.execute("PRAGMA journal_mode=WAL")
         self.conn.row_factory = sqlite3.Row
+        self.conn.create_function('id_hash', 1, id_hash, deterministic=True)
         self.c = self.conn.cursor()
 
-        # Create table if not exists (facebook_posts)
-        self.c.execute("""
-        CREATE TABLE IF NOT EXISTS facebook_posts (
-            url TEXT,
-            time TEXT,
-            user TEXT,
-            text TEXT,
-            topReactionsCount INTEGER,
-            feedbackId TEXT,
-            id TEXT PRIMARY KEY,
-            legacyId TEXT,
-            attachments TEXT,
-            likesCount INTEGER,
-            sharesCount INTEGER,
-            commentsCount INTEGER,
-            facebookId TEXT,
-            groupTitle TEXT,
-            inputUrl TEXT,
-            status TEXT,
-            motivo TEXT
-        )
-        """)
-        self.conn.commit()
-
-        # Create scheduler_config singleton table to persist scheduler state
-        self.c.execute(
-            """
-            CREATE TABLE IF NOT EXISTS scheduler_config (
-                id INTEGER PRIMARY KEY CHECK (id = 1),
-                active INTEGER DEFAULT 0,
-                minutes INTEGER,
-                webhook TEXT,
-                last_run_time TEXT
-            )
-            """
-        )
-        # Ensure a singleton row exists
-        self.c.execute("INSERT OR IGNORE INTO scheduler_config (id, active) VALUES (1, 0)")
-        self.conn.commit()
-
-        # Ensure optional columns for time-of-day scheduling exist
-        try:
-            cols = {r[1] for r in self.c.execute("PRAGMA table_info(scheduler_config)").fetchall()}
-            if 'minutes_day' not in cols:
-                self.c.execute("ALTER TABLE scheduler_config ADD COLUMN minutes_day INTEGER")
-            if 'minutes_night' not in cols:
-                self.c.execute("ALTER TABLE scheduler_config ADD COLUMN minutes_night INTEGER")
-            if 'day_start_hour' not in cols:
-                self.c.execute("ALTER TABLE scheduler_config ADD COLUMN day_start_hour INTEGER DEFAULT 8")
-            if 'night_start_hour' not in cols:
-                self.c.execute("ALTER TABLE scheduler_config ADD COLUMN night_start_hour INTEGER DEFAULT 20")
-            if 'last_scrape_time_from' not in cols:
-                self.c.execute("ALTER TABLE scheduler_config ADD COLUMN last_scrape_time_from TEXT")
-            self.conn.commit()
-        except Exception:
-            pass
+        # Apply pending schema migrations (a single version check when current)
+        migrate(self.conn)
 
-        # Create table for accepted posts
-        self.c.execute("""
-        CREATE TABLE IF NOT EXISTS good_facebook_posts (
-            url TEXT,
-            time TEXT,
-            user TEXT,
-            text TEXT,
-            topReactionsCount INTEGER,
-            feedbackId TEXT,
-            id TEXT PRIMARY KEY,
-            legacyId TEXT,
-            attachments TEXT,
-            likesCount INTEGER,
-            sharesCount INTEGER,
-            commentsCount INTEGER,
-            facebookId TEXT,
-            groupTitle TEXT,
-            inputUrl TEXT,
-            status TEXT
-        )
-        """)
-        self.conn.commit()
+    def schema_version(self):
+        return current_version(self.conn)
 
     def add_items_to_db(self, items, table="facebook_posts"):
         """Insert a list of item dicts into the named table. The table is
-        expected to have the same columns as created above. Missing subkeys
+        expected to have the columns created in backend/migrations.py. Missing subkeys
         are tolerated and will become NULL in the DB.
         """
         count = 0
@@ -110,6 +114,8 @@ class DB():
             try:
                 if item.get('id') == None and item.get('post_id') == None:
                     raise Exception("Item id is None")
+                if self.is_archived(item.get('id') or item.get('post_id')):
+                    continue
                 user = item.get('user') if isinstance(item.get('user'), dict) else None
                 user_id = user.get('id') if user else None
                 attachments = None
@@ -142,37 +148,661 @@ class DB():
                     facebookId, groupTitle, inputUrl, status
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, params)
+                images = attachment_images(item)
+                if images:
+                    self.c.executemany(
+                        "INSERT OR IGNORE INTO post_attachments (id, position, url, kind) VALUES (?, ?, ?, ?)",
+                        [(item_id(item), n, url, kind) for n, (url, kind) in enumerate(images)])
             except Exception as e:
                 count += 1
                 logging.exception("Failed to insert item into %s: %s", table, e)
         self.conn.commit()
         return count
 
+    def is_archived(self, id):
+        """True if the post was moved to the archive by the retention job."""
+        row = self.c.execute("SELECT 1 FROM archived_ids WHERE h = ?", (id_hash(id),)).fetchone()
+        return row is not None
+
     def update_item_field(self, id, field, value):
         self.c.execute("UPDATE facebook_posts SET {} = ? WHERE id = ?".format(field), (value, id))
         self.conn.commit()
         return
 
-    def fetch_items(self, table="facebook_posts", limit=50, offset=0, search=None):
-        """Fetch items from a given table with optional text search, pagination.
+    # ----------------------
+    # Pipeline checkpoints
+    # ----------------------
+    def start_run(self, kind, start_time=None):
+        """Open a pipeline_runs journal entry owned by this process and return its id."""
+        self.c.execute("INSERT INTO pipeline_runs (kind, status, started_at, start_time, owner) "
+                       "VALUES (?, 'running', ?, ?, ?)", (kind, _now(), start_time, process_owner()))
+        self.conn.commit()
+        return self.c.lastrowid
+
+    def finish_run(self, run_id, status='finished', scraped=0, analyzed=0, accepted=0, error=None):
+        self.c.execute(
+            "UPDATE pipeline_runs SET status = ?, finished_at = ?, scraped = ?, analyzed = ?, accepted = ?, error = ? WHERE id = ?",
+            (status, _now(), scraped, analyzed, accepted, error, run_id))
+        self.conn.commit()
+
+    def mark_interrupted_runs(self):
+        """Close journal entries left 'running' by a crash. Runs of this process
+        and of worker processes with a recent heartbeat are still going and are
+        left alone. Returns the ids closed.
+        """
+        ids = [r[0] for r in self.c.execute(
+            "SELECT id FROM pipeline_runs WHERE status = 'running' AND (owner IS NULL OR "
+            "(owner != ? AND owner NOT IN (SELECT owner FROM workers WHERE heartbeat_at > ?)))",
+            (process_owner(), time.time() - WORKER_STALE_SECONDS)).fetchall()]
+        if ids:
+            self.c.executemany("UPDATE pipeline_runs SET status = 'interrupted', finished_at = ? WHERE id = ?",
+                               [(_now(), i) for i in ids])
+            self.conn.commit()
+        return ids
+
+    def save_profile(self, run_id, kind, label, wall_s, cpu_s, peak_kb, summary, artifacts, keep=20):
+        """Store a profile ({artifact name: bytes}) and link it to `run_id`, keeping
+        only the newest `keep` profiles. Returns its id.
+        """
+        self.c.execute(
+            "INSERT INTO run_profiles (run_id, kind, label, created_at, wall_s, cpu_s, peak_kb, summary) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (run_id, kind, label, _now(), wall_s, cpu_s, peak_kb, summary))
+        profile_id = self.c.lastrowid
+        self.c.executemany("INSERT INTO profile_artifacts (profile_id, name, data) VALUES (?, ?, ?)",
+                           [(profile_id, name, data) for name, data in artifacts.items()])
+        if run_id is not None:
+            self.c.execute("UPDATE pipeline_runs SET profile_id = ? WHERE id = ?", (profile_id, run_id))
+        old = "SELECT id FROM run_profiles ORDER BY id DESC LIMIT -1 OFFSET ?"
+        self.c.execute(f"DELETE FROM profile_artifacts WHERE profile_id IN ({old})", (int(keep),))
+        self.c.execute(f"UPDATE pipeline_runs SET profile_id = NULL WHERE profile_id IN ({old})", (int(keep),))
+        self.c.execute(f"DELETE FROM run_profiles WHERE id IN ({old})", (int(keep),))
+        self.conn.commit()
+        return profile_id
+
+    def _profile_row(self, row):
+        r = dict(row)
+        r['summary'] = json.loads(r['summary']) if r['summary'] else None
+        r['artifacts'] = [a[0] for a in self.c.execute(
+            "SELECT name FROM profile_artifacts WHERE profile_id = ? ORDER BY name", (r['id'],)).fetchall()]
+        return r
+
+    def fetch_profiles(self, limit=20):
+        """Saved profiles, newest first, with their artifact names."""
+        rows = self.c.execute("SELECT * FROM run_profiles ORDER BY id DESC LIMIT ?",
+                              (max(1, min(int(limit), 200)),)).fetchall()
+        return [self._profile_row(r) for r in rows]
+
+    def fetch_profile(self, profile_id):
+        row = self.c.execute("SELECT * FROM run_profiles WHERE id = ?", (profile_id,)).fetchone()
+        return self._profile_row(row) if row else None
+
+    def fetch_profile_artifact(self, profile_id, name):
+        row = self.c.execute("SELECT data FROM profile_artifacts WHERE profile_id = ? AND name = ?",
+                             (profile_id, name)).fetchone()
+        return row[0] if row else None
+
+    def fetch_runs(self, limit=20):
+        rows = self.c.execute("SELECT * FROM pipeline_runs ORDER BY id DESC LIMIT ?", (max(1, min(int(limit), 200)),)).fetchall()
+        return [dict(r) for r in rows]
+
+    def run_status(self, run_id):
+        """Status of pipeline run `run_id`, None if there is no such run."""
+        row = self.c.execute("SELECT status FROM pipeline_runs WHERE id = ?", (run_id,)).fetchone()
+        return row[0] if row else None
+
+    def assign_run(self, ids, run_id):
+        """Tag freshly scraped posts with the run that inserted them."""
+        self.c.executemany("UPDATE facebook_posts SET run_id = ? WHERE id = ? AND run_id IS NULL",
+                           [(run_id, i) for i in ids])
+        self.conn.commit()
+
+    def get_stages(self, ids):
+        """Return {id: stage} for the given post ids (missing ids are omitted)."""
+        stages = {}
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            q = f"SELECT id, stage FROM facebook_posts WHERE id IN ({','.join('?' * len(chunk))})"
+            stages.update({r[0]: r[1] for r in self.c.execute(q, chunk).fetchall()})
+        return stages
+
+    def record_analysis(self, id, status, motivo, fields):
+        """Checkpoint an analyzed post: status, motivo, listing fields and
+        stage='analyzed' are committed together.
+        """
+        self.c.execute("UPDATE facebook_posts SET status = ?, motivo = ?, stage = 'analyzed' WHERE id = ?",
+                       (status, motivo, id))
+        self.upsert_listing_fields(id, fields, commit=False)
+        if fields.get('profiles'):
+            self.record_profile_results(id, fields['profiles'], commit=False)
+        self.conn.commit()
+
+    def record_profile_results(self, id, results, commit=True):
+        """Store per-profile verdicts {profile: {status, motivation}} of post `id`."""
+        now = _now()
+        self.c.executemany(
+            "INSERT INTO profile_results (id, profile, status, motivation, analyzed_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(id, profile) DO UPDATE SET status = excluded.status, motivation = excluded.motivation, "
+            "analyzed_at = excluded.analyzed_at",
+            [(id, name, r.get('status'), r.get('motivation'), now) for name, r in results.items()])
+        if commit:
+            self.conn.commit()
+
+    def accepted_profiles(self, ids):
+        """{post id: [names of the profiles that accepted it]} for the given ids."""
+        ids = list(ids)
+        found = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            q = (f"SELECT id, profile FROM profile_results WHERE status = 'ACCETTATO' "
+                 f"AND id IN ({','.join('?' * len(chunk))}) ORDER BY profile")
+            for r in self.c.execute(q, chunk).fetchall():
+                found.setdefault(r[0], []).append(r[1])
+        return found
+
+    def profile_stats(self):
+        """Classified and accepted post counts per profile."""
+        rows = self.c.execute(
+            "SELECT profile, count(*) AS classified, sum(status = 'ACCETTATO') AS accepted "
+            "FROM profile_results GROUP BY profile").fetchall()
+        return {r['profile']: {'classified': r['classified'], 'accepted': r['accepted'] or 0} for r in rows}
+
+    def promote(self, id):
+        """Copy an accepted post into good_facebook_posts and checkpoint stage='promoted'."""
+        self.c.execute(f"INSERT OR IGNORE INTO good_facebook_posts ({GOOD_COLUMNS}) "
+                       f"SELECT {GOOD_COLUMNS} FROM facebook_posts WHERE id = ?", (id,))
+        self.c.execute("UPDATE facebook_posts SET stage = 'promoted' WHERE id = ?", (id,))
+        # Accepted posts get their images fetched (backend/attachments.py)
+        self.c.execute("UPDATE post_attachments SET status = 'pending' WHERE id = ? AND status = 'new'", (id,))
+        self.conn.commit()
+
+    def fail_analysis(self, id, error):
+        """Park a post whose reply could not be decoded at stage 'failed', out of the
+        analysis queue and the backlog, until requeue_failed_analysis().
+        """
+        self.c.execute("UPDATE facebook_posts SET stage = 'failed', analysis_error = ? WHERE id = ? AND stage = 'scraped'",
+                       (str(error)[:500], id))
+        self.c.execute("DELETE FROM analysis_queue WHERE id = ?", (id,))
+        self.conn.commit()
+
+    def requeue_failed_analysis(self):
+        """Make every failed post analyzable again, e.g. after a model or prompt
+        change. Returns how many posts were reset.
+        """
+        self.c.execute("UPDATE facebook_posts SET stage = 'scraped', analysis_error = NULL WHERE stage = 'failed'")
+        self.conn.commit()
+        return self.c.rowcount
+
+    def failed_analysis_count(self):
+        return self.c.execute("SELECT count(*) FROM facebook_posts WHERE stage = 'failed'").fetchone()[0]
+
+    def mark_notified(self, id):
+        self.c.execute("UPDATE facebook_posts SET stage = 'notified' WHERE id = ?", (id,))
+        self.conn.commit()
+
+    def fetch_unfinished(self, limit=500):
+        """Posts whose pipeline did not complete: not yet analyzed, accepted but
+        not promoted, or promoted but not notified.
+        """
+        rows = self.c.execute(
+            "SELECT id, url, time, text, attachments, likesCount, commentsCount, inputUrl, status, motivo, stage "
+            "FROM facebook_posts WHERE stage IN ('scraped', 'promoted') OR (stage = 'analyzed' AND status = 'ACCETTATO') "
+            "ORDER BY time DESC LIMIT ?", (int(limit),)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    # ----------------------
+    # Analysis work queue
+    # ----------------------
+    def enqueue_analysis(self, items, priority):
+        """Queue posts (dicts with id/post_id and time) for analysis. A post
+        already queued keeps its best (lowest) priority.
+        """
+        now = _now()
+        self.c.executemany(
+            """
+            INSERT INTO analysis_queue (id, priority, source, post_time, enqueued_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                priority=min(priority, excluded.priority),
+                source=CASE WHEN excluded.priority < priority THEN excluded.source ELSE source END
+            """,
+            [(item_id(i), priority, QUEUE_SOURCES.get(priority, 'other'), i.get('time'), now)
+             for i in items if item_id(i)],
+        )
+        self.conn.commit()
+
+    def enqueue_backlog(self, limit=None):
+        """Queue every unanalyzed post not already queued. Returns how many were added."""
+        q = ("INSERT OR IGNORE INTO analysis_queue (id, priority, source, post_time, enqueued_at) "
+             "SELECT id, ?, ?, time, ? FROM facebook_posts WHERE stage = 'scraped' ORDER BY time DESC")
+        params = [PRIORITY_BACKLOG, QUEUE_SOURCES[PRIORITY_BACKLOG], _now()]
+        if limit:
+            q += " LIMIT ?"
+            params.append(int(limit))
+        self.c.execute(q, params)
+        self.conn.commit()
+        return self.c.rowcount
+
+    def claim_analysis(self, owner, lease_seconds=300, ids=None):
+        """Atomically lease the best ranked queued post (optionally restricted
+        to `ids`). Returns (id, source) or None when nothing is claimable.
+        """
+        now = time.time()
+        where = "(leased_until IS NULL OR leased_until < ?)"
+        params = [now + lease_seconds, owner, now]
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return None
+            where += f" AND id IN ({','.join('?' * len(ids))})"
+            params.extend(ids)
+        row = self.c.execute(
+            f"""
+            UPDATE analysis_queue SET leased_until = ?, lease_owner = ?, attempts = attempts + 1
+            WHERE id = (SELECT id FROM analysis_queue WHERE {where} ORDER BY priority, post_time DESC LIMIT 1)
+            RETURNING id, source
+            """,
+            params,
+        ).fetchone()
+        self.conn.commit()
+        return (row[0], row[1]) if row else None
+
+    def complete_analysis(self, id):
+        self.c.execute("DELETE FROM analysis_queue WHERE id = ?", (id,))
+        self.conn.commit()
+
+    def release_analysis(self, id, retry_in=60, max_attempts=3):
+        """Give a failed post back to the queue after `retry_in` seconds, or
+        drop it after `max_attempts` (it stays unanalyzed for analyze_pending).
+        """
+        row = self.c.execute("SELECT attempts FROM analysis_queue WHERE id = ?", (id,)).fetchone()
+        if row and row[0] >= max_attempts:
+            self.c.execute("DELETE FROM analysis_queue WHERE id = ?", (id,))
+        else:
+            self.c.execute("UPDATE analysis_queue SET leased_until = ?, lease_owner = NULL WHERE id = ?",
+                           (time.time() + retry_in, id))
+        self.conn.commit()
+
+    def queued_ids(self, ids, in_progress_only=False):
+        """Subset of `ids` still waiting in (or leased from) the analysis queue.
+        With in_progress_only, only posts currently being analyzed by someone.
+        """
+        ids = list(ids)
+        found = set()
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            q = f"SELECT id FROM analysis_queue WHERE id IN ({','.join('?' * len(chunk))})"
+            if in_progress_only:
+                q += f" AND lease_owner IS NOT NULL AND leased_until > {time.time()}"
+            found.update(r[0] for r in self.c.execute(q, chunk).fetchall())
+        return found
+
+    def queue_stats(self):
+        rows = self.c.execute(
+            "SELECT source, count(*) AS queued, sum(leased_until > ?) AS leased FROM analysis_queue GROUP BY source",
+            (time.time(),)).fetchall()
+        return {r['source']: {'queued': r['queued'], 'leased': r['leased'] or 0} for r in rows}
+
+    # ----------------------
+    # Webhook subscribers and outbox (drained by backend/webhooks.py)
+    # ----------------------
+    def add_webhook_subscriber(self, url, secret=None):
+        """Add (or re-activate and update the secret of) a subscriber. Returns its id."""
+        row = self.c.execute(
+            "INSERT INTO webhook_subscribers (url, secret, active, created_at) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT(url) DO UPDATE SET secret = excluded.secret, active = 1 RETURNING id",
+            (url, secret, _now())).fetchone()
+        self.conn.commit()
+        return row[0]
+
+    def remove_webhook_subscriber(self, id):
+        self.c.execute("DELETE FROM webhook_subscribers WHERE id = ?", (id,))
+        self.conn.commit()
+        return self.c.rowcount > 0
+
+    def fetch_webhook_subscribers(self, active_only=True):
+        q = "SELECT id, url, secret, active, created_at FROM webhook_subscribers"
+        if active_only:
+            q += " WHERE active = 1"
+        return [dict(r) for r in self.c.execute(q + " ORDER BY id").fetchall()]
+
+    def enqueue_webhooks(self, payload, targets):
+        """Queue one delivery of `payload` (a JSON string) per (url, secret) target."""
+        now = time.time()
+        self.c.executemany(
+            "INSERT INTO webhook_outbox (url, secret, payload, created_at, next_attempt_at) VALUES (?, ?, ?, ?, ?)",
+            [(url, secret, payload, _now(), now) for url, secret in targets])
+        self.conn.commit()
+
+    def claim_webhooks(self, limit=16, lease_seconds=120):
+        """Lease up to `limit` deliveries that are due. Returns a list of dicts."""
+        now = time.time()
+        rows = self.c.execute(
+            """
+            UPDATE webhook_outbox SET leased_until = ?, attempts = attempts + 1
+            WHERE id IN (SELECT id FROM webhook_outbox
+                         WHERE status = 'pending' AND next_attempt_at <= ? AND (leased_until IS NULL OR leased_until < ?)
+                         ORDER BY next_attempt_at LIMIT ?)
+            RETURNING id, url, secret, payload, attempts
+            """,
+            (now + lease_seconds, now, now, int(limit))).fetchall()
+        self.conn.commit()
+        return [dict(r) for r in rows]
+
+    def next_webhook_due(self):
+        """Epoch seconds of the earliest pending delivery, or None."""
+        row = self.c.execute("SELECT min(next_attempt_at) FROM webhook_outbox WHERE status = 'pending'").fetchone()
+        return row[0]
+
+    def mark_webhook_delivered(self, id, latency_ms):
+        self.c.execute("UPDATE webhook_outbox SET status = 'delivered', delivered_at = ?, latency_ms = ?, "
+                       "leased_until = NULL, last_error = NULL WHERE id = ?", (_now(), latency_ms, id))
+        self.conn.commit()
+
+    def mark_webhook_failed(self, id, error, retry_at=None):
+        """Record a failed attempt: retry at `retry_at` (epoch seconds) or give up when None."""
+        if retry_at is None:
+            self.c.execute("UPDATE webhook_outbox SET status = 'failed', last_error = ?, leased_until = NULL WHERE id = ?",
+                           (error, id))
+        else:
+            self.c.execute("UPDATE webhook_outbox SET next_attempt_at = ?, last_error = ?, leased_until = NULL WHERE id = ?",
+                           (retry_at, error, id))
+        self.conn.commit()
+
+    def purge_webhooks(self, days=7):
+        """Delete delivered entries older than `days` days."""
+        cutoff = (datetime.now() - timedelta(days=int(days))).strftime('%Y-%m-%dT%H:%M:%S.000')
+        self.c.execute("DELETE FROM webhook_outbox WHERE status = 'delivered' AND delivered_at < ?", (cutoff,))
+        self.conn.commit()
+        return self.c.rowcount
+
+    def webhook_outbox_stats(self):
+        rows = self.c.execute("SELECT status, count(*) AS n FROM webhook_outbox GROUP BY status").fetchall()
+        return {r['status']: r['n'] for r in rows}
+
+    # ----------------------
+    # Job queue and worker processes (worker mode, backend/workers.py)
+    # ----------------------
+    def enqueue_job(self, kind, payload=None, key=None, delay=0):
+        """Queue a job. With `key`, nothing is added while a job of the same kind
+        and key is queued or running. Returns the job id, or None when deduplicated.
+        """
+        self.c.execute(
+            "INSERT OR IGNORE INTO jobs (kind, key, payload, not_before, created_at) VALUES (?, ?, ?, ?, ?)",
+            (kind, None if key is None else str(key), json.dumps(payload or {}), time.time() + delay, _now()))
+        self.conn.commit()
+        return self.c.lastrowid if self.c.rowcount else None
+
+    def claim_jobs(self, kinds, owner, limit=1, lease_seconds=120, max_attempts=3):
+        """Lease up to `limit` due jobs of `kinds`, oldest first. Jobs whose lease
+        expired (their worker died) are queued again first, or failed once they
+        used `max_attempts`. Returns dicts with id, kind, payload and attempts.
+        """
+        now = time.time()
+        kinds = list(kinds)
+        marks = ','.join('?' * len(kinds))
+        self.c.execute(
+            f"""
+            UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                finished_at = CASE WHEN attempts >= ? THEN ? END,
+                error = 'lease of ' || lease_owner || ' expired', lease_owner = NULL, leased_until = NULL
+            WHERE status = 'running' AND leased_until < ? AND kind IN ({marks})
+            """,
+            [max_attempts, max_attempts, _now(), now] + kinds)
+        rows = self.c.execute(
+            f"""
+            UPDATE jobs SET status = 'running', lease_owner = ?, leased_until = ?, attempts = attempts + 1, started_at = ?
+            WHERE id IN (SELECT id FROM jobs WHERE status = 'queued' AND kind IN ({marks}) AND not_before <= ?
+                         ORDER BY id LIMIT ?)
+            RETURNING id, kind, payload, attempts
+            """,
+            [owner, now + lease_seconds, _now()] + kinds + [now, int(limit)]).fetchall()
+        self.conn.commit()
+        return [dict(r, payload=json.loads(r['payload'] or '{}')) for r in sorted(rows, key=lambda r: r['id'])]
+
+    def finish_job(self, id, owner, result=None):
+        self.c.execute("UPDATE jobs SET status = 'done', finished_at = ?, result = ?, error = NULL, "
+                       "lease_owner = NULL, leased_until = NULL WHERE id = ? AND lease_owner = ?",
+                       (_now(), json.dumps(result) if result is not None else None, id, owner))
+        self.conn.commit()
+
+    def fail_job(self, id, owner, error, retry_at=None):
+        """Record a failed attempt: queue the job again at `retry_at` (epoch seconds) or give up when None."""
+        if retry_at is None:
+            self.c.execute("UPDATE jobs SET status = 'failed', finished_at = ?, error = ?, lease_owner = NULL, "
+                           "leased_until = NULL WHERE id = ? AND lease_owner = ?", (_now(), str(error)[:500], id, owner))
+        else:
+            self.c.execute("UPDATE jobs SET status = 'queued', not_before = ?, error = ?, lease_owner = NULL, "
+                           "leased_until = NULL WHERE id = ? AND lease_owner = ?", (retry_at, str(error)[:500], id, owner))
+        self.conn.commit()
+
+    def next_job_due(self, kinds):
+        """Epoch seconds when the next queued job of `kinds` is due, or None."""
+        kinds = list(kinds)
+        row = self.c.execute(f"SELECT min(not_before) FROM jobs WHERE status = 'queued' AND kind IN "
+                             f"({','.join('?' * len(kinds))})", kinds).fetchone()
+        return row[0]
+
+    def purge_jobs(self, days=7):
+        """Delete finished and failed jobs older than `days` days."""
+        cutoff = (datetime.now() - timedelta(days=int(days))).strftime('%Y-%m-%dT%H:%M:%S.000')
+        self.c.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+        self.conn.commit()
+        return self.c.rowcount
+
+    def fetch_jobs(self, limit=50, status=None):
+        q = "SELECT id, kind, key, payload, status, attempts, lease_owner, created_at, started_at, finished_at, " \
+            "result, error FROM jobs"
+        params = []
+        if status:
+            q += " WHERE status = ?"
+            params.append(status)
+        rows = self.c.execute(q + " ORDER BY id DESC LIMIT ?", params + [max(1, min(int(limit), 500))]).fetchall()
+        return [dict(r, payload=json.loads(r['payload'] or '{}'),
+                     result=json.loads(r['result']) if r['result'] else None) for r in rows]
+
+    def job_stats(self):
+        """{kind: {status: count}} over the jobs table."""
+        out = {}
+        for r in self.c.execute("SELECT kind, status, count(*) AS n FROM jobs GROUP BY kind, status").fetchall():
+            out.setdefault(r['kind'], {})[r['status']] = r['n']
+        return out
+
+    def heartbeat(self, owner, role, lease_seconds=120):
+        """Register this worker process as alive and extend the leases of the jobs it holds."""
+        now = time.time()
+        self.c.execute(
+            "INSERT INTO workers (owner, role, pid, host, started_at, heartbeat_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(owner) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+            (owner, role, os.getpid(), socket.gethostname(), _now(), now))
+        self.c.execute("UPDATE jobs SET leased_until = ? WHERE status = 'running' AND lease_owner = ?",
+                       (now + lease_seconds, owner))
+        self.conn.commit()
+
+    def remove_worker(self, owner):
+        self.c.execute("DELETE FROM workers WHERE owner = ?", (owner,))
+        self.conn.commit()
+
+    def fetch_workers(self):
+        """Registered worker processes with their heartbeat age; dead ones are flagged, and
+        dropped once they have been silent for a day.
+        """
+        now = time.time()
+        self.c.execute("DELETE FROM workers WHERE heartbeat_at < ?", (now - 86400,))
+        self.conn.commit()
+        rows = self.c.execute("SELECT * FROM workers ORDER BY role, started_at").fetchall()
+        return [dict(r, heartbeat_age_s=round(now - r['heartbeat_at'], 1),
+                     alive=now - r['heartbeat_at'] <= WORKER_STALE_SECONDS) for r in rows]
+
+    # ----------------------
+    # Statistics rollups (kept current by triggers, see migrations.m008)
+    # ----------------------
+    def record_llm_call(self, elapsed, ok=True, commit=True, decode=None):
+        """Add one analyzer call of `elapsed` seconds to the hourly LLM rollup,
+        with its `decode` report (backend/decoding.py) when there is one.
+        """
+        ms = elapsed * 1000
+        decode = decode or {}
+        self.c.execute(
+            "INSERT INTO stats_llm (hour, calls, errors, total_ms, max_ms, repaired, retries, decode_failures, wasted_ms) "
+            "VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(hour) DO UPDATE SET calls = calls + 1, errors = errors + excluded.errors, "
+            "total_ms = total_ms + excluded.total_ms, max_ms = max(max_ms, excluded.max_ms), "
+            "repaired = repaired + excluded.repaired, retries = retries + excluded.retries, "
+            "decode_failures = decode_failures + excluded.decode_failures, wasted_ms = wasted_ms + excluded.wasted_ms",
+            (_now()[:13], 0 if ok else 1, ms, ms, int(bool(decode.get('repaired'))), decode.get('retries', 0),
+             0 if ok or not decode else 1, decode.get('wasted_s', 0.0) * 1000))
+        if commit:
+            self.conn.commit()
+
+    def fetch_stats(self, hours=48):
+        """Counts per status, acceptance per group (inputUrl), posts per hour and
+        LLM latency per hour for the last `hours` hours that have data. Reads only
+        the rollup tables, so the cost does not depend on the number of posts.
+        """
+        hours = max(1, min(int(hours or 48), 24 * 90))
+        status_counts = {r['status']: r['n'] for r in self.c.execute(
+            "SELECT status, n FROM stats_status WHERE n > 0 ORDER BY n DESC").fetchall()}
+        groups = [dict(r, acceptance_rate=round(r['accepted'] / r['classified'], 3) if r['classified'] else None)
+                  for r in self.c.execute(
+                      "SELECT input_url, posts, classified, accepted FROM stats_group ORDER BY posts DESC").fetchall()]
+        posts_per_hour = [dict(r) for r in self.c.execute(
+            "SELECT * FROM (SELECT hour, posts, classified, accepted FROM stats_hourly ORDER BY hour DESC LIMIT ?) "
+            "ORDER BY hour", (hours,)).fetchall()]
+        llm_latency = [dict(r) for r in self.c.execute(
+            "SELECT * FROM (SELECT hour, calls, errors, round(total_ms / calls, 1) AS avg_ms, round(max_ms, 1) AS max_ms, "
+            "repaired, retries, decode_failures, round(wasted_ms, 1) AS wasted_ms "
+            "FROM stats_llm ORDER BY hour DESC LIMIT ?) ORDER BY hour", (hours,)).fetchall()]
+        return {
+            'status_counts': status_counts,
+            'groups': groups,
+            'posts_per_hour': posts_per_hour,
+            'llm_latency': llm_latency,
+        }
+
+    def fetch_posts_by_ids(self, ids):
+        """facebook_posts rows (as dicts, including stage and run_id) for the given ids."""
+        ids = list(ids)
+        rows = []
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            q = ("SELECT id, url, time, text, attachments, likesCount, commentsCount, inputUrl, status, motivo, stage, "
+                 f"run_id FROM facebook_posts WHERE id IN ({','.join('?' * len(chunk))})")
+            rows.extend(dict(r) for r in self.c.execute(q, chunk).fetchall())
+        return rows
+
+    def upsert_listing_fields(self, id, fields, commit=True):
+        """Store the structured fields (price, zone, room_type, available_from)
+        extracted for post `id`. Values are coerced to their column types and
+        unparseable ones become NULL.
+        """
+        price = fields.get('price')
+        if isinstance(price, str):
+            m = re.search(r'\d+', price.replace('.', ''))
+            price = int(m.group()) if m else None
+        elif isinstance(price, (int, float)):
+            price = int(price)
+        else:
+            price = None
+        zone = (fields.get('zone') or '').strip() or None
+        room_type = (fields.get('room_type') or '').strip().lower() or None
+        available_from = fields.get('available_from')
+        try:
+            available_from = datetime.strptime(str(available_from)[:10], '%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            available_from = None
+        self.c.execute(
+            """
+            INSERT INTO listing_fields (id, price, zone, room_type, available_from)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                price=excluded.price,
+                zone=excluded.zone,
+                room_type=excluded.room_type,
+                available_from=excluded.available_from
+            """,
+            (id, price, zone, room_type, available_from),
+        )
+        if commit:
+            self.conn.commit()
+
+    def fetch_items(self, table="facebook_posts", limit=50, offset=0, search=None,
+                    min_price=None, max_price=None, zone=None, room_type=None, available_by=None,
+                    profile=None, ids=None, since=None):
+        """Fetch items from a given table with optional text search, pagination
+        and filters on the extracted listing fields (price range, zone,
+        room type, available on or before a YYYY-MM-DD date). With `profile`,
+        only posts accepted by that search profile. With `ids` (a ranked list,
+        e.g. semantic search hits) only those posts, in that order.
+        With `since` (a `seq` cursor), only rows inserted or changed after it,
+        in change order and up to 1000 at a time, instead of newest first.
+        Rows carry `thumb`, the cached thumbnail of the first image, if any.
         Returns a list of dict rows.
         """
         # Basic guardrails
         if table not in ("facebook_posts", "good_facebook_posts"):
             raise ValueError("Invalid table")
-        limit = max(1, min(int(limit or 50), 200))
+        limit = max(1, min(int(limit or 50), 1000 if since is not None else 200))
         offset = max(0, int(offset or 0))
-        
-        if table == "good_facebook_posts":
-            base = f"SELECT id, url, time, text, attachments, likesCount, commentsCount, inputUrl FROM {table}"
-        else:
-            base = f"SELECT id, url, time, text, attachments, likesCount, commentsCount, inputUrl, status, motivo FROM {table}"
+
+        cols = "p.id, p.seq, p.url, p.time, p.text, p.attachments, p.likesCount, p.commentsCount, p.inputUrl"
+        if table == "facebook_posts":
+            cols += ", p.status, p.motivo"
+        cols += ", f.price, f.zone, f.room_type, f.available_from"
+        cols += (", (SELECT a.thumb FROM post_attachments a WHERE a.id = p.id AND a.status = 'done' "
+                 "ORDER BY a.position LIMIT 1) AS thumb")
+
+        where = []
         params = []
         if search:
-            base += " WHERE text LIKE ?"
+            where.append("p.text LIKE ?")
             params.append(f"%{search}%")
-        base += " ORDER BY time DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+        if min_price is not None:
+            where.append("f.price >= ?")
+            params.append(int(min_price))
+        if max_price is not None:
+            where.append("f.price <= ?")
+            params.append(int(max_price))
+        if zone:
+            where.append("f.zone = ?")
+            params.append(zone.strip())
+        if room_type:
+            where.append("f.room_type = ?")
+            params.append(room_type.strip().lower())
+        if available_by:
+            where.append("f.available_from <= ?")
+            params.append(available_by)
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return []
+            where.append(f"p.id IN ({','.join('?' * len(ids))})")
+            params.extend(ids)
+        if since is not None:
+            where.append("p.seq > ?")
+            params.append(int(since))
+
+        # Inner join when filtering on fields so the listing_fields indexes drive the query
+        has_field_filter = any(v not in (None, '') for v in (min_price, max_price, zone, room_type, available_by))
+        join = "JOIN" if has_field_filter else "LEFT JOIN"
+        base = f"SELECT {cols} FROM {table} p {join} listing_fields f ON f.id = p.id"
+        if profile:
+            base += " JOIN profile_results r ON r.id = p.id AND r.profile = ? AND r.status = 'ACCETTATO'"
+            params.insert(0, profile)
+        if where:
+            base += " WHERE " + " AND ".join(where)
+        if ids is not None:
+            rank = {pid: n for n, pid in enumerate(ids)}
+            rows = sorted((dict(r) for r in self.c.execute(base, params).fetchall()), key=lambda r: rank[r['id']])
+            return rows[offset:offset + limit]
+        if since is not None:
+            # Cursor paging: the client passes back the last seq it got
+            base += " ORDER BY p.seq LIMIT ?"
+            params.append(limit)
+        else:
+            base += " ORDER BY p.time DESC LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
 
         rows = self.c.execute(base, params).fetchall()
         return [dict(r) for r in rows]
@@ -192,10 +822,181 @@ class DB():
     # Persistence helpers
     # ----------------------
     def fetch_good_ids(self):
-        """Return a list of ids already present in good_facebook_posts."""
-        rows = self.c.execute("SELECT id FROM good_facebook_posts").fetchall()
+        """Return a list of ids already present in good_facebook_posts, excluding
+        promoted posts whose notification is still pending.
+        """
+        rows = self.c.execute(
+            "SELECT g.id FROM good_facebook_posts g LEFT JOIN facebook_posts p ON p.id = g.id "
+            "WHERE p.stage IS NULL OR p.stage != 'promoted'"
+        ).fetchall()
         return [r[0] for r in rows]
 
+    def iter_good_id_hashes(self):
+        """Stream id_hash() of accepted, already notified posts in ascending order."""
+        cur = self.conn.cursor()
+        try:
+            cur.execute(
+                "SELECT id_hash(g.id) AS h FROM good_facebook_posts g LEFT JOIN facebook_posts p ON p.id = g.id "
+                "WHERE p.stage IS NULL OR p.stage != 'promoted' ORDER BY h"
+            )
+            for (h,) in cur:
+                yield h
+        finally:
+            cur.close()
+
+    def iter_export(self, table="facebook_posts", since=None, until=None, status=None, batch_size=1000):
+        """Stream every column of `table` plus the listing fields, oldest first,
+        optionally limited to a time range [since, until) and a status
+        ('pending' for unclassified posts). Yields the column names first, then
+        batches of row tuples of at most `batch_size` rows, so memory stays
+        constant whatever the table size.
+        """
+        if table not in ("facebook_posts", "good_facebook_posts"):
+            raise ValueError("Invalid table")
+        where = []
+        params = []
+        if since:
+            where.append("p.time >= ?")
+            params.append(since)
+        if until:
+            where.append("p.time < ?")
+            params.append(until)
+        if status:
+            if status.lower() == 'pending':
+                where.append("p.status IS NULL")
+            else:
+                where.append("p.status = ?")
+                params.append(status.strip().upper())
+        q = (f"SELECT p.*, f.price, f.zone, f.room_type, f.available_from FROM {table} p "
+             "LEFT JOIN listing_fields f ON f.id = p.id")
+        if where:
+            q += " WHERE " + " AND ".join(where)
+        q += " ORDER BY p.time"
+
+        # Own cursor: the shared self.c keeps working while the export runs
+        cur = self.conn.cursor()
+        try:
+            cur.execute(q, params)
+            yield [d[0] for d in cur.description]
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [tuple(r) for r in rows]
+        finally:
+            cur.close()
+
+    # ----------------------
+    # Embeddings (backend/embeddings.py)
+    # ----------------------
+    def iter_embeddings(self, model):
+        """Stream (id, int8 vector blob) of every post embedded with `model`."""
+        cur = self.conn.cursor()
+        try:
+            cur.execute("SELECT id, vec FROM post_embeddings WHERE model = ?", (model,))
+            for row in cur:
+                yield row[0], row[1]
+        finally:
+            cur.close()
+
+    def fetch_unembedded(self, model, after_rowid=0, limit=64):
+        """Posts after `after_rowid` (insertion order) without a `model` vector."""
+        rows = self.c.execute(
+            "SELECT p.rowid AS rowid, p.id, p.text FROM facebook_posts p "
+            "LEFT JOIN post_embeddings e ON e.id = p.id AND e.model = ? "
+            "WHERE p.rowid > ? AND e.id IS NULL ORDER BY p.rowid LIMIT ?",
+            (model, int(after_rowid), int(limit))).fetchall()
+        return [dict(r) for r in rows]
+
+    def store_embeddings(self, model, vectors):
+        """Save [(id, int8 vector blob)] computed with `model`."""
+        now = _now()
+        self.c.executemany("INSERT OR REPLACE INTO post_embeddings (id, model, vec, embedded_at) VALUES (?, ?, ?, ?)",
+                           [(pid, model, blob, now) for pid, blob in vectors])
+        self.conn.commit()
+
+    # ----------------------
+    # Attachments and thumbnail cache (backend/attachments.py)
+    # ----------------------
+    def claim_attachments(self, limit=16, lease_seconds=120):
+        """Lease up to `limit` attachments of accepted posts that are due for fetching."""
+        now = time.time()
+        rows = self.c.execute(
+            """
+            UPDATE post_attachments SET leased_until = ?, attempts = attempts + 1
+            WHERE rowid IN (SELECT rowid FROM post_attachments
+                            WHERE status = 'pending' AND next_attempt_at <= ? AND (leased_until IS NULL OR leased_until < ?)
+                            ORDER BY next_attempt_at LIMIT ?)
+            RETURNING id, position, url, attempts
+            """,
+            (now + lease_seconds, now, now, int(limit))).fetchall()
+        self.conn.commit()
+        return [dict(r) for r in rows]
+
+    def next_attachment_due(self):
+        """Epoch seconds of the earliest pending attachment, or None."""
+        row = self.c.execute("SELECT min(next_attempt_at) FROM post_attachments WHERE status = 'pending'").fetchone()
+        return row[0]
+
+    def cached_thumb_for_url(self, url):
+        """(name, bytes, content_type) of the cached thumbnail of an attachment with
+        the same image url, if any."""
+        row = self.c.execute(
+            "SELECT t.name, t.bytes, t.content_type FROM post_attachments a JOIN thumb_cache t ON t.name = a.thumb "
+            "WHERE a.url = ? AND a.status = 'done' LIMIT 1", (url,)).fetchone()
+        return tuple(row) if row else None
+
+    def mark_attachment_done(self, id, position, thumb, size, content_type):
+        """Link an attachment to the cached thumbnail file `thumb` (`size` bytes)."""
+        self.c.execute(
+            "INSERT INTO thumb_cache (name, bytes, content_type, created_at, last_access) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET last_access = excluded.last_access",
+            (thumb, int(size), content_type, _now(), time.time()))
+        self.c.execute("UPDATE post_attachments SET status = 'done', thumb = ?, leased_until = NULL, last_error = NULL "
+                       "WHERE id = ? AND position = ?", (thumb, id, position))
+        self.conn.commit()
+
+    def mark_attachment_failed(self, id, position, error, retry_at=None):
+        """Record a failed fetch: retry at `retry_at` (epoch seconds) or give up when None."""
+        if retry_at is None:
+            self.c.execute("UPDATE post_attachments SET status = 'failed', last_error = ?, leased_until = NULL "
+                           "WHERE id = ? AND position = ?", (error, id, position))
+        else:
+            self.c.execute("UPDATE post_attachments SET next_attempt_at = ?, last_error = ?, leased_until = NULL "
+                           "WHERE id = ? AND position = ?", (retry_at, error, id, position))
+        self.conn.commit()
+
+    def touch_thumbs(self, accesses):
+        """Save {name: last access epoch seconds} for LRU eviction."""
+        self.c.executemany("UPDATE thumb_cache SET last_access = max(last_access, ?) WHERE name = ?",
+                           [(ts, name) for name, ts in accesses.items()])
+        self.conn.commit()
+
+    def thumb_cache_size(self):
+        """(files, bytes) in the thumbnail cache."""
+        row = self.c.execute("SELECT count(*), coalesce(sum(bytes), 0) FROM thumb_cache").fetchone()
+        return row[0], row[1]
+
+    def least_recent_thumbs(self, limit=100):
+        """[(name, bytes)] of the least recently served thumbnails."""
+        rows = self.c.execute("SELECT name, bytes FROM thumb_cache ORDER BY last_access LIMIT ?", (int(limit),)).fetchall()
+        return [(r[0], r[1]) for r in rows]
+
+    def forget_thumbs(self, names):
+        """Drop evicted thumbnails; their attachments fall back to the original url."""
+        names = list(names)
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            self.c.execute(f"DELETE FROM thumb_cache WHERE name IN ({marks})", chunk)
+            self.c.execute(f"UPDATE post_attachments SET status = 'evicted', thumb = NULL WHERE thumb IN ({marks})", chunk)
+        self.conn.commit()
+
+    def attachment_stats(self):
+        rows = self.c.execute("SELECT status, count(*) AS n FROM post_attachments GROUP BY status").fetchall()
+        files, size = self.thumb_cache_size()
+        return {'attachments': {r['status']: r['n'] for r in rows}, 'cached_files': files, 'cached_bytes': size}
+
     def get_scheduler_config(self):
         """Return scheduler config singleton as a dict including time-of-day fields."""
         row = self.c.execute(
@@ -0,0 +1,369 @@
+"""Decoding of the analyzer's structured (JSON) replies.
+
+Local models often return almost-valid JSON: wrapped in a ```json fence,
+with trailing commas or Python literals, "Accettato" instead of "ACCETTATO",
+`stato` instead of `status`, or cut off mid-object when they hit the token
+limit. `decode()` accepts those:
+
+1. strict: the reply validated as is against the output model;
+2. repaired: fences and text around the object stripped, trailing commas and
+   Python literals fixed, truncated objects closed, keys and the status mapped
+   to the strict ACCETTATO/SCARTATO enum, listing fields coerced.
+
+Only when both fail does `decode_with_retry()` ask again, once by default
+(DECODE_MAX_RETRIES), with a shorter generation: terse motivations and a token
+budget (DECODE_RETRY_TOKENS) so the JSON fits. A post that still cannot be
+decoded raises DecodeError; the pipeline marks it failed instead of
+re-running it on every analyze_pending.
+
+Counters (strict, repaired, retried, failed and the inference time spent on
+discarded replies) are returned by `stats()` and stored per hour with the
+LLM call rollups.
+"""
+import json
+import os
+import re
+import threading
+import time
+from typing import Literal
+
+from pydantic import ValidationError
+
+STATUSES = ('ACCETTATO', 'SCARTATO')
+Status = Literal['ACCETTATO', 'SCARTATO']
+ROOM_TYPES = ('singola', 'doppia', 'monolocale', 'appartamento', 'altro')
+
+STATUS_KEYS = ('status', 'stato', 'state', 'esito', 'verdict')
+MOTIVATION_KEYS = ('motivation', 'motivo', 'motivazione', 'reason', 'reasoning')
+# Word stems, matched at the start of a word: "ACCETTATA", "ACCEPTED", "VALIDO"
+ACCEPT_STEMS = ('ACCETT', 'ACCEPT', 'APPROV', 'VALID', 'IDONE')
+REJECT_STEMS = ('SCARTAT', 'RIFIUTAT', 'ESCLUS', 'RESPINT', 'REJECT', 'DISCARD')
+# "NON ACCETTATO", "not been approved": a verdict word at most NEGATION_REACH
+# words after a negation is negated; "Non ci sono problemi: accettato" is not
+NEGATIONS = ('NON', 'NOT')
+NEGATION_REACH = 2
+# "INVALID", "UNACCEPTABLE", "INIDONEO", "DISAPPROVED": an accept stem negated by a prefix
+NEGATIVE_PREFIXES = ('NON', 'NOT', 'IN', 'UN', 'DIS')
+RETRY_INSTRUCTIONS = (
+    "\n\nIMPORTANTE: rispondi esclusivamente con un oggetto JSON valido e completo, senza testo prima o dopo. "
+    "Ogni \"motivation\" deve avere al massimo 20 parole. \"status\" è \"ACCETTATO\" oppure \"SCARTATO\"."
+)
+FENCE_RE = re.compile(r'^\s*```[a-zA-Z]*\s*|\s*```\s*$')
+LITERALS = {'True': 'true', 'False': 'false', 'None': 'null', 'NaN': 'null', 'true': 'true', 'false': 'false',
+            'null': 'null'}
+
+
+class DecodeError(ValueError):
+    """The reply cannot be turned into a valid analysis."""
+
+    def __init__(self, message, report=None):
+        super().__init__(message)
+        self.report = report or {}
+
+
+_lock = threading.Lock()
+_counters = {'replies': 0, 'strict': 0, 'repaired': 0, 'retried': 0, 'failed': 0, 'wasted_s': 0.0}
+
+
+def _count(**deltas):
+    with _lock:
+        for k, v in deltas.items():
+            _counters[k] += v
+
+
+def stats():
+    """Decoding outcomes since startup, with failure and repair rates."""
+    with _lock:
+        out = dict(_counters)
+    replies = out['replies'] or 1
+    out['wasted_s'] = round(out['wasted_s'], 3)
+    out['repair_rate'] = round(out['repaired'] / replies, 4)
+    out['failure_rate'] = round(out['failed'] / replies, 4)
+    return out
+
+
+def _verdict_word(word):
+    """'ACCETTATO', 'SCARTATO' or None for one upper-case word."""
+    if word.startswith(REJECT_STEMS):
+        return 'SCARTATO'
+    if word.startswith(ACCEPT_STEMS):
+        return 'ACCETTATO'
+    for prefix in NEGATIVE_PREFIXES:
+        if word.startswith(prefix) and word[len(prefix):].startswith(ACCEPT_STEMS):
+            return 'SCARTATO'
+    return None
+
+
+def parse_status(value):
+    """Map a model's verdict ("Accettato", "accepted", "NON ACCETTATO", "invalid", true...)
+    to STATUSES. Whole words only; a verdict with both accept and reject words, or
+    none, raises DecodeError rather than being guessed.
+    """
+    if isinstance(value, bool):
+        return 'ACCETTATO' if value else 'SCARTATO'
+    if not isinstance(value, str):
+        raise DecodeError(f'invalid status {value!r}')
+    found = set()
+    reach = 0
+    for word in re.findall(r'\b[A-Z]+\b', value.upper()):
+        if word in NEGATIONS:
+            reach = NEGATION_REACH
+            continue
+        verdict = _verdict_word(word)
+        if verdict is None:
+            reach = max(0, reach - 1)
+            continue
+        if reach:
+            if verdict == 'SCARTATO':
+                # "not rejected" is not a clear acceptance
+                raise DecodeError(f'ambiguous status {value!r}')
+            verdict = 'SCARTATO'
+            reach = 0
+        found.add(verdict)
+    if len(found) != 1:
+        raise DecodeError(f'{"ambiguous" if found else "invalid"} status {value!r}')
+    return found.pop()
+
+
+def repair_json(text):
+    """Best-effort valid JSON for the first object in `text`: strips fences and
+    surrounding prose, trailing commas and Python literals, and closes an object
+    truncated mid-way (a dangling key gets null, a cut string is closed).
+    """
+    text = FENCE_RE.sub('', text or '')
+    start = text.find('{')
+    if start < 0:
+        raise DecodeError('no JSON object in reply')
+    out = []
+    # One frame per open container: [kind, state], state is what comes next:
+    # 'key', 'colon', 'value' or 'after' (a value was completed)
+    stack = []
+    in_string = escaped = False
+    i, n = start, len(text)
+
+    def completed():
+        if stack:
+            frame = stack[-1]
+            frame[1] = 'colon' if frame[0] == '{' and frame[1] == 'key' else 'after'
+
+    def drop_trailing_comma():
+        while out and out[-1].isspace():
+            out.pop()
+        if out and out[-1] == ',':
+            out.pop()
+
+    while i < n:
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+                completed()
+            i += 1
+            continue
+        if ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in '{[':
+            stack.append([ch, 'key' if ch == '{' else 'value'])
+            out.append(ch)
+        elif ch in '}]':
+            drop_trailing_comma()
+            if not stack:
+                break
+            kind, state = stack.pop()
+            if state == 'colon':
+                out.append(': null')
+            out.append('}' if kind == '{' else ']')
+            completed()
+            if not stack:
+                break
+        elif ch == ':':
+            out.append(ch)
+            if stack:
+                stack[-1][1] = 'value'
+        elif ch == ',':
+            out.append(ch)
+            if stack:
+                stack[-1][1] = 'key' if stack[-1][0] == '{' else 'value'
+        elif ch.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == '_'):
+                j += 1
+            word = text[i:j]
+            if j == n and word not in LITERALS:
+                # Cut mid-literal ("tr", "nul")
+                word = next((lit for lit in ('true', 'false', 'null') if lit.startswith(word)), word)
+            out.append(LITERALS.get(word, json.dumps(word)))
+            completed()
+            i = j
+            continue
+        elif ch in '-0123456789':
+            j = i
+            while j < n and text[j] in '-+.eE0123456789':
+                j += 1
+            number = text[i:j].rstrip('.eE+-')
+            out.append(number if number and number != '-' else 'null')
+            completed()
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if stack:
+        # Truncated reply: close what is open
+        if in_string:
+            if escaped:
+                out.pop()
+            out.append('"')
+            completed()
+        while stack:
+            kind, state = stack.pop()
+            if state == 'colon':
+                out.append(': null')
+            elif state == 'value' and kind == '{':
+                out.append(' null')
+            else:
+                drop_trailing_comma()
+            out.append('}' if kind == '{' else ']')
+            completed()
+    return ''.join(out)
+
+
+def _pick(data, keys):
+    for k in keys:
+        if k in data:
+            return data[k]
+    lowered = {str(k).lower(): v for k, v in data.items()}
+    for k in keys:
+        if k in lowered:
+            return lowered[k]
+    return None
+
+
+def normalize_verdict(data):
+    """{status, motivation} from a verdict dict with any of the usual key names."""
+    if not isinstance(data, dict):
+        raise DecodeError(f'verdict is not an object: {data!r}'[:200])
+    motivation = _pick(data, MOTIVATION_KEYS)
+    if motivation is not None and not isinstance(motivation, str):
+        motivation = json.dumps(motivation, ensure_ascii=False)
+    return {'status': parse_status(_pick(data, STATUS_KEYS)), 'motivation': motivation or ''}
+
+
+def _room_type(value):
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip().lower()
+    if value in ROOM_TYPES:
+        return value
+    for needle, room in (('singol', 'singola'), ('doppi', 'doppia'), ('mono', 'monolocale'),
+                         ('appartament', 'appartamento'), ('bilocal', 'appartamento'), ('trilocal', 'appartamento'),
+                         ('casa', 'appartamento')):
+        if needle in value:
+            return room
+    return 'altro'
+
+
+def _price(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        m = re.search(r'\d+', value.replace('.', ''))
+        return int(m.group()) if m else None
+    return None
+
+
+def normalize(data, profile_names=None):
+    """Coerce a decoded reply to the output model's shape: listing fields typed or
+    null, statuses in STATUSES, and with `profile_names` one verdict per profile.
+    """
+    if not isinstance(data, dict):
+        raise DecodeError('reply is not a JSON object')
+    out = {
+        'price': _price(data.get('price')),
+        'zone': data.get('zone') if isinstance(data.get('zone'), str) else None,
+        'room_type': _room_type(data.get('room_type')),
+        'available_from': data.get('available_from') if isinstance(data.get('available_from'), str) else None,
+    }
+    if profile_names is None:
+        out.update(normalize_verdict(data))
+        return out
+    verdicts = data.get('profiles')
+    if not isinstance(verdicts, dict):
+        raise DecodeError('missing per-profile verdicts')
+    by_name = {str(k).strip().lower(): v for k, v in verdicts.items()}
+    out['profiles'] = {}
+    for name in profile_names:
+        if name.lower() not in by_name:
+            raise DecodeError(f'missing verdict for profile {name!r}')
+        out['profiles'][name] = normalize_verdict(by_name[name.lower()])
+    return out
+
+
+def _profile_names(model):
+    field = model.model_fields.get('profiles')
+    return tuple(field.annotation.model_fields) if field is not None else None
+
+
+def decode(content, model):
+    """Validate `content` against the pydantic `model`, repairing it if needed.
+    Returns (model instance, repaired).
+    """
+    try:
+        return model.model_validate_json(content), False
+    except ValidationError:
+        pass
+    try:
+        data = json.loads(repair_json(content), strict=False)
+        return model.model_validate(normalize(data, _profile_names(model))), True
+    except (ValueError, ValidationError) as e:
+        # json.JSONDecodeError and DecodeError are ValueErrors too
+        raise DecodeError(f'undecodable reply: {e}'.splitlines()[0][:300])
+
+
+def decode_with_retry(chat, model, max_retries=None):
+    """Call `chat(retry)` and decode its reply; on failure call it again with
+    retry=True (a shorter generation), at most `max_retries` times.
+    Returns (model instance, report) where report has `repaired`, `retries` and
+    `wasted_s` (inference time of discarded replies); raises DecodeError with
+    the report attached when every attempt fails.
+    """
+    max_retries = int(max_retries if max_retries is not None else os.getenv('DECODE_MAX_RETRIES', '1'))
+    report = {'repaired': False, 'retries': 0, 'wasted_s': 0.0}
+    attempt = 0
+    while True:
+        t0 = time.monotonic()
+        content = chat(attempt > 0)
+        elapsed = time.monotonic() - t0
+        _count(replies=1)
+        try:
+            result, repaired = decode(content, model)
+        except DecodeError as e:
+            report['wasted_s'] += elapsed
+            _count(wasted_s=elapsed)
+            if attempt >= max_retries:
+                _count(failed=1)
+                raise DecodeError(str(e), report)
+            attempt += 1
+            report['retries'] = attempt
+            _count(retried=1)
+            continue
+        report['repaired'] = repaired
+        if repaired:
+            _count(repaired=1)
+        else:
+            _count(strict=1)
+        return result, report
+
+
+def retry_options():
+    """Backend options of a retry: a token budget the terse reply fits in."""
+    return {'num_predict': int(os.getenv('DECODE_RETRY_TOKENS', '300')), 'temperature': 0}
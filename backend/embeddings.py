@@ -0,0 +1,246 @@
+"""Local sentence embeddings of posts and a vectorized NumPy index over them.
+
+Embedders (CPU only):
+- SentenceTransformerEmbedder: any sentence-transformers model
+  (EMBEDDING_MODEL, default a small multilingual paraphrase model) when the
+  optional `sentence-transformers` package is installed.
+- HashingEmbedder: dependency-free fallback hashing words, word bigrams and
+  character trigrams into a fixed-size vector, after mapping common rental
+  synonyms ("studio" -> "monolocale", ...) to one term. Lexical, but robust to
+  inflections and typos. Used when EMBEDDING_MODEL=hashing or the package is
+  missing.
+
+Vectors are L2-normalized and stored as int8 (value * 127) blobs in the
+`post_embeddings` table, one row per post and model, so 384 dimensions cost
+384 bytes per post. EmbeddingIndex keeps them in one int8 NumPy matrix and
+answers cosine top-k queries by brute force in fixed-size blocks, which keeps
+temporary memory constant; see backend/utils/bench_embeddings.py for latency
+at 100k vectors. EmbeddingWorker embeds new posts in background as they are
+inserted.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from backend.database import DB
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_MODEL = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
+HASHING_DIM = 384
+BLOCK_ROWS = 8192
+
+# Same meaning, different words: mapped to one term before hashing
+SYNONYMS = {
+    'studio': 'monolocale', 'mono': 'monolocale', 'monolocali': 'monolocale',
+    'flat': 'appartamento', 'apartment': 'appartamento', 'casa': 'appartamento', 'appartamenti': 'appartamento',
+    'bilocali': 'bilocale', 'trilocali': 'trilocale',
+    'camera': 'stanza', 'room': 'stanza', 'stanze': 'stanza', 'camere': 'stanza',
+    'single': 'singola', 'singole': 'singola', 'double': 'doppia', 'doppie': 'doppia',
+    'affittasi': 'affitto', 'affitta': 'affitto', 'affittare': 'affitto', 'rent': 'affitto',
+    'coinquilina': 'coinquilino', 'coinquilini': 'coinquilino', 'coinquiline': 'coinquilino', 'roommate': 'coinquilino',
+    'euro': '€', 'eur': '€',
+}
+WORD_RE = re.compile(r'\w+|€', re.UNICODE)
+
+
+class HashingEmbedder():
+    def __init__(self, dim=HASHING_DIM):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def _features(self, text):
+        words = [SYNONYMS.get(w, w) for w in WORD_RE.findall((text or '').lower())]
+        for w in words:
+            yield w, 1.0
+            padded = f'#{w}#'
+            for i in range(len(padded) - 2):
+                yield '3:' + padded[i:i + 3], 0.3
+        for a, b in zip(words, words[1:]):
+            yield f'{a} {b}', 0.5
+
+    def embed(self, texts):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                h = zlib.crc32(feature.encode('utf-8'))
+                # Signed hashing: collisions cancel out instead of piling up
+                out[row, h % self.dim] += weight if h & 0x80000000 else -weight
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+class SentenceTransformerEmbedder():
+    def __init__(self, model_name=DEFAULT_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = model_name
+
+    def embed(self, texts):
+        return self.model.encode([t or '' for t in texts], batch_size=32, normalize_embeddings=True,
+                                 convert_to_numpy=True).astype(np.float32)
+
+
+_EMBEDDER = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """Configured embedder (EMBEDDING_MODEL), shared by the worker and the API."""
+    global _EMBEDDER
+    with _embedder_lock:
+        if _EMBEDDER is None:
+            name = os.getenv('EMBEDDING_MODEL', DEFAULT_MODEL)
+            if name == 'hashing':
+                _EMBEDDER = HashingEmbedder()
+            else:
+                try:
+                    _EMBEDDER = SentenceTransformerEmbedder(name)
+                except ImportError:
+                    logging.warning("sentence-transformers not installed; using the hashing embedder")
+                    _EMBEDDER = HashingEmbedder()
+        return _EMBEDDER
+
+
+def quantize(vectors):
+    """float32 unit vectors -> int8 (scale 127)."""
+    return np.clip(np.rint(vectors * 127), -127, 127).astype(np.int8)
+
+
+class EmbeddingIndex():
+    """Brute-force cosine index over int8 vectors, with incremental adds."""
+
+    def __init__(self, dim, capacity=1024):
+        self.dim = dim
+        self._vecs = np.zeros((capacity, dim), dtype=np.int8)
+        self._ids = []
+        self._pos = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def nbytes(self):
+        return self._vecs.nbytes
+
+    def add(self, ids, vectors):
+        """Add or replace int8 `vectors` (n x dim) for `ids`."""
+        with self._lock:
+            for pid, vec in zip(ids, vectors):
+                row = self._pos.get(pid)
+                if row is None:
+                    row = len(self._ids)
+                    if row == len(self._vecs):
+                        grown = np.zeros((len(self._vecs) * 2, self.dim), dtype=np.int8)
+                        grown[:row] = self._vecs[:row]
+                        self._vecs = grown
+                    self._ids.append(pid)
+                    self._pos[pid] = row
+                self._vecs[row] = vec
+
+    def vector(self, pid):
+        with self._lock:
+            row = self._pos.get(pid)
+            return None if row is None else self._vecs[row].astype(np.float32) / 127
+
+    def search(self, query, k=10, exclude=None):
+        """Top `k` (id, cosine similarity) for a float32 unit `query` vector."""
+        with self._lock:
+            n = len(self._ids)
+            if not n:
+                return []
+            q = np.asarray(query, dtype=np.float32) / 127
+            k_want = min(n, k + (1 if exclude is not None else 0))
+            best_rows = np.empty(0, dtype=np.int64)
+            best_scores = np.empty(0, dtype=np.float32)
+            # Block by block so the float32 copy stays BLOCK_ROWS x dim
+            for start in range(0, n, BLOCK_ROWS):
+                scores = self._vecs[start:min(n, start + BLOCK_ROWS)].astype(np.float32) @ q
+                if len(scores) > k_want:
+                    top = np.argpartition(scores, -k_want)[-k_want:]
+                else:
+                    top = np.arange(len(scores))
+                best_rows = np.concatenate([best_rows, top + start])
+                best_scores = np.concatenate([best_scores, scores[top]])
+            order = np.argsort(-best_scores)[:k_want]
+            results = [(self._ids[r], float(best_scores[i])) for i, r in zip(order, best_rows[order])]
+        if exclude is not None:
+            results = [r for r in results if r[0] != exclude]
+        return results[:k]
+
+
+class EmbeddingWorker(threading.Thread):
+    """Loads stored vectors into the index, then embeds posts as they arrive."""
+
+    def __init__(self, db_path=None, embedder=None, batch_size=64, poll_interval=10.0):
+        super().__init__(name='embedding-worker', daemon=True)
+        self.db_path = db_path or os.getenv('DB_PATH', 'facebook_posts.db')
+        self.embedder = embedder or get_embedder()
+        self.index = EmbeddingIndex(self.embedder.dim)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.ready = False
+        self._last_rowid = 0
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def load(self, db):
+        t0 = time.monotonic()
+        ids, blobs = [], []
+        for pid, blob in db.iter_embeddings(self.embedder.name):
+            ids.append(pid)
+            blobs.append(blob)
+            if len(ids) >= 10000:
+                self.index.add(ids, np.frombuffer(b''.join(blobs), dtype=np.int8).reshape(len(ids), -1))
+                ids, blobs = [], []
+        if ids:
+            self.index.add(ids, np.frombuffer(b''.join(blobs), dtype=np.int8).reshape(len(ids), -1))
+        logging.info('Loaded %d embeddings (%s) in %.2fs', len(self.index), self.embedder.name, time.monotonic() - t0)
+
+    def index_pending(self, db):
+        """Embed one batch of posts without a vector. Returns how many were seen."""
+        rows = db.fetch_unembedded(self.embedder.name, after_rowid=self._last_rowid, limit=self.batch_size)
+        if not rows:
+            return 0
+        self._last_rowid = rows[-1]['rowid']
+        texts = [r for r in rows if r['text']]
+        if texts:
+            vecs = quantize(self.embedder.embed([r['text'] for r in texts]))
+            db.store_embeddings(self.embedder.name, [(r['id'], v.tobytes()) for r, v in zip(texts, vecs)])
+            self.index.add([r['id'] for r in texts], vecs)
+        return len(rows)
+
+    def run(self):
+        db = DB(path=self.db_path)
+        try:
+            self.load(db)
+            self.ready = True
+            while not self._stop_event.is_set():
+                self._wake.clear()
+                try:
+                    indexed = self.index_pending(db)
+                except Exception as e:
+                    logging.exception('Embedding worker: %s', e)
+                    indexed = 0
+                if not indexed:
+                    self._wake.wait(self.poll_interval)
+        finally:
+            db.close()
+
+    def stats(self):
+        return {'model': self.embedder.name, 'dim': self.embedder.dim, 'ready': self.ready,
+                'vectors': len(self.index), 'bytes': self.index.nbytes()}
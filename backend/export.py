@@ -0,0 +1,147 @@
+"""Streaming export of facebook_posts / good_facebook_posts.
+
+Rows are read from a dedicated DB connection in batches (DB.iter_export) and
+encoded chunk by chunk, so an export of any size runs in constant memory and
+the shared connection used by the API and the scheduler is never held.
+
+Formats:
+    ndjson   one JSON object per line
+    csv      header + rows
+    parquet  one row group per batch (needs the optional `pyarrow` package)
+
+Usage:
+    python -m backend.export --table good_facebook_posts --format csv > good.csv
+    python -m backend.export --since 2025-01-01 --status ACCETTATO --format parquet --out accepted.parquet
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+from backend.database import DB
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def has_parquet():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _ndjson(columns, batches):
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(columns, r)), ensure_ascii=False) + "\n" for r in rows).encode('utf-8')
+
+
+def _csv(columns, batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file handing what the Parquet writer produced to the caller."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_schema(db, table, columns):
+    import pyarrow as pa
+    declared = {}
+    for t in (table, "listing_fields"):
+        for r in db.c.execute(f"PRAGMA table_info({t})").fetchall():
+            declared.setdefault(r[1], (r[2] or "").upper())
+    return pa.schema([(c, pa.int64() if declared.get(c) == "INTEGER" else pa.string()) for c in columns])
+
+
+def _parquet(columns, batches, schema):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in batches:
+            data = [[None if v is None else (v if f.type == pa.int64() else str(v)) for v in col]
+                    for col, f in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(data, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def export_stream(db_path=None, table="facebook_posts", fmt="ndjson", since=None, until=None, status=None,
+                  batch_size=1000):
+    """Yield the encoded export in byte chunks (one per batch of rows)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Invalid format: {fmt}, use one of {', '.join(FORMATS)}")
+    if fmt == 'parquet' and not has_parquet():
+        raise ValueError("Parquet export needs the optional 'pyarrow' package")
+    db = DB(path=db_path or os.getenv('DB_PATH', 'facebook_posts.db'))
+    try:
+        rows = db.iter_export(table=table, since=since, until=until, status=status, batch_size=batch_size)
+        columns = next(rows)
+        if fmt == 'ndjson':
+            chunks = _ndjson(columns, rows)
+        elif fmt == 'csv':
+            chunks = _csv(columns, rows)
+        else:
+            chunks = _parquet(columns, rows, _parquet_schema(db, table, columns))
+        for chunk in chunks:
+            if chunk:
+                yield chunk
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite path (default: DB_PATH)')
+    parser.add_argument('--table', default='facebook_posts', choices=['facebook_posts', 'good_facebook_posts'])
+    parser.add_argument('--format', default='ndjson', choices=list(FORMATS))
+    parser.add_argument('--since', help='only posts with time >= this (YYYY-MM-DD or ISO timestamp)')
+    parser.add_argument('--until', help='only posts with time < this')
+    parser.add_argument('--status', help="ACCETTATO, SCARTATO or 'pending'")
+    parser.add_argument('--out', help='output file (default: stdout)')
+    args = parser.parse_args()
+    out = open(args.out, 'wb') if args.out else sys.stdout.buffer
+    try:
+        for chunk in export_stream(args.db, args.table, args.format, args.since, args.until, args.status):
+            out.write(chunk)
+    finally:
+        if args.out:
+            out.close()
@@ -0,0 +1,278 @@
+"""Chat backends used by LLMAnalizer.
+
+Every backend exposes `chat(system, user, schema) -> str`, returning the raw
+reply content (expected to be JSON matching `schema`).
+
+- OllamaBackend:  an Ollama server (`/api/chat`)
+- OpenAIBackend:  any OpenAI-compatible server (llama.cpp server, vLLM, ...)
+- FakeBackend:    deterministic offline backend for development and benchmarks
+- BalancedBackend: dispatches across several backends by queue depth and
+  latency, with health checks and failover.
+
+`backend_from_env()` builds the configured backend from:
+    LLM_BACKEND    ollama | openai | fake            (default ollama)
+    LLM_ENDPOINTS  comma separated base urls         (default http://localhost:11434)
+    LLM_API_KEY    bearer token for openai-compatible servers (optional)
+    LLM_TIMEOUT    request timeout in seconds        (default 120)
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+logging.basicConfig(level=logging.INFO)
+
+
+class BackendError(RuntimeError):
+    pass
+
+
+class OllamaBackend():
+    def __init__(self, host="http://localhost:11434", timeout=120):
+        self.name = host
+        self.host = host
+        self.timeout = timeout
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            from ollama import Client
+            self._client = Client(host=self.host, timeout=self.timeout)
+        return self._client
+
+    def chat(self, system, user, schema, model, options=None):
+        response = self._get_client().chat(
+            messages=[
+                {'role': 'system', 'content': system},
+                {'role': 'user', 'content': user}
+            ],
+            model=model,
+            format=schema,
+            options=options,
+        )
+        return response.message.content
+
+    def health(self):
+        r = requests.get(f"{self.host.rstrip('/')}/api/tags", timeout=5)
+        return r.status_code == 200
+
+
+class OpenAIBackend():
+    """OpenAI-compatible chat completions (llama.cpp server, vLLM, LM Studio...)."""
+
+    def __init__(self, base_url="http://localhost:8080", api_key=None, timeout=120):
+        self.name = base_url
+        self.base_url = base_url.rstrip('/')
+        if self.base_url.endswith('/v1'):
+            self.base_url = self.base_url[:-3]
+        self.timeout = timeout
+        self.session = requests.Session()
+        if api_key:
+            self.session.headers['Authorization'] = f"Bearer {api_key}"
+
+    def chat(self, system, user, schema, model, options=None):
+        body = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            "temperature": 0,
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": "output", "schema": schema},
+            },
+        }
+        if options and options.get('num_predict'):
+            body["max_tokens"] = options['num_predict']
+        r = self.session.post(f"{self.base_url}/v1/chat/completions", json=body, timeout=self.timeout)
+        if r.status_code != 200:
+            raise BackendError(f"{self.name} returned HTTP {r.status_code}: {r.text[:200]}")
+        return r.json()["choices"][0]["message"]["content"]
+
+    def health(self):
+        r = self.session.get(f"{self.base_url}/v1/models", timeout=5)
+        return r.status_code == 200
+
+
+class FakeBackend():
+    """Deterministic backend: the verdict is a pure function of the post text.
+
+    Optional `latency` (seconds) and `error_rate` (0..1) simulate a real server;
+    errors are also derived from the text hash so runs are reproducible.
+    `malformed_rate` (0..1) of the replies come back the way small local models
+    break JSON: fenced, truncated, with Italian keys, or as prose (which a
+    retry with a token budget fixes for half of the posts).
+    """
+
+    def __init__(self, name="fake", latency=0.0, error_rate=0.0, malformed_rate=0.0):
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+
+    def chat(self, system, user, schema, model, options=None):
+        digest = hashlib.sha256(user.encode('utf-8')).digest()
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and digest[1] / 255 < self.error_rate:
+            raise BackendError(f"{self.name}: simulated failure")
+        status = "ACCETTATO" if digest[0] % 2 == 0 else "SCARTATO"
+        reply = {
+            "status": status,
+            "motivation": f"fake verdict {digest[:4].hex()}",
+            "price": 300 + digest[2] * 2,
+            "zone": ["San Salvario", "Crocetta", "Vanchiglia", "Aurora", "Centro"][digest[3] % 5],
+            "room_type": ["singola", "doppia", "monolocale", "appartamento", "altro"][digest[4] % 5],
+            "available_from": f"2025-{digest[5] % 12 + 1:02d}-01",
+        }
+        if "profiles" in schema.get("properties", {}):
+            # Multi-profile schema: one verdict per profile, also hash-derived
+            names = schema["$defs"]["ProfileVerdicts"]["properties"]
+            reply["profiles"] = {}
+            for n in names:
+                d = hashlib.sha256(f"{n}:{user}".encode('utf-8')).digest()
+                reply["profiles"][n] = {"status": "ACCETTATO" if d[0] % 2 == 0 else "SCARTATO",
+                                        "motivation": f"fake verdict {d[:4].hex()}"}
+        if self.malformed_rate and digest[6] / 255 < self.malformed_rate:
+            return self._malformed(reply, digest, retry=bool(options and options.get('num_predict')))
+        return json.dumps(reply)
+
+    @staticmethod
+    def _malformed(reply, digest, retry):
+        style = digest[7] % 4
+        if style == 0:
+            reply["status"] = reply["status"].capitalize()
+            return "```json\n" + json.dumps(reply, indent=2)[:-2] + ",\n}\n```"
+        if style == 1:
+            text = json.dumps(reply)
+            return text[:int(len(text) * 0.8)]
+        if style == 2:
+            reply["stato"] = reply.pop("status")
+            reply["motivo"] = reply.pop("motivation")
+            return "Ecco la valutazione: " + json.dumps(reply)
+        if retry and digest[8] % 2 == 0:
+            return json.dumps(reply)
+        return "Non posso valutare questo annuncio con certezza."
+
+    def health(self):
+        return True
+
+
+class BalancedBackend():
+    """Dispatch each request to the least loaded healthy endpoint.
+
+    The cost of an endpoint is (in-flight requests + 1) * EWMA latency, so a
+    faster box receives proportionally more traffic. A failing endpoint is
+    marked down and gets no requests until `check_health`, meant to run every
+    `cooldown` seconds, finds it healthy again: a dead box costs a 5 s probe,
+    not a request waiting out LLM_TIMEOUT. Failed requests are retried on the
+    next best endpoint until every endpoint has been tried once.
+    """
+
+    def __init__(self, backends, cooldown=30.0, alpha=0.2):
+        if not backends:
+            raise ValueError("BalancedBackend needs at least one backend")
+        self.name = "balanced"
+        self.backends = list(backends)
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._state = {id(b): {"inflight": 0, "ewma": 1.0, "down_since": None, "ok": 0, "errors": 0}
+                       for b in self.backends}
+
+    def _pick(self, exclude):
+        with self._lock:
+            candidates = [b for b in self.backends if id(b) not in exclude]
+            healthy = [b for b in candidates if self._state[id(b)]["down_since"] is None]
+            if not healthy and candidates:
+                # Everything is down: try the endpoint that failed longest ago
+                healthy = [min(candidates, key=lambda b: self._state[id(b)]["down_since"])]
+            if not healthy:
+                return None
+            best = min(healthy, key=lambda b: (self._state[id(b)]["inflight"] + 1) * self._state[id(b)]["ewma"])
+            self._state[id(best)]["inflight"] += 1
+            return best
+
+    def _release(self, backend, elapsed=None, failed=False):
+        with self._lock:
+            st = self._state[id(backend)]
+            st["inflight"] -= 1
+            if failed:
+                st["errors"] += 1
+                st["down_since"] = time.monotonic()
+            else:
+                st["ok"] += 1
+                st["down_since"] = None
+                st["ewma"] = (1 - self.alpha) * st["ewma"] + self.alpha * elapsed
+
+    def chat(self, system, user, schema, model, options=None):
+        tried = set()
+        last_error = None
+        while True:
+            backend = self._pick(tried)
+            if backend is None:
+                raise BackendError(f"All LLM endpoints failed: {last_error}")
+            tried.add(id(backend))
+            t0 = time.monotonic()
+            try:
+                content = backend.chat(system, user, schema, model, options=options)
+            except Exception as e:
+                self._release(backend, failed=True)
+                last_error = e
+                logging.warning("LLM endpoint %s failed, failing over: %s", backend.name, e)
+                continue
+            self._release(backend, elapsed=time.monotonic() - t0)
+            return content
+
+    def check_health(self):
+        """Probe every endpoint marked down and bring back the healthy ones."""
+        for b in self.backends:
+            st = self._state[id(b)]
+            if st["down_since"] is None:
+                continue
+            try:
+                ok = b.health()
+            except Exception:
+                ok = False
+            if ok:
+                with self._lock:
+                    st["down_since"] = None
+                logging.info("LLM endpoint %s is healthy again", b.name)
+
+    def stats(self):
+        with self._lock:
+            return [{
+                "endpoint": b.name,
+                "inflight": self._state[id(b)]["inflight"],
+                "ewma_latency_s": round(self._state[id(b)]["ewma"], 3),
+                "healthy": self._state[id(b)]["down_since"] is None,
+                "ok": self._state[id(b)]["ok"],
+                "errors": self._state[id(b)]["errors"],
+            } for b in self.backends]
+
+
+def backend_from_env():
+    kind = os.getenv('LLM_BACKEND', 'ollama').lower()
+    timeout = float(os.getenv('LLM_TIMEOUT', '120'))
+    if kind == 'fake':
+        return FakeBackend(latency=float(os.getenv('FAKE_LLM_LATENCY', '0')),
+                           error_rate=float(os.getenv('FAKE_LLM_ERROR_RATE', '0')),
+                           malformed_rate=float(os.getenv('FAKE_LLM_MALFORMED_RATE', '0')))
+
+    default = 'http://localhost:11434' if kind == 'ollama' else 'http://localhost:8080'
+    endpoints = [e.strip() for e in os.getenv('LLM_ENDPOINTS', default).split(',') if e.strip()]
+    if kind == 'ollama':
+        backends = [OllamaBackend(host=e, timeout=timeout) for e in endpoints]
+    elif kind == 'openai':
+        backends = [OpenAIBackend(base_url=e, api_key=os.getenv('LLM_API_KEY'), timeout=timeout) for e in endpoints]
+    else:
+        raise ValueError(f"Invalid LLM_BACKEND: {kind}, set it to 'ollama', 'openai' or 'fake'")
+
+    if len(backends) == 1:
+        return backends[0]
+    return BalancedBackend(backends)
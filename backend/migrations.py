@@ -0,0 +1,588 @@
+"""Versioned schema migrations for the SQLite database.
+
+Each migration is a (version, name, function) entry in MIGRATIONS, applied in
+order and recorded in `schema_version`. Opening an up-to-date DB costs a single
+`SELECT max(version)`. Steps must be idempotent (IF NOT EXISTS, column
+probes) because a DB created before versioning already has part of the schema
+and starts from version 0.
+
+To change the schema, append a new function and entry; never edit a released
+step.
+"""
+import logging
+import sqlite3
+from datetime import datetime
+
+logging.basicConfig(level=logging.INFO)
+
+
+def _columns(c, table):
+    return {r[1] for r in c.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def _add_column(c, table, column, decl):
+    if column not in _columns(c, table):
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def m001_base_tables(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS facebook_posts (
+        url TEXT,
+        time TEXT,
+        user TEXT,
+        text TEXT,
+        topReactionsCount INTEGER,
+        feedbackId TEXT,
+        id TEXT PRIMARY KEY,
+        legacyId TEXT,
+        attachments TEXT,
+        likesCount INTEGER,
+        sharesCount INTEGER,
+        commentsCount INTEGER,
+        facebookId TEXT,
+        groupTitle TEXT,
+        inputUrl TEXT,
+        status TEXT,
+        motivo TEXT
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS good_facebook_posts (
+        url TEXT,
+        time TEXT,
+        user TEXT,
+        text TEXT,
+        topReactionsCount INTEGER,
+        feedbackId TEXT,
+        id TEXT PRIMARY KEY,
+        legacyId TEXT,
+        attachments TEXT,
+        likesCount INTEGER,
+        sharesCount INTEGER,
+        commentsCount INTEGER,
+        facebookId TEXT,
+        groupTitle TEXT,
+        inputUrl TEXT,
+        status TEXT
+    )
+    """)
+    # Singleton row persisting the scheduler state
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS scheduler_config (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        active INTEGER DEFAULT 0,
+        minutes INTEGER,
+        webhook TEXT,
+        last_run_time TEXT
+    )
+    """)
+    c.execute("INSERT OR IGNORE INTO scheduler_config (id, active) VALUES (1, 0)")
+
+
+def m002_scheduler_time_of_day(c):
+    _add_column(c, "scheduler_config", "minutes_day", "INTEGER")
+    _add_column(c, "scheduler_config", "minutes_night", "INTEGER")
+    _add_column(c, "scheduler_config", "day_start_hour", "INTEGER DEFAULT 8")
+    _add_column(c, "scheduler_config", "night_start_hour", "INTEGER DEFAULT 20")
+    _add_column(c, "scheduler_config", "last_scrape_time_from", "TEXT")
+
+
+def m003_listing_fields(c):
+    # Structured fields extracted by the analyzer, shared by both post tables
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS listing_fields (
+        id TEXT PRIMARY KEY,
+        price INTEGER,
+        zone TEXT COLLATE NOCASE,
+        room_type TEXT,
+        available_from TEXT
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_listing_fields_price ON listing_fields (price)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_listing_fields_zone_price ON listing_fields (zone, price)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_listing_fields_room_type_price ON listing_fields (room_type, price)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_listing_fields_available_from ON listing_fields (available_from)")
+
+
+def m004_archived_ids(c):
+    # 64-bit hashes of posts moved to the archive DB by backend/retention.py
+    c.execute("CREATE TABLE IF NOT EXISTS archived_ids (h INTEGER PRIMARY KEY)")
+
+
+def m005_post_indexes(c):
+    # /posts and the dashboard sort by time; analyze_pending scans NULL status
+    c.execute("CREATE INDEX IF NOT EXISTS idx_facebook_posts_time ON facebook_posts (time)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_good_facebook_posts_time ON good_facebook_posts (time)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_facebook_posts_pending ON facebook_posts (time) WHERE status IS NULL")
+
+
+def m006_pipeline_checkpoints(c):
+    # Per-post pipeline stage: scraped -> analyzed -> promoted -> notified.
+    # Rejected posts stop at 'analyzed' (undecodable ones at 'failed', m013).
+    _add_column(c, "facebook_posts", "stage", "TEXT DEFAULT 'scraped'")
+    _add_column(c, "facebook_posts", "run_id", "INTEGER")
+    # Rows classified before checkpoints existed are finished
+    c.execute("UPDATE facebook_posts SET stage = 'notified' WHERE status IS NOT NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_facebook_posts_unfinished ON facebook_posts (stage) "
+              "WHERE stage IN ('scraped', 'promoted') OR (stage = 'analyzed' AND status = 'ACCETTATO')")
+    # Run journal
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS pipeline_runs (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL,
+        started_at TEXT NOT NULL,
+        finished_at TEXT,
+        start_time TEXT,
+        scraped INTEGER DEFAULT 0,
+        analyzed INTEGER DEFAULT 0,
+        accepted INTEGER DEFAULT 0,
+        error TEXT
+    )
+    """)
+
+
+def m007_analysis_queue(c):
+    # Persistent analysis work queue shared by scheduled runs, the backlog and
+    # the long-lived analysis workers. Lower priority value is served first,
+    # then newer posts first.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS analysis_queue (
+        id TEXT PRIMARY KEY,
+        priority INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        post_time TEXT,
+        enqueued_at TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        leased_until REAL,
+        lease_owner TEXT
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_analysis_queue_rank ON analysis_queue (priority, post_time DESC)")
+
+
+def m008_stats_rollups(c):
+    # Aggregates behind /stats, kept current by triggers on facebook_posts so
+    # reading them never scans the posts. They count every post ever stored:
+    # rows moved to the archive by retention are not subtracted.
+    c.execute("CREATE TABLE IF NOT EXISTS stats_status (status TEXT PRIMARY KEY, n INTEGER NOT NULL DEFAULT 0)")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS stats_group (
+        input_url TEXT PRIMARY KEY,
+        posts INTEGER NOT NULL DEFAULT 0,
+        classified INTEGER NOT NULL DEFAULT 0,
+        accepted INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    # By hour of the post time ('YYYY-MM-DDTHH')
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS stats_hourly (
+        hour TEXT PRIMARY KEY,
+        posts INTEGER NOT NULL DEFAULT 0,
+        classified INTEGER NOT NULL DEFAULT 0,
+        accepted INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    # By hour of the LLM call, written by DB.record_llm_call
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS stats_llm (
+        hour TEXT PRIMARY KEY,
+        calls INTEGER NOT NULL DEFAULT 0,
+        errors INTEGER NOT NULL DEFAULT 0,
+        total_ms REAL NOT NULL DEFAULT 0,
+        max_ms REAL NOT NULL DEFAULT 0
+    )
+    """)
+
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_post_insert AFTER INSERT ON facebook_posts
+    BEGIN
+        INSERT INTO stats_status (status, n) VALUES (COALESCE(NEW.status, 'PENDING'), 1)
+            ON CONFLICT(status) DO UPDATE SET n = n + 1;
+        INSERT INTO stats_group (input_url, posts, classified, accepted)
+            VALUES (COALESCE(NEW.inputUrl, ''), 1, NEW.status IS NOT NULL, COALESCE(NEW.status = 'ACCETTATO', 0))
+            ON CONFLICT(input_url) DO UPDATE SET posts = posts + 1,
+                classified = classified + excluded.classified, accepted = accepted + excluded.accepted;
+        INSERT INTO stats_hourly (hour, posts, classified, accepted)
+            SELECT substr(NEW.time, 1, 13), 1, NEW.status IS NOT NULL, COALESCE(NEW.status = 'ACCETTATO', 0)
+            WHERE NEW.time IS NOT NULL
+            ON CONFLICT(hour) DO UPDATE SET posts = posts + 1,
+                classified = classified + excluded.classified, accepted = accepted + excluded.accepted;
+    END
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_stats_post_status AFTER UPDATE OF status ON facebook_posts
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+        UPDATE stats_status SET n = n - 1 WHERE status = COALESCE(OLD.status, 'PENDING');
+        INSERT INTO stats_status (status, n) VALUES (COALESCE(NEW.status, 'PENDING'), 1)
+            ON CONFLICT(status) DO UPDATE SET n = n + 1;
+        UPDATE stats_group SET
+            classified = classified + (NEW.status IS NOT NULL) - (OLD.status IS NOT NULL),
+            accepted = accepted + COALESCE(NEW.status = 'ACCETTATO', 0) - COALESCE(OLD.status = 'ACCETTATO', 0)
+            WHERE input_url = COALESCE(NEW.inputUrl, '');
+        UPDATE stats_hourly SET
+            classified = classified + (NEW.status IS NOT NULL) - (OLD.status IS NOT NULL),
+            accepted = accepted + COALESCE(NEW.status = 'ACCETTATO', 0) - COALESCE(OLD.status = 'ACCETTATO', 0)
+            WHERE hour = substr(NEW.time, 1, 13);
+    END
+    """)
+
+    # Backfill from the posts stored so far (one full scan, at migration time only)
+    c.execute("DELETE FROM stats_status")
+    c.execute("DELETE FROM stats_group")
+    c.execute("DELETE FROM stats_hourly")
+    c.execute("INSERT INTO stats_status (status, n) "
+              "SELECT COALESCE(status, 'PENDING'), count(*) FROM facebook_posts GROUP BY 1")
+    c.execute("INSERT INTO stats_group (input_url, posts, classified, accepted) "
+              "SELECT COALESCE(inputUrl, ''), count(*), count(status), sum(COALESCE(status = 'ACCETTATO', 0)) "
+              "FROM facebook_posts GROUP BY 1")
+    c.execute("INSERT INTO stats_hourly (hour, posts, classified, accepted) "
+              "SELECT substr(time, 1, 13), count(*), count(status), sum(COALESCE(status = 'ACCETTATO', 0)) "
+              "FROM facebook_posts WHERE time IS NOT NULL GROUP BY 1")
+
+
+def m009_webhooks(c):
+    # Webhook subscribers and the persistent outbox drained by
+    # backend/webhooks.py (one row per payload and target url)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS webhook_subscribers (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL UNIQUE,
+        secret TEXT,
+        active INTEGER NOT NULL DEFAULT 1,
+        created_at TEXT NOT NULL
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS webhook_outbox (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL,
+        secret TEXT,
+        payload TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        leased_until REAL,
+        last_error TEXT,
+        delivered_at TEXT,
+        latency_ms REAL
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_webhook_outbox_due ON webhook_outbox (next_attempt_at) "
+              "WHERE status = 'pending'")
+
+
+def m010_profile_results(c):
+    # Verdict of every search profile (backend/profiles.py) for each post
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS profile_results (
+        id TEXT NOT NULL,
+        profile TEXT NOT NULL,
+        status TEXT,
+        motivation TEXT,
+        analyzed_at TEXT NOT NULL,
+        PRIMARY KEY (id, profile)
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_profile_results_profile ON profile_results (profile, status)")
+
+
+def m011_post_embeddings(c):
+    # int8 sentence embeddings of posts (backend/embeddings.py), per model
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS post_embeddings (
+        id TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        vec BLOB NOT NULL,
+        embedded_at TEXT NOT NULL
+    )
+    """)
+
+
+def m012_attachments(c):
+    # Every attachment of a post (facebook_posts.attachments keeps only the
+    # first url) and the local thumbnail cache of backend/attachments.py.
+    # Attachments stay 'new' until their post is promoted, then 'pending'
+    # until fetched; `thumb` is the cache file name, "<sha256 of the original
+    # image>.<ext>", shared by duplicates
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS post_attachments (
+        id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        url TEXT NOT NULL,
+        kind TEXT,
+        status TEXT NOT NULL DEFAULT 'new',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        leased_until REAL,
+        last_error TEXT,
+        thumb TEXT,
+        PRIMARY KEY (id, position)
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_post_attachments_pending ON post_attachments (next_attempt_at) "
+              "WHERE status = 'pending'")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_post_attachments_thumb ON post_attachments (thumb)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_post_attachments_url ON post_attachments (url)")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS thumb_cache (
+        name TEXT PRIMARY KEY,
+        bytes INTEGER NOT NULL,
+        content_type TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        last_access REAL NOT NULL
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_thumb_cache_lru ON thumb_cache (last_access)")
+    # Posts inserted before this version only kept their first attachment url.
+    # For group-scraper posts that is the photo page, not an image: only urls that
+    # look like images are backfilled, the others keep linking the original url
+    c.execute("""
+    INSERT OR IGNORE INTO post_attachments (id, position, url)
+    SELECT id, 0, attachments FROM facebook_posts
+    WHERE attachments LIKE 'http%' AND (
+        attachments LIKE '%.fbcdn.net/%' OR lower(attachments) LIKE '%.jpg%' OR lower(attachments) LIKE '%.jpeg%'
+        OR lower(attachments) LIKE '%.png%' OR lower(attachments) LIKE '%.gif%' OR lower(attachments) LIKE '%.webp%')
+    """)
+    c.execute("UPDATE post_attachments SET status = 'pending' WHERE id IN (SELECT id FROM good_facebook_posts)")
+
+
+def m013_decode_failures(c):
+    # Posts whose LLM reply could not be decoded even after a retry stop at
+    # stage 'failed' (see backend/decoding.py) instead of being re-analyzed
+    # by every backlog run; decoding outcomes are rolled up with LLM calls
+    _add_column(c, "facebook_posts", "analysis_error", "TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_facebook_posts_failed ON facebook_posts (stage) WHERE stage = 'failed'")
+    _add_column(c, "stats_llm", "repaired", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(c, "stats_llm", "retries", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(c, "stats_llm", "decode_failures", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(c, "stats_llm", "wasted_ms", "REAL NOT NULL DEFAULT 0")
+
+
+def m014_run_profiles(c):
+    # Opt-in CPU/wall/memory profiles of runs and requests (backend/profiling.py)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS run_profiles (
+        id INTEGER PRIMARY KEY,
+        run_id INTEGER,
+        kind TEXT NOT NULL,
+        label TEXT,
+        created_at TEXT NOT NULL,
+        wall_s REAL,
+        cpu_s REAL,
+        peak_kb REAL,
+        summary TEXT
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS profile_artifacts (
+        profile_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        data BLOB NOT NULL,
+        PRIMARY KEY (profile_id, name)
+    )
+    """)
+    _add_column(c, "pipeline_runs", "profile_id", "INTEGER")
+
+
+def m015_pipeline_jobs(c):
+    # Durable job queue of worker mode (backend/workers.py): scrape and notify
+    # jobs leased by separate processes, which heartbeat in `workers`
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        key TEXT,
+        payload TEXT,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        not_before REAL NOT NULL DEFAULT 0,
+        lease_owner TEXT,
+        leased_until REAL,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT,
+        result TEXT,
+        error TEXT
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (kind, not_before) WHERE status = 'queued'")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_leased ON jobs (lease_owner) WHERE status = 'running'")
+    # At most one open job per (kind, key): a post is notified once, scrapes do not pile up
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_open_key ON jobs (kind, key) "
+              "WHERE key IS NOT NULL AND status IN ('queued', 'running')")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at) WHERE status IN ('done', 'failed')")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS workers (
+        owner TEXT PRIMARY KEY,
+        role TEXT NOT NULL,
+        pid INTEGER,
+        host TEXT,
+        started_at TEXT NOT NULL,
+        heartbeat_at REAL NOT NULL
+    )
+    """)
+    # Process that opened the run, so a live process's runs are not marked interrupted
+    _add_column(c, "pipeline_runs", "owner", "TEXT")
+
+
+def m016_post_seq(c):
+    # Change sequence for incremental reads (/posts?since=): every insert, analysis
+    # or thumbnail change gives the row the next `seq` of its table
+    for table in ("facebook_posts", "good_facebook_posts"):
+        _add_column(c, table, "seq", "INTEGER")
+        c.execute(f"UPDATE {table} SET seq = rowid WHERE seq IS NULL")
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_seq ON {table} (seq)")
+        c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_seq_insert AFTER INSERT ON {table}
+        BEGIN
+            UPDATE {table} SET seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM {table}) WHERE rowid = NEW.rowid;
+        END
+        """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_facebook_posts_seq_update AFTER UPDATE OF status, motivo ON facebook_posts
+    WHEN OLD.status IS NOT NEW.status OR OLD.motivo IS NOT NEW.motivo
+    BEGIN
+        UPDATE facebook_posts SET seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM facebook_posts) WHERE rowid = NEW.rowid;
+    END
+    """)
+    # A thumbnail cached or evicted changes the `thumb` of the post in both tables
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_post_attachments_seq AFTER UPDATE OF status ON post_attachments
+    WHEN NEW.status IN ('done', 'evicted') AND OLD.status IS NOT NEW.status
+    BEGIN
+        UPDATE facebook_posts SET seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM facebook_posts) WHERE id = NEW.id;
+        UPDATE good_facebook_posts SET seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM good_facebook_posts)
+            WHERE id = NEW.id;
+    END
+    """)
+
+
+def m017_change_counters(c):
+    # MAX(seq) + 1 went back down when the row holding the max was deleted
+    # (e.g. archived by retention), handing out a cursor value clients had
+    # already passed. One counter per table that only ever increases instead
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS change_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """)
+    for table in ("facebook_posts", "good_facebook_posts"):
+        c.execute(f"INSERT OR IGNORE INTO change_counters (name, value) SELECT '{table}', COALESCE(MAX(seq), 0) "
+                  f"FROM {table}")
+        c.execute(f"DROP TRIGGER IF EXISTS trg_{table}_seq_insert")
+        c.execute(f"""
+        CREATE TRIGGER trg_{table}_seq_insert AFTER INSERT ON {table}
+        BEGIN
+            UPDATE change_counters SET value = value + 1 WHERE name = '{table}';
+            UPDATE {table} SET seq = (SELECT value FROM change_counters WHERE name = '{table}')
+                WHERE rowid = NEW.rowid;
+        END
+        """)
+    c.execute("DROP TRIGGER IF EXISTS trg_facebook_posts_seq_update")
+    c.execute("""
+    CREATE TRIGGER trg_facebook_posts_seq_update AFTER UPDATE OF status, motivo ON facebook_posts
+    WHEN OLD.status IS NOT NEW.status OR OLD.motivo IS NOT NEW.motivo
+    BEGIN
+        UPDATE change_counters SET value = value + 1 WHERE name = 'facebook_posts';
+        UPDATE facebook_posts SET seq = (SELECT value FROM change_counters WHERE name = 'facebook_posts')
+            WHERE rowid = NEW.rowid;
+    END
+    """)
+    c.execute("DROP TRIGGER IF EXISTS trg_post_attachments_seq")
+    c.execute("""
+    CREATE TRIGGER trg_post_attachments_seq AFTER UPDATE OF status ON post_attachments
+    WHEN NEW.status IN ('done', 'evicted') AND OLD.status IS NOT NEW.status
+    BEGIN
+        UPDATE change_counters SET value = value + 1 WHERE name = 'facebook_posts';
+        UPDATE facebook_posts SET seq = (SELECT value FROM change_counters WHERE name = 'facebook_posts')
+            WHERE id = NEW.id;
+        UPDATE change_counters SET value = value + 1 WHERE name = 'good_facebook_posts'
+            AND EXISTS (SELECT 1 FROM good_facebook_posts WHERE id = NEW.id);
+        UPDATE good_facebook_posts SET seq = (SELECT value FROM change_counters WHERE name = 'good_facebook_posts')
+            WHERE id = NEW.id;
+    END
+    """)
+
+
+MIGRATIONS = [
+    (1, "base_tables", m001_base_tables),
+    (2, "scheduler_time_of_day", m002_scheduler_time_of_day),
+    (3, "listing_fields", m003_listing_fields),
+    (4, "archived_ids", m004_archived_ids),
+    (5, "post_indexes", m005_post_indexes),
+    (6, "pipeline_checkpoints", m006_pipeline_checkpoints),
+    (7, "analysis_queue", m007_analysis_queue),
+    (8, "stats_rollups", m008_stats_rollups),
+    (9, "webhooks", m009_webhooks),
+    (10, "profile_results", m010_profile_results),
+    (11, "post_embeddings", m011_post_embeddings),
+    (12, "attachments", m012_attachments),
+    (13, "decode_failures", m013_decode_failures),
+    (14, "run_profiles", m014_run_profiles),
+    (15, "pipeline_jobs", m015_pipeline_jobs),
+    (16, "post_seq", m016_post_seq),
+    (17, "change_counters", m017_change_counters),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    try:
+        row = conn.execute("SELECT max(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def _ensure_version_table(c):
+    cols = _columns(c, "schema_version")
+    if cols and "name" not in cols:
+        # Single-row table written before migrations were versioned one by
+        # one; every step is idempotent so simply replay them all
+        c.execute("DROP TABLE schema_version")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )
+    """)
+
+
+def migrate(conn):
+    """Apply pending migrations. Returns the list of versions applied."""
+    if current_version(conn) >= LATEST_VERSION:
+        return []
+
+    conn.commit()
+    c = conn.cursor()
+    applied = []
+    try:
+        # IMMEDIATE takes the write lock up front so concurrent processes
+        # opening the same file migrate one at a time
+        c.execute("BEGIN IMMEDIATE")
+        _ensure_version_table(c)
+        done = {r[0] for r in c.execute("SELECT version FROM schema_version").fetchall()}
+        for version, name, step in MIGRATIONS:
+            if version in done:
+                continue
+            step(c)
+            c.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                      (version, name, datetime.now().strftime('%Y-%m-%dT%H:%M:%S.000')))
+            applied.append(version)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        logging.exception('Schema migration failed; database left at version %d', current_version(conn))
+        raise
+    finally:
+        c.close()
+    if applied:
+        logging.info('Applied schema migrations %s (now at version %d)', applied, LATEST_VERSION)
+    return applied
@@ -0,0 +1,120 @@
+"""Background threads draining a queue kept in the DB: the webhook outbox
+(webhooks.py), pending attachments (attachments.py) and worker-mode jobs
+(workers.py).
+
+A PollingWorker opens its own DB connection in its thread and writes every
+result from that thread, so the connection is never shared with the pool
+doing the network calls. It calls `run_once(db)` while there is work, purges
+finished entries hourly and then sleeps until `next_due(db)`, `poll_interval`
+at most, or until `wake()`. Failed entries are retried after `backoff()`.
+"""
+import abc
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.database import DB
+
+logging.basicConfig(level=logging.INFO)
+
+PURGE_INTERVAL = 3600
+
+
+def backoff(attempts, base, cap, factor=2):
+    """Delay before the next attempt after `attempts` failures: `base` seconds,
+    times `factor` for every further failure up to `cap`, with jitter.
+    """
+    return min(cap, base * factor ** (attempts - 1)) * random.uniform(0.8, 1.2)
+
+
+class PollingWorker(threading.Thread, abc.ABC):
+    """Runs `run_once` whenever entries are due. Call `wake()` after queueing some.
+    `counters` names the outcomes counted in `stats()`.
+    """
+    counters = ()
+
+    def __init__(self, name, db_path=None, poll_interval=30.0):
+        super().__init__(name=name, daemon=True)
+        self.db_path = db_path or os.getenv('DB_PATH', 'facebook_posts.db')
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.counters, 0)
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def count(self, key, n=1):
+        with self._lock:
+            self._counters[key] += n
+
+    @abc.abstractmethod
+    def run_once(self, db):
+        """Process due entries. Returns how many were processed."""
+
+    @abc.abstractmethod
+    def next_due(self, db):
+        """Epoch seconds when the next entry is due, or None."""
+
+    def purge(self, db):
+        """Delete old finished entries; called hourly."""
+
+    def close(self):
+        """Release what the worker holds besides its DB connection."""
+
+    def run(self):
+        db = DB(path=self.db_path)
+        last_purge = 0.0
+        try:
+            while not self._stop_event.is_set():
+                self._wake.clear()
+                try:
+                    if self.run_once(db):
+                        continue
+                    if time.time() - last_purge > PURGE_INTERVAL:
+                        self.purge(db)
+                        last_purge = time.time()
+                    due = self.next_due(db)
+                except Exception as e:
+                    logging.exception('%s: %s', self.name, e)
+                    due = None
+                wait = self.poll_interval if due is None else min(self.poll_interval, max(0.0, due - time.time()))
+                self._wake.wait(wait)
+        finally:
+            self.close()
+            db.close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+class HttpWorker(PollingWorker):
+    """PollingWorker making up to `concurrency` requests at once on `pool`,
+    through one keep-alive `session`.
+    """
+
+    def __init__(self, name, concurrency, **kwargs):
+        super().__init__(name, **kwargs)
+        self.concurrency = concurrency
+        self.session = requests.Session()
+        # One keep-alive connection per concurrent request and host
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=name)
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,121 @@
+"""Post text normalization applied before a post is sent to the LLM.
+
+Facebook posts carry a lot of text the classifier does not need: hashtag
+tails, emoji runs, tracking URLs, phone numbers and contact signatures. They
+all cost prompt tokens and latency. `normalize_post_text` removes them and
+then caps the text to a token budget, keeping the lines that mention price
+or location first.
+"""
+import os
+import re
+
+# Rough estimate for Italian text with llama-style tokenizers
+CHARS_PER_TOKEN = 4
+
+URL_RE = re.compile(r'(https?://|www\.)\S+', re.IGNORECASE)
+EMAIL_RE = re.compile(r'\b[\w.+-]+@[\w-]+\.[\w.-]+\b')
+# +39 333 1234567, 333-123-4567, 011 1234567 ... (at least 8 digits). Dots and
+# slashes are not accepted as separators, and dashed dates (01-09-2025,
+# 2025-09-01) are skipped, so availability dates survive.
+PHONE_RE = re.compile(
+    r'(?<![\w€])(?<!\d-)'
+    r'(?!\d{1,2}-\d{1,2}-\d{2,4}(?![\w€-])|\d{4}-\d{1,2}-\d{1,2}(?![\w€-]))'
+    r'(?:\+|00)?\d(?:[\s-]?\d){7,}(?![\w€])')
+HASHTAG_TAIL_RE = re.compile(r'(?:\s*#\w+)+\s*$')
+HASHTAG_RE = re.compile(r'#(\w+)')
+# Emoji, pictographs, dingbats, variation selectors and zero width joiners
+EMOJI_RE = re.compile(
+    '[\U0001F000-\U0001FAFF\U00002600-\U000027BF\U0001F900-\U0001F9FF'
+    '\U00002B00-\U00002BFF\U0000FE0F\U0000200D\U000020E3]+'
+)
+REPEAT_PUNCT_RE = re.compile(r'([!?.*_~=\-])\1{2,}')
+SPACES_RE = re.compile(r'[ \t ]+')
+BLANK_LINES_RE = re.compile(r'\n{2,}')
+PLACEHOLDER_ONLY_RE = re.compile(r'^(?:<url>|<email>|<tel>|[\s,;:.|/-])*$')
+
+BOILERPLATE_RE = re.compile(
+    r'^\s*(?:'
+    r'per (?:info|informazioni|contatti)|contattami|contattatemi|scrivimi|scrivetemi'
+    r'|chiamare|chiamate|whatsapp|tel\b|telefono|cell\b|cellulare|no perditempo'
+    r'|astenersi|grazie(?: mille)?(?: a tutti)?[.!]*$|condividete|share'
+    r')',
+    re.IGNORECASE,
+)
+
+PRICE_RE = re.compile(r'(€|\beur\b|\beuro\b|\d+e\b|affitto|canone|spese|prezzo|\bmese\b|mensil)', re.IGNORECASE)
+LOCATION_RE = re.compile(
+    r'\b(via|corso|c\.so|piazza|p\.zza|largo|zona|quartiere|vicino|metro|fermata|'
+    r'politecnico|universit|campus|centro|torino|stazione)\b',
+    re.IGNORECASE,
+)
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+
+def normalize_post_text(text, max_tokens=None):
+    """Return a cleaned, length-capped version of a post text."""
+    if not text:
+        return ""
+    if max_tokens is None:
+        max_tokens = int(os.getenv('PROMPT_MAX_TOKENS', '400'))
+
+    text = URL_RE.sub('<url>', text)
+    text = EMAIL_RE.sub('<email>', text)
+    text = PHONE_RE.sub('<tel>', text)
+    text = HASHTAG_TAIL_RE.sub('', text)
+    text = HASHTAG_RE.sub(r'\1', text)
+    text = EMOJI_RE.sub(' ', text)
+    text = REPEAT_PUNCT_RE.sub(r'\1', text)
+
+    lines = []
+    for line in text.replace('\r', '\n').split('\n'):
+        line = SPACES_RE.sub(' ', line).strip()
+        if not line or PLACEHOLDER_ONLY_RE.match(line):
+            continue
+        # Drop contact/closing lines unless they also carry a price or place
+        if BOILERPLATE_RE.match(line) and not PRICE_RE.search(line) and not LOCATION_RE.search(line):
+            continue
+        if lines and lines[-1] == line:
+            continue
+        lines.append(line)
+    text = BLANK_LINES_RE.sub('\n', '\n'.join(lines))
+
+    return truncate_to_budget(text, max_tokens)
+
+
+def truncate_to_budget(text, max_tokens):
+    """Cap `text` to about `max_tokens`, favouring price and location lines.
+
+    The opening lines are kept in order (they usually say what is offered),
+    then lines mentioning price or location, then the rest, until the budget
+    is spent. The kept lines are emitted in their original order.
+    """
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens * CHARS_PER_TOKEN
+    lines = text.split('\n')
+
+    def rank(i):
+        line = lines[i]
+        if i < 2:
+            return 0
+        if PRICE_RE.search(line) or LOCATION_RE.search(line):
+            return 1
+        return 2
+
+    keep = set()
+    used = 0
+    for i in sorted(range(len(lines)), key=lambda i: (rank(i), i)):
+        cost = len(lines[i]) + 1
+        if used + cost > budget:
+            remaining = budget - used
+            if rank(i) < 2 and remaining > 40:
+                lines[i] = lines[i][:remaining - 1].rstrip() + '…'
+                keep.add(i)
+            # Never let a lower priority line take the place of this one
+            break
+        keep.add(i)
+        used += cost
+    return '\n'.join(lines[i] for i in sorted(keep))
@@ -0,0 +1,142 @@
+"""Named search profiles: several searches served by one scraper and one LLM pass.
+
+Profiles are read from PROFILES_PATH (default `backend/profiles.json`), a list
+of objects:
+
+    [{"name": "torino_singola",
+      "sources": ["https://www.facebook.com/groups/341062699352334/"],
+      "criteria": "1. Camera singola o intero appartamento\\n2. Prezzo inferiore a 600 €",
+      "telegram_chat_id": "123456",
+      "webhook": "https://example.com/hook"}]
+
+- sources: group urls to scrape; the scraper gets the union of all profiles,
+  each url once. A post is evaluated against the profiles listing its group
+  (all profiles when no profile lists it or the scraper gives no group).
+- criteria: the profile's acceptance criteria, inserted into
+  `prompt_profiles.md`; everything else in the prompt is shared.
+- telegram_chat_id / webhook: where accepted posts are notified (default:
+  TELEGRAM_CHAT_ID, and only the global webhooks).
+
+Without a profiles file there is one implicit `default` profile built from
+`prompt.md`, `urls_to_scrape.json` and TELEGRAM_CHAT_ID, and analysis works
+exactly as before.
+"""
+import json
+import os
+import re
+import threading
+from typing import Optional
+
+from pydantic import BaseModel, field_validator
+
+DEFAULT_PROFILE = 'default'
+PROFILE_NAME_RE = re.compile(r'^[A-Za-z][A-Za-z0-9_]*$')
+# Profile names become fields of the analyzer's output model: they cannot shadow BaseModel attributes
+RESERVED_NAMES = frozenset(dir(BaseModel))
+
+_cache = {}
+_lock = threading.Lock()
+
+
+class Profile(BaseModel):
+    name: str
+    sources: list[str] = []
+    criteria: str = ''
+    telegram_chat_id: Optional[str] = None
+    webhook: Optional[str] = None
+
+    @field_validator('name')
+    @classmethod
+    def _valid_name(cls, v):
+        if not PROFILE_NAME_RE.match(v) or v.startswith('model_'):
+            raise ValueError(f"Invalid profile name {v!r}: use letters, digits and underscores")
+        if v in RESERVED_NAMES:
+            raise ValueError(f"Invalid profile name {v!r}: reserved word, choose another name")
+        return v
+
+    @field_validator('sources', mode='before')
+    @classmethod
+    def _source_urls(cls, v):
+        # Same shape as urls_to_scrape.json is accepted too
+        return [s['url'] if isinstance(s, dict) else s for s in (v or [])]
+
+    @field_validator('telegram_chat_id', mode='before')
+    @classmethod
+    def _chat_id_str(cls, v):
+        return str(v) if v is not None else None
+
+
+def _norm_url(url):
+    return url.strip().rstrip('/').lower()
+
+
+def default_profile():
+    with open('./backend/urls_to_scrape.json', 'r') as f:
+        sources = json.load(f)
+    return Profile(name=DEFAULT_PROFILE, sources=sources, telegram_chat_id=os.getenv('TELEGRAM_CHAT_ID'))
+
+
+def load_profiles(path=None):
+    """Configured profiles. The file is re-read when it changes."""
+    path = path or os.getenv('PROFILES_PATH', 'backend/profiles.json')
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    with _lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        if mtime is None:
+            profiles = [default_profile()]
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                profiles = [Profile.model_validate(p) for p in json.load(f)]
+            # Replies are matched to profiles case-insensitively (decoding.normalize)
+            names = [p.name.lower() for p in profiles]
+            if not profiles or len(set(names)) != len(names):
+                raise ValueError(f"{path}: profiles must be a non-empty list with unique names "
+                                 "(case-insensitive)")
+        _cache[path] = (mtime, profiles)
+        return profiles
+
+
+def is_legacy(profiles):
+    """True for the implicit default profile, analyzed with prompt.md."""
+    return len(profiles) == 1 and profiles[0].name == DEFAULT_PROFILE and not profiles[0].criteria
+
+
+def scrape_urls(profiles):
+    """Union of the profiles' sources, each group once, in first-seen order."""
+    seen = set()
+    urls = []
+    for p in profiles:
+        for url in p.sources:
+            if _norm_url(url) not in seen:
+                seen.add(_norm_url(url))
+                urls.append(url)
+    return urls
+
+
+def profiles_for_item(profiles, item):
+    """Profiles a post is evaluated against, based on the group it came from."""
+    source = item.get('inputUrl')
+    if not source:
+        return profiles
+    matched = [p for p in profiles if not p.sources or _norm_url(source) in {_norm_url(s) for s in p.sources}]
+    return matched or profiles
+
+
+def notification_targets(accepted, profiles):
+    """Group the profiles that accepted a post by Telegram chat.
+    Returns [(chat_id or None for the default chat, [profile names])].
+    Posts without per-profile results go to the default chat.
+    """
+    if not accepted:
+        return [(None, [])]
+    by_name = {p.name: p for p in profiles}
+    targets = {}
+    for name in accepted:
+        p = by_name.get(name)
+        targets.setdefault(p.telegram_chat_id if p else None, []).append(name)
+    return list(targets.items())
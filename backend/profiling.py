@@ -0,0 +1,307 @@
+"""Opt-in CPU, wall-clock and memory profiles of pipeline runs and requests.
+
+Enabled per run with PROFILE=1 (every run_pipeline / analyze_pending), with
+`profile=True` on those functions or `?profile=1` on /run_now and
+/analyze_pending; any other server request is profiled with `?profiling=1`
+(/posts already has a `profile` parameter). When disabled the only cost is
+reading the flag.
+
+A RunProfile captures, for as long as it is active:
+- cpu.prof / cpu.txt: cProfile of the calling thread, or for a request of
+  the thread running its endpoint (binary pstats for snakeviz or
+  `python -m pstats`, and the top functions by cumulative time);
+- wall.txt / wall.folded: call trees of every thread from a stack sampler
+  (PROFILE_INTERVAL_MS, default 5 ms), pyinstrument-style, so time spent in
+  analysis workers, thread pools or waiting on the LLM shows up too; the
+  .folded file loads in speedscope or flamegraph.pl;
+- memory.txt: tracemalloc peak, the top allocation sites at the end of the run
+  and the growth since its start.
+
+Profiles are saved in `run_profiles` / `profile_artifacts`, linked from the
+run's `pipeline_runs.profile_id`; the newest PROFILE_KEEP (default 20) are kept.
+Only one profile is recorded at a time: tracemalloc and the profiler hooks are
+process-wide.
+
+Sync endpoints run in FastAPI's threadpool, where a profiler enabled by the
+middleware on the event loop thread never sees them: routes declared with
+ProfiledRoute turn it on in the thread that runs the endpoint.
+"""
+import contextlib
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import json
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from fastapi.routing import APIRoute
+
+logging.basicConfig(level=logging.INFO)
+
+TOP_FUNCTIONS = 50
+TOP_ALLOCATIONS = 30
+MAX_TREE_LINES = 400
+
+_busy = threading.Lock()
+# The profile of the request being handled, for ProfiledRoute
+_request_profile = contextvars.ContextVar('request_profile', default=None)
+
+
+def enabled(flag=None):
+    """`flag` when given, else the PROFILE env variable."""
+    if flag is not None:
+        return bool(flag)
+    return os.getenv('PROFILE', '0') == '1'
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ])
+
+
+class StackSampler(threading.Thread):
+    """Samples the stacks of all other threads every `interval` seconds."""
+
+    def __init__(self, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.interval = interval
+        self.samples = Counter()
+        self.count = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[tuple(reversed(stack))] += 1
+            self.count += 1
+
+    def folded(self):
+        """Collapsed stacks, one "frame;frame;frame count" line each."""
+        return "\n".join(f"{';'.join(stack)} {n}" for stack, n in self.samples.most_common()) + "\n"
+
+    def tree(self):
+        """Indented call tree per thread with the share of samples of each node."""
+        root = {}
+        for stack, n in self.samples.items():
+            node = root
+            for frame in stack:
+                child = node.setdefault(frame, [0, {}])
+                child[0] += n
+                node = child[1]
+        lines = [f"{self.count} samples every {self.interval * 1000:g} ms"]
+
+        def walk(node, depth):
+            for frame, (n, children) in sorted(node.items(), key=lambda kv: -kv[1][0]):
+                if len(lines) >= MAX_TREE_LINES:
+                    return
+                share = n / self.count * 100 if self.count else 0
+                if depth and share < 1:
+                    continue
+                lines.append(f"{'  ' * depth}{share:5.1f}%  {frame}")
+                walk(children, depth + 1)
+        walk(root, 0)
+        return "\n".join(lines) + "\n"
+
+
+class RunProfile():
+    """Context manager recording one profile; a no-op unless `active`.
+
+    Call `attach(db, run_id)` inside the block to save the profile with that
+    run when the block exits (also on errors). With `cpu_on_enter=False` the
+    CPU profiler only runs inside `cpu_here()` blocks, in their thread.
+    """
+
+    def __init__(self, active=True, kind='run', label=None, cpu_on_enter=True):
+        self.active = active
+        self.kind = kind
+        self.label = label
+        self.cpu_on_enter = cpu_on_enter
+        self.db = None
+        self.run_id = None
+        self.profile_id = None
+
+    def attach(self, db, run_id=None):
+        self.db = db
+        if run_id is not None:
+            self.run_id = run_id
+
+    @contextlib.contextmanager
+    def cpu_here(self):
+        """Run the CPU profiler in the current thread for the block."""
+        if not self.active or self.cpu_on_enter:
+            yield
+            return
+        self._cpu.enable()
+        try:
+            yield
+        finally:
+            self._cpu.disable()
+
+    def __enter__(self):
+        if self.active and not _busy.acquire(blocking=False):
+            logging.warning('Another profile is being recorded; not profiling %s %s', self.kind, self.label or '')
+            self.active = False
+        if not self.active:
+            return self
+        self._traced = tracemalloc.is_tracing()
+        if not self._traced:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._mem_start = _snapshot()
+        self._sampler = StackSampler(float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000)
+        self._sampler.start()
+        self._cpu = cProfile.Profile()
+        self._t0 = time.perf_counter()
+        self._c0 = time.process_time()
+        if self.cpu_on_enter:
+            self._cpu.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.active:
+            return False
+        try:
+            if self.cpu_on_enter:
+                self._cpu.disable()
+            wall = time.perf_counter() - self._t0
+            cpu = time.process_time() - self._c0
+            self._sampler.stop()
+            mem_end = _snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if not self._traced:
+                tracemalloc.stop()
+            summary, artifacts = self._report(wall, cpu, peak, mem_end, exc)
+            if self.db is not None:
+                self.profile_id = self.db.save_profile(
+                    self.run_id, self.kind, self.label, wall, cpu, peak / 1024, summary, artifacts,
+                    keep=int(os.getenv('PROFILE_KEEP', '20')))
+                logging.info('Saved profile %s of %s %s (%.2fs wall, %.2fs CPU)', self.profile_id, self.kind,
+                             self.label or self.run_id or '', wall, cpu)
+            else:
+                logging.warning('Profile of %s %s not saved: no database attached', self.kind, self.label or '')
+        except Exception as e:
+            logging.exception('Failed to save profile: %s', e)
+        finally:
+            _busy.release()
+        return False
+
+    def _report(self, wall, cpu, peak, mem_end, exc):
+        stats = pstats.Stats(self._cpu)
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+
+        growth = mem_end.compare_to(self._mem_start, 'lineno')[:TOP_ALLOCATIONS]
+        memory = [f"peak traced memory: {peak / 2 ** 20:.1f} MB", "", "Largest allocation sites at the end:"]
+        memory += [str(s) for s in mem_end.statistics('lineno')[:TOP_ALLOCATIONS]]
+        memory += ["", "Growth since the start:"] + [str(s) for s in growth]
+
+        top = sorted(stats.stats.items(), key=lambda kv: -kv[1][3])[:10]
+        summary = {
+            'wall_s': round(wall, 3),
+            'cpu_s': round(cpu, 3),
+            'peak_mb': round(peak / 2 ** 20, 2),
+            'samples': self._sampler.count,
+            'error': repr(exc) if exc else None,
+            'top_cumulative': [{'function': f"{name} ({os.path.basename(file)}:{line})", 'cumulative_s': round(ct, 3),
+                                'calls': nc} for (file, line, name), (_, nc, _, ct, _) in top],
+        }
+        artifacts = {
+            # What cProfile's dump_stats writes, loadable with pstats.Stats(path)
+            'cpu.prof': marshal.dumps(stats.stats),
+            'cpu.txt': text.getvalue().encode('utf-8'),
+            'wall.txt': self._sampler.tree().encode('utf-8'),
+            'wall.folded': self._sampler.folded().encode('utf-8'),
+            'memory.txt': ("\n".join(memory) + "\n").encode('utf-8'),
+        }
+        return json.dumps(summary), artifacts
+
+
+def profiled(flag=None, kind='run', label=None):
+    """RunProfile that records only if `flag` (or PROFILE=1) asks for it."""
+    return RunProfile(enabled(flag), kind=kind, label=label)
+
+
+CONTENT_TYPES = {'.prof': 'application/octet-stream', '.txt': 'text/plain; charset=utf-8',
+                 '.folded': 'text/plain; charset=utf-8'}
+
+
+class ProfilingMiddleware():
+    """ASGI middleware profiling requests that carry `profiling=1`. Other requests
+    go straight through; `skip` paths profile their own run instead.
+    `get_db` returns the DB the profiles are saved to.
+    """
+
+    def __init__(self, app, get_db, skip=()):
+        self.app = app
+        self.get_db = get_db
+        self.skip = set(skip)
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http' or scope['path'] in self.skip
+                or b'profiling=1' not in scope.get('query_string', b'').split(b'&')):
+            return await self.app(scope, receive, send)
+        with RunProfile(kind='request', label=f"{scope['method']} {scope['path']}", cpu_on_enter=False) as prof:
+            prof.attach(self.get_db())
+            token = _request_profile.set(prof)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _request_profile.reset(token)
+
+
+def _in_request_profile(endpoint):
+    """`endpoint` running under the CPU profiler of the current request, if any."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            prof = _request_profile.get()
+            if prof is None:
+                return await endpoint(*args, **kwargs)
+            with prof.cpu_here():
+                return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            prof = _request_profile.get()
+            if prof is None:
+                return endpoint(*args, **kwargs)
+            with prof.cpu_here():
+                return endpoint(*args, **kwargs)
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute whose endpoint is CPU-profiled, in the thread running it, when
+    ProfilingMiddleware records the request. Set as the app's route_class.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _in_request_profile(endpoint), **kwargs)
@@ -0,0 +1,147 @@
+"""Retention for facebook_posts: archive old classified posts, vacuum the DB.
+
+Classified posts older than RETENTION_DAYS are copied into a separate archive
+SQLite file (ARCHIVE_DB_PATH, default `<DB_PATH stem>.archive.db`) together
+with their good_facebook_posts, listing_fields, profile_results,
+post_embeddings and post_attachments rows, then deleted from the live DB. A 64-bit hash of every
+archived id is kept in `archived_ids` so the scraper never re-inserts or
+re-analyzes them. Freed pages are returned to the filesystem with incremental
+VACUUM.
+
+Usage:
+    python -m backend.retention --days 30
+"""
+import argparse
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from backend.database import DB
+
+logging.basicConfig(level=logging.INFO)
+
+ARCHIVED_TABLES = ("facebook_posts", "good_facebook_posts", "listing_fields", "profile_results", "post_embeddings",
+                   "post_attachments")
+
+
+def default_archive_path(db_path):
+    stem, _ = os.path.splitext(db_path)
+    return f"{stem}.archive.db"
+
+
+def _db_size(db):
+    page_size = db.c.execute("PRAGMA page_size").fetchone()[0]
+    page_count = db.c.execute("PRAGMA page_count").fetchone()[0]
+    freelist = db.c.execute("PRAGMA freelist_count").fetchone()[0]
+    return page_size * page_count, page_size * freelist
+
+
+def archive_old_posts(db, days, archive_path, batch_size=5000):
+    """Move classified posts older than `days` days into `archive_path`.
+    Returns the number of posts archived.
+    """
+    cutoff = (datetime.now() - timedelta(days=int(days))).strftime('%Y-%m-%dT%H:%M:%S.000')
+    db.conn.commit()
+    db.c.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+    try:
+        columns = {}
+        for table in ARCHIVED_TABLES:
+            # Same columns as the live table; no constraints needed in the archive
+            db.c.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0")
+            live = [r[1] for r in db.c.execute(f"PRAGMA main.table_info({table})").fetchall()]
+            archived = {r[1] for r in db.c.execute(f"PRAGMA archive.table_info({table})").fetchall()}
+            # Columns added to the live schema after the archive was created
+            for col in live:
+                if col not in archived:
+                    db.c.execute(f"ALTER TABLE archive.{table} ADD COLUMN {col}")
+            columns[table] = ", ".join(live)
+        db.conn.commit()
+
+        total = 0
+        while True:
+            db.c.execute("DROP TABLE IF EXISTS temp.retention_batch")
+            db.c.execute(
+                "CREATE TEMP TABLE retention_batch AS SELECT id FROM main.facebook_posts "
+                "WHERE status IS NOT NULL AND time < ? LIMIT ?",
+                (cutoff, int(batch_size)),
+            )
+            n = db.c.execute("SELECT count(*) FROM temp.retention_batch").fetchone()[0]
+            if not n:
+                break
+            # One transaction per batch keeps write locks short
+            for table in ARCHIVED_TABLES:
+                db.c.execute(
+                    f"INSERT INTO archive.{table} ({columns[table]}) SELECT {columns[table]} FROM main.{table} "
+                    f"WHERE id IN (SELECT id FROM temp.retention_batch)"
+                )
+            db.c.execute("INSERT OR IGNORE INTO main.archived_ids (h) SELECT id_hash(id) FROM temp.retention_batch")
+            for table in ARCHIVED_TABLES:
+                db.c.execute(f"DELETE FROM main.{table} WHERE id IN (SELECT id FROM temp.retention_batch)")
+            db.conn.commit()
+            total += n
+            logging.info('Archived %d posts (total %d)', n, total)
+        db.c.execute("DROP TABLE IF EXISTS temp.retention_batch")
+        db.conn.commit()
+        return total
+    finally:
+        db.conn.rollback()
+        db.c.execute("DETACH DATABASE archive")
+
+
+def incremental_vacuum(db, pages=None):
+    """Return free pages to the filesystem. Switches the DB to incremental
+    auto_vacuum the first time, which needs one full VACUUM.
+    """
+    if db.c.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        logging.info('Enabling incremental auto_vacuum (one-time full VACUUM)')
+        db.conn.commit()
+        db.c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        db.c.execute("VACUUM")
+        return
+    db.conn.commit()
+    # executescript steps the pragma to completion; execute() frees one page only
+    if pages:
+        db.conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    else:
+        db.conn.executescript("PRAGMA incremental_vacuum;")
+
+
+def run_retention(db_path=None, days=None, archive_path=None, vacuum_pages=None):
+    """Archive old posts and vacuum. Returns a report dict."""
+    db_path = db_path or os.getenv('DB_PATH', 'facebook_posts.db')
+    days = int(days if days is not None else os.getenv('RETENTION_DAYS', '30'))
+    archive_path = archive_path or os.getenv('ARCHIVE_DB_PATH') or default_archive_path(db_path)
+    vacuum_pages = vacuum_pages if vacuum_pages is not None else int(os.getenv('VACUUM_PAGES', '0'))
+
+    db = DB(path=db_path)
+    try:
+        size_before, _ = _db_size(db)
+        archived = archive_old_posts(db, days, archive_path)
+        _, free_after_archive = _db_size(db)
+        incremental_vacuum(db, vacuum_pages)
+        size_after, free_after = _db_size(db)
+        report = {
+            'archived_posts': archived,
+            'archive_path': archive_path,
+            'retention_days': days,
+            'db_bytes_before': size_before,
+            'db_bytes_after': size_after,
+            'reclaimed_bytes': size_before - size_after,
+            'free_bytes_remaining': free_after,
+            'free_bytes_after_archive': free_after_archive,
+        }
+        logging.info('Retention finished: %s', report)
+        return report
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite path (default: DB_PATH)')
+    parser.add_argument('--days', type=int, help='archive classified posts older than this (default: RETENTION_DAYS or 30)')
+    parser.add_argument('--archive', help='archive DB path (default: ARCHIVE_DB_PATH or <db>.archive.db)')
+    parser.add_argument('--vacuum-pages', type=int, help='max pages to free (default: all)')
+    args = parser.parse_args()
+    print(json.dumps(run_retention(args.db, args.days, args.archive, args.vacuum_pages), indent=2))
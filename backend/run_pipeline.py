@@ -4,11 +4,16 @@ Usage: set APIFY_TOKEN and ensure local Ollama LLM is running at http://localhos
 """
 from datetime import datetime, timedelta
 from backend.scraper import Scraper, PostScraper
-from backend.database import DB
+from backend.database import DB, item_id, process_owner, PRIORITY_FRESH, PRIORITY_RESUME
 from backend.analyzer import LLMAnalizer
+from backend.decoding import DecodeError
 from backend.telegram_bot import BOT
+from backend.profiles import DEFAULT_PROFILE, load_profiles, notification_targets
+from backend import profiling
 import logging
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 logging.basicConfig(level=logging.INFO)
@@ -23,16 +28,34 @@ def main():
     return result
 
 
-def run_pipeline(apify_token=None, db_path=None, start_time = None, telegram_notification = True, lookback_minutes=60, limit=5):
+def run_pipeline(apify_token=None, db_path=None, start_time = None, telegram_notification = True, lookback_minutes=60, limit=5,
+                 inline_analysis=True, scraper=None, analyzer=None, bot=None, profile=None):
     """Run one pipeline iteration and return the list of accepted items.
 
     This function is import-friendly for servers or schedulers.
     Inputs via params fall back to environment variables when None.
+    Scraped posts go through the analysis queue ahead of the backlog; with
+    inline_analysis=False they are left to running AnalysisWorkers and this
+    call waits for them up to RUN_WAIT_TIMEOUT seconds: posts accepted after
+    that are not returned, the workers' on_accepted reports them.
+    scraper/analyzer/bot replace the Apify, LLM and Telegram clients (tests, benchmarks).
+    profile=True (or PROFILE=1) records a profile of the run (backend/profiling.py).
     Returns: list of accepted item dicts (may be empty).
     """
+    # Opened outside the profile: it is saved through this connection when the block exits
+    db = DB(path=db_path or os.getenv('DB_PATH', 'facebook_posts.db'))
+    try:
+        with profiling.profiled(profile, kind='scheduled') as prof:
+            return _run_pipeline(db, apify_token, start_time, telegram_notification, lookback_minutes, limit,
+                                 inline_analysis, scraper, analyzer, bot, prof)
+    finally:
+        db.close()
+
+
+def _run_pipeline(db, apify_token, start_time, telegram_notification, lookback_minutes, limit,
+                  inline_analysis, scraper, analyzer, bot, prof):
     # Lightweight config
     apify_token = apify_token or os.getenv('APIFY_TOKEN')
-    db_path = db_path or os.getenv('DB_PATH', 'facebook_posts.db')
     lookback_minutes = int(os.getenv('LOOKBACK_MINUTES', str(lookback_minutes)))
     limit = int(os.getenv('SCRAPE_LIMIT', str(limit)))
     llama_model = os.getenv('OLLAMA_MODEL', 'llama3:latest')
@@ -40,113 +63,315 @@ def run_pipeline(apify_token=None, db_path=None, start_time = None, telegram_not
     query = os.getenv('SCRAPE_QUERY', 'affitti torino')
 
     # Compute start time: onlyPostsNewerThan expects ISO-like string
-    if scraper_type == 'group':
-        start_time = start_time or (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%dT%H:%M:%S.000')
-        id_string = "id"
-        scraper = Scraper(start_time=start_time, limit=limit, apify_token=apify_token)
-    elif scraper_type == 'post':
-        start_time = start_time or (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%d')
-        id_string = "post_id"
-        scraper = PostScraper(start_time=start_time, query=query, limit=limit, apify_token=apify_token)
-    else:
-        raise ValueError(f"Invalid scraper type: {scraper_type}, set scraper type to 'group' or 'post' in .env file")
+    if scraper is None:
+        if scraper_type == 'group':
+            start_time = start_time or (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%dT%H:%M:%S.000')
+            scraper = Scraper(start_time=start_time, limit=limit, apify_token=apify_token)
+        elif scraper_type == 'post':
+            start_time = start_time or (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%d')
+            scraper = PostScraper(start_time=start_time, query=query, limit=limit, apify_token=apify_token)
+        else:
+            raise ValueError(f"Invalid scraper type: {scraper_type}, set scraper type to 'group' or 'post' in .env file")
     logging.info('Scraping starts at %s', start_time)
-    
-    db = DB(path=db_path)
-    analyzer = LLMAnalizer(llama_model)
-    bot = BOT()
+
+    analyzer = analyzer or LLMAnalizer(llama_model)
+    bot = bot or BOT()
+    run_id = db.start_run('scheduled', start_time)
+    prof.attach(db, run_id)
 
     # Scrape
-    items = scraper.scrape()
+    try:
+        items = scraper.scrape()
+    except Exception as e:
+        db.finish_run(run_id, status='failed', error=str(e))
+        raise
     if not items:
         logging.info('No items scraped; exiting.')
+        db.finish_run(run_id)
         return []
     if len(items) == 1 and items == [{'error': 'no_items', 'errorDescription': 'Empty or private data for provided input'}]:
         logging.info('No items found; exiting.')
+        db.finish_run(run_id)
         return []
 
-    # Save all scraped items to main table
+    # Save all scraped items to main table (checkpoint: stage='scraped')
     count = db.add_items_to_db(items, table='facebook_posts')
     logging.info('Saved %d items to facebook_posts on a total of %d', len(items)-count, len(items))
+    db.assign_run([item_id(i) for i in items if item_id(i)], run_id)
 
-    # Analyze items and promote accepted ones to good_facebook_posts
-    accepted = []
-    for item in items:
-        try:
-            analysis = analyzer.analize_post(item)
-            # Normalise keys: analyzer returns {"stato":..., "motivo":...} per prompt
-            status = analysis.get('stato') or analysis.get('status') or analysis.get('state')
-            motivo = analysis.get('motivo') or analysis.get('motivation') or analysis.get('motivo', '')
-            item['status'] = status
-            item['motivo'] = motivo
-
-            if isinstance(status, str) and status.strip().upper() == 'ACCETTATO':
-                accepted.append(item)
-                db.add_items_to_db([item], table='good_facebook_posts')
-                if telegram_notification:
-                    bot.send_message(f"Nuovo post accettato: {item.get('text')}\n url:\n {item.get('url')}")
+    # Only items not analyzed by an earlier run (items stuck at a later stage
+    # are finished by resume_interrupted). Posts moved to the archive by the
+    # retention job are not in the table at all and are skipped too.
+    scraped = len(items)
+    stages = db.get_stages(item_id(i) for i in items if item_id(i))
+    items = [i for i in items if stages.get(item_id(i)) == 'scraped']
+    logging.info('%d items to analyze after skipping already analyzed ones', len(items))
 
-            db.update_item_field(item.get(id_string), 'status', status)
-            db.update_item_field(item.get(id_string), 'motivo', motivo)
-
-        except Exception as e:
-            logging.exception('Analysis failed for item id=%s: %s', item.get('id'), e)
+    # Fresh posts jump ahead of the backlog in the shared analysis queue
+    ids = [item_id(i) for i in items]
+    db.enqueue_analysis(items, PRIORITY_FRESH)
+    analyzed = 0
+    if inline_analysis:
+        _, analyzed = drain(db, analyzer, bot, ids=ids, telegram_notification=telegram_notification)
+    # Inline: only wait for posts a worker grabbed first (failed ones are left
+    # queued for a retry). Otherwise wait until the workers are done with all,
+    # for a bounded time: the rest stay queued and the workers finish them.
+    pending = wait_for_queue(db, ids, in_progress_only=inline_analysis)
+    if pending:
+        logging.info('Leaving %d queued items of run %s to the analysis workers', len(pending), run_id)
 
+    # Accepted posts of this run, whoever analyzed them
+    accepted = [r for r in db.fetch_posts_by_ids(ids) if r.get('status') == 'ACCETTATO']
     if accepted:
         logging.info('Promoted %d items to good_facebook_posts', len(accepted))
     else:
         logging.info('No items accepted by analyzer')
 
+    db.finish_run(run_id, scraped=scraped, analyzed=analyzed if inline_analysis else len(ids) - len(pending),
+                  accepted=len(accepted))
+    if pending:
+        # Workers report posts of finished runs only: pick up any accepted before finish_run
+        accepted = [r for r in db.fetch_posts_by_ids(ids) if r.get('status') == 'ACCETTATO']
     return accepted
 
 
-def analyze_pending(db_path=None, limit=100, telegram_notification=True):
-    """Analyze only posts whose status is NULL in facebook_posts.
+def drain(db, analyzer, bot, ids=None, limit=None, telegram_notification=True, owner=None, on_accepted=None,
+          notify_inline=True):
+    """Analyze queued posts in priority order (only `ids` when given, at most
+    `limit`). Returns (accepted rows, number of posts processed).
+    """
+    owner = owner or f"{process_owner()}-{threading.get_ident()}"
+    remaining = set(ids) if ids is not None else None
+    accepted = []
+    processed = 0
+    while limit is None or processed < limit:
+        claim = db.claim_analysis(owner, ids=remaining)
+        if claim is None:
+            break
+        pid, source = claim
+        if remaining is not None:
+            remaining.discard(pid)
+        rows = db.fetch_posts_by_ids([pid])
+        if not rows or rows[0]['stage'] != 'scraped':
+            # Deleted, archived or analyzed by another path meanwhile
+            db.complete_analysis(pid)
+            continue
+        item = rows[0]
+        processed += 1
+        try:
+            if process_item(db, analyzer, bot, item, 'scraped', telegram_notification, notify_inline):
+                accepted.append(item)
+                if on_accepted:
+                    on_accepted(item, source, db)
+            db.complete_analysis(pid)
+        except DecodeError as e:
+            # Already retried with a shorter generation: a new full call would fail the same way
+            logging.warning('Undecodable analysis for item id=%s, marking it failed: %s', pid, e)
+            db.fail_analysis(pid, e)
+        except Exception as e:
+            logging.exception('Analysis failed for queued item id=%s: %s', pid, e)
+            db.release_analysis(pid)
+    return accepted, processed
+
+
+def wait_for_queue(db, ids, timeout=None, poll_interval=1.0, in_progress_only=False):
+    """Block until none of `ids` is left in the analysis queue, at most `timeout`
+    seconds (RUN_WAIT_TIMEOUT, default 60). Returns the ids still queued.
+    """
+    timeout = timeout if timeout is not None else float(os.getenv('RUN_WAIT_TIMEOUT', '60'))
+    deadline = time.monotonic() + timeout
+    pending = db.queued_ids(ids, in_progress_only)
+    while pending:
+        if time.monotonic() > deadline:
+            logging.info('Stopped waiting for %d queued items after %gs', len(pending), timeout)
+            return pending
+        time.sleep(poll_interval)
+        pending = db.queued_ids(pending, in_progress_only)
+    return set()
+
+
+class AnalysisWorker(threading.Thread):
+    """Long-lived thread draining the analysis queue: fresh posts first, the
+    backlog when idle. Each worker owns its DB connection and analyzer.
+    `on_accepted(item, source, db)` is called for every accepted post with the
+    worker's own DB, the only connection it may use from this thread. With
+    notify_inline=False accepted posts are left to a notifier process.
+    """
+
+    def __init__(self, db_path=None, on_accepted=None, telegram_notification=True, poll_interval=2.0, name=None,
+                 notify_inline=True):
+        super().__init__(name=name or 'analysis-worker', daemon=True)
+        self.db_path = db_path or os.getenv('DB_PATH', 'facebook_posts.db')
+        self.on_accepted = on_accepted
+        self.telegram_notification = telegram_notification
+        self.poll_interval = poll_interval
+        self.notify_inline = notify_inline
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        db = DB(path=self.db_path)
+        analyzer = LLMAnalizer(os.getenv('OLLAMA_MODEL', 'llama3:latest'))
+        bot = BOT()
+        owner = f"{process_owner()}-{self.name}"
+        logging.info('%s started', self.name)
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    _, processed = drain(db, analyzer, bot, limit=1, owner=owner,
+                                         telegram_notification=self.telegram_notification,
+                                         on_accepted=self.on_accepted, notify_inline=self.notify_inline)
+                except Exception as e:
+                    logging.exception('%s: %s', self.name, e)
+                    processed = 0
+                if not processed:
+                    self._stop_event.wait(self.poll_interval)
+        finally:
+            db.close()
+
+
+def process_item(db, analyzer, bot, item, stage, telegram_notification=True, notify_inline=True):
+    """Advance one post through analyzed -> promoted -> notified, checkpointing
+    each stage in the DB so an interrupted run resumes where it stopped.
+    With notify_inline=False a promoted post gets a 'notify' job for the
+    notifier process (backend/workers.py) instead.
+    Returns True if the post is accepted.
+    """
+    pid = item_id(item)
+    if stage == 'scraped':
+        t0 = time.monotonic()
+        try:
+            analysis = analyzer.analize_post(item)
+        except DecodeError as e:
+            db.record_llm_call(time.monotonic() - t0, ok=False, decode=e.report)
+            raise
+        except Exception:
+            db.record_llm_call(time.monotonic() - t0, ok=False)
+            raise
+        # Committed together with the analysis checkpoint below
+        db.record_llm_call(time.monotonic() - t0, commit=False, decode=analysis.pop('decode', None))
+        # Status is already one of ACCETTATO/SCARTATO (backend/decoding.py)
+        item['status'] = analysis['status']
+        item['motivo'] = analysis['motivation']
+        db.record_analysis(pid, item['status'], item['motivo'], analysis)
+        stage = 'analyzed'
+
+    if item.get('status') != 'ACCETTATO':
+        return False
+
+    if stage == 'analyzed':
+        db.promote(pid)
+        stage = 'promoted'
+
+    if stage == 'promoted':
+        if not notify_inline:
+            db.enqueue_job('notify', {'id': pid}, key=pid)
+            return True
+        if telegram_notification:
+            send_telegram(db, bot, item)
+        db.mark_notified(pid)
+    return True
+
+
+def send_telegram(db, bot, item):
+    """Message every chat interested in an accepted post, naming the profiles that accepted it."""
+    pid = item_id(item)
+    text = f"Nuovo post accettato: {item.get('text') or item.get('message')}\n url:\n {item.get('url')}"
+    accepted = db.accepted_profiles([pid]).get(pid, [])
+    for chat_id, names in notification_targets(accepted, load_profiles()):
+        prefix = f"[{', '.join(names)}] " if names and names != [DEFAULT_PROFILE] else ""
+        bot.send_message(prefix + text, chat_id=chat_id)
+
+
+def analyze_pending(db_path=None, limit=100, telegram_notification=True, inline_analysis=True, analyzer=None, bot=None,
+                    profile=None):
+    """Queue every post whose status is NULL as backlog and, with
+    inline_analysis, analyze up to `limit` queued posts now (fresh ones first).
+    profile=True (or PROFILE=1) records a profile of the call.
     Returns list of accepted item dicts (may be empty).
     """
+    db = DB(path=db_path or os.getenv('DB_PATH', 'facebook_posts.db'))
+    try:
+        with profiling.profiled(profile, kind='analyze_pending') as prof:
+            return _analyze_pending(db, limit, telegram_notification, inline_analysis, analyzer, bot, prof)
+    finally:
+        db.close()
+
+
+def _analyze_pending(db, limit, telegram_notification, inline_analysis, analyzer, bot, prof):
     # Config
-    db_path = db_path or os.getenv('DB_PATH', 'facebook_posts.db')
     llama_model = os.getenv('OLLAMA_MODEL', 'llama3:latest')
 
-    db = DB(path=db_path)
-    analyzer = LLMAnalizer(llama_model)
-    bot = BOT()
+    prof.attach(db)
+    queued = db.enqueue_backlog()
+    logging.info('Queued %d pending items as backlog', queued)
+    if not inline_analysis:
+        return []
 
-    # Fetch pending items
-    items = db.fetch_items_with_null_status(limit=limit)
-    if not items:
+    analyzer = analyzer or LLMAnalizer(llama_model)
+    bot = bot or BOT()
+    run_id = db.start_run('analyze_pending')
+    prof.attach(db, run_id)
+    accepted, count = drain(db, analyzer, bot, limit=limit, telegram_notification=telegram_notification)
+    if not count:
         logging.info('No pending items with NULL status found')
+    elif accepted:
+        logging.info('Pending analysis promoted %d items to good_facebook_posts', len(accepted))
+    else:
+        logging.info('No pending items accepted by analyzer')
+
+    db.finish_run(run_id, analyzed=count, accepted=len(accepted))
+    return accepted
+
+
+def resume_interrupted(db_path=None, telegram_notification=True, limit=500, inline_analysis=True, notify_inline=True):
+    """Finish posts left mid-pipeline by a crash or restart: analyze posts that
+    were saved but not classified, promote accepted ones and send missing
+    notifications. Nothing is re-scraped and finished stages are not redone.
+    Unanalyzed posts are queued ahead of the backlog; with inline_analysis
+    they are analyzed here, otherwise by the AnalysisWorkers. With
+    notify_inline=False missing notifications are queued for the notifier.
+    Returns list of accepted item dicts (may be empty).
+    """
+    db = DB(path=db_path or os.getenv('DB_PATH', 'facebook_posts.db'))
+    try:
+        return _resume_interrupted(db, telegram_notification, limit, inline_analysis, notify_inline)
+    finally:
+        db.close()
+
+
+def _resume_interrupted(db, telegram_notification, limit, inline_analysis, notify_inline):
+    interrupted = db.mark_interrupted_runs()
+    items = db.fetch_unfinished(limit=limit)
+    if not items:
+        if interrupted:
+            logging.info('Interrupted runs %s left no unfinished items', interrupted)
         return []
+    logging.info('Resuming %d unfinished items (interrupted runs: %s)', len(items), interrupted)
 
+    llama_model = os.getenv('OLLAMA_MODEL', 'llama3:latest')
+    analyzer = LLMAnalizer(llama_model)
+    bot = BOT()
+    run_id = db.start_run('resume')
+    to_analyze = [i for i in items if i['stage'] == 'scraped']
+    db.enqueue_analysis(to_analyze, PRIORITY_RESUME)
     accepted = []
-    count = 0
+    # Promotion and notification need no inference: finish them right away
     for item in items:
-        count += 1
+        if item['stage'] == 'scraped':
+            continue
         try:
-            analysis = analyzer.analize_post(item)
-            status = (analysis.get('stato') or analysis.get('status') or analysis.get('state'))
-            motivo = (analysis.get('motivo') or analysis.get('motivation') or analysis.get('motivo', ''))
-            item['status'] = status
-            item['motivo'] = motivo
-
-            if isinstance(status, str) and status.strip().upper() == 'ACCETTATO':
+            if process_item(db, analyzer, bot, item, item['stage'], telegram_notification, notify_inline):
                 accepted.append(item)
-                db.add_items_to_db([item], table='good_facebook_posts')
-                if telegram_notification:
-                    bot.send_message(f"Nuovo post accettato: {item.get('text')}\n url: {item.get('url')}")
-
-            id_string = "id" if item.get('id') else "post_id"
-            db.update_item_field(item.get(id_string), 'status', status)
-            db.update_item_field(item.get(id_string), 'motivo', motivo)
-            logging.info('Updated item %d of %d', count, len(items))
         except Exception as e:
-            logging.exception('Analysis failed for pending item id=%s: %s', item.get('id'), e)
-
-    if accepted:
-        logging.info('Pending analysis promoted %d items to good_facebook_posts', len(accepted))
-    else:
-        logging.info('No pending items accepted by analyzer')
-
+            logging.exception('Resume failed for item id=%s: %s', item_id(item), e)
+    if inline_analysis:
+        analyzed_accepted, _ = drain(db, analyzer, bot, ids=[item_id(i) for i in to_analyze],
+                                     telegram_notification=telegram_notification, notify_inline=notify_inline)
+        accepted.extend(analyzed_accepted)
+    db.finish_run(run_id, analyzed=len(items), accepted=len(accepted))
     return accepted
 
 
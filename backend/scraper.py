@@ -1,11 +1,11 @@
-from apify_client import ApifyClient
 from datetime import datetime
 import os
 import logging
-import json
 from dotenv import load_dotenv
 load_dotenv()
 
+from backend.profiles import load_profiles, scrape_urls
+
 logging.basicConfig(level=logging.INFO)
 
 
@@ -16,12 +16,13 @@ class Scraper():
         if not token:
             raise RuntimeError('Apify token not provided via APIFY_TOKEN env or apify_token param')
 
-        # get the urls from the urls_to_scrape.txt file
-        with open('./backend/urls_to_scrape.json', 'r') as f:
-            self.start_urls = json.load(f)
+        # Groups of every search profile, each once (urls_to_scrape.json without profiles)
+        self.start_urls = [{"url": url} for url in scrape_urls(load_profiles())]
         
         print(self.start_urls)
 
+        # Imported lazily: apify_client is slow to import and only needed once a run starts
+        from apify_client import ApifyClient
         self.client = ApifyClient(token)
 
         # Prepare the Actor input
@@ -59,6 +60,8 @@ class PostScraper():
         if not token:
             raise RuntimeError('Apify token not provided via APIFY_TOKEN env or apify_token param')
 
+        # Imported lazily: apify_client is slow to import and only needed once a run starts
+        from apify_client import ApifyClient
         self.client = ApifyClient(token)
         self.query = query
 
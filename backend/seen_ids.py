@@ -0,0 +1,74 @@
+"""Compact set of already-notified post ids.
+
+Ids are stored as 64-bit hashes (see database.id_hash) in a sorted
+`array('q')`, 8 bytes per id instead of ~60-100 for a Python str in a set.
+Membership is a binary search. New ids go to a small set that is merged into
+the array once it grows past `merge_threshold`. With 64-bit hashes a false
+positive (suppressing a notification) needs ~4 billion ids to become likely.
+"""
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+
+from backend.database import id_hash, item_id
+
+
+class SeenIds():
+    def __init__(self, merge_threshold=1024):
+        self._sorted = array('q')
+        self._recent = set()
+        self._lock = threading.Lock()
+        self.merge_threshold = merge_threshold
+
+    @classmethod
+    def from_db(cls, db):
+        """Build the set from accepted posts in one streaming, pre-sorted query."""
+        seen = cls()
+        seen._sorted = array('q', db.iter_good_id_hashes())
+        return seen
+
+    def _contains_hash(self, h):
+        if h in self._recent:
+            return True
+        i = bisect_left(self._sorted, h)
+        return i < len(self._sorted) and self._sorted[i] == h
+
+    def __contains__(self, post_id):
+        if post_id is None:
+            return False
+        return self._contains_hash(id_hash(post_id))
+
+    def __len__(self):
+        return len(self._sorted) + len(self._recent)
+
+    def add(self, post_id):
+        if post_id is None:
+            return
+        h = id_hash(post_id)
+        with self._lock:
+            if self._contains_hash(h):
+                return
+            self._recent.add(h)
+            if len(self._recent) >= self.merge_threshold:
+                self._merge()
+
+    def _merge(self):
+        merged = sorted(self._sorted.tolist() + list(self._recent))
+        self._sorted = array('q', merged)
+        self._recent = set()
+
+    def contains_item(self, item):
+        """Membership for a scraped item or DB row (`id` or `post_id`)."""
+        return item_id(item) in self
+
+    def add_item(self, item):
+        self.add(item_id(item))
+
+    def nbytes(self):
+        """Approximate memory footprint in bytes."""
+        return (sys.getsizeof(self._sorted) + sys.getsizeof(self._recent)
+                + sum(sys.getsizeof(h) for h in self._recent))
+
+    def stats(self):
+        return {'count': len(self), 'bytes': self.nbytes()}
@@ -1,5 +1,3 @@
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from dotenv import load_dotenv
 import os
 import requests
@@ -21,19 +19,20 @@ class BOT():
         else:
             self.base_url = BASE_URL
     
-    def send_message(self, text: str) -> dict:
+    def send_message(self, text: str, chat_id=None) -> dict:
         """
         Send a message via Telegram Bot API.
 
         Args:
         text (str): The message content.
+        chat_id (str, optional): Chat to send to instead of the bot's default chat.
 
         Returns:
             dict: JSON response from Telegram API.
         """
         url = f"{self.base_url}/sendMessage"
         payload = {
-            "chat_id": self.chat_id,
+            "chat_id": chat_id or self.chat_id,
             "text": text,
             "parse_mode": "HTML"  # allows bold, italics, links
         }
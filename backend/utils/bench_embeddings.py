@@ -0,0 +1,81 @@
+"""Embedding index benchmark: query latency and memory at N vectors.
+
+Fills an EmbeddingIndex with N random unit vectors (int8, like the stored
+ones), runs top-k queries and reports latency percentiles, index memory and
+recall@k against an exact float32 search. Also measures the embedder's
+throughput on synthetic posts.
+
+Usage:
+    python -m backend.utils.bench_embeddings --vectors 100000
+    EMBEDDING_MODEL=hashing python -m backend.utils.bench_embeddings --vectors 100000 --queries 500
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from backend.embeddings import EmbeddingIndex, get_embedder, quantize
+from backend.utils.bench_pipeline import make_posts, percentiles, peak_rss_mb
+
+
+def bench_index(n, dim=384, queries=200, k=10, seed=0):
+    rng = np.random.default_rng(seed)
+    index = EmbeddingIndex(dim)
+    exact = np.empty((n, dim), dtype=np.float32)
+    t0 = time.perf_counter()
+    for start in range(0, n, 10000):
+        block = rng.standard_normal((min(10000, n - start), dim)).astype(np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        exact[start:start + len(block)] = block
+        index.add([f'p{i}' for i in range(start, start + len(block))], quantize(block))
+    build_s = time.perf_counter() - t0
+
+    # Queries near stored vectors, as for "similar listings"
+    picks = rng.integers(0, n, queries)
+    qs = exact[picks] + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32) / np.sqrt(dim)
+    qs /= np.linalg.norm(qs, axis=1, keepdims=True)
+    latencies = []
+    recall = 0.0
+    for q in qs:
+        t0 = time.perf_counter()
+        hits = index.search(q, k=k)
+        latencies.append(time.perf_counter() - t0)
+        truth = {f'p{i}' for i in np.argpartition(exact @ q, -k)[-k:]}
+        recall += len(truth & {pid for pid, _ in hits}) / k
+    return {
+        'vectors': n,
+        'dim': dim,
+        'k': k,
+        'build_s': round(build_s, 3),
+        'index_mb': round(index.nbytes() / 2 ** 20, 1),
+        'query_latency': percentiles(latencies),
+        'recall_at_k_vs_float32': round(recall / queries, 4),
+    }
+
+
+def bench_embedder(posts=1000):
+    embedder = get_embedder()
+    texts = [p['text'] for p in make_posts(posts, seed=7)]
+    t0 = time.perf_counter()
+    for i in range(0, len(texts), 64):
+        embedder.embed(texts[i:i + 64])
+    elapsed = time.perf_counter() - t0
+    return {'model': embedder.name, 'posts': posts, 'elapsed_s': round(elapsed, 3),
+            'posts_per_s': round(posts / elapsed, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vectors', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--posts', type=int, default=1000, help='synthetic posts for the embedder throughput')
+    args = parser.parse_args()
+    report = {
+        'index': bench_index(args.vectors, args.dim, args.queries, args.k),
+        'embedder': bench_embedder(args.posts),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    print(json.dumps(report, indent=2))
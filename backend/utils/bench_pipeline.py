@@ -0,0 +1,331 @@
+"""Offline end-to-end benchmark of the pipeline with fake Apify, LLM and Telegram.
+
+Synthetic Italian rental posts are generated at the requested scale and fed
+through the real DB, queue and pipeline code; only the external services are
+replaced:
+
+- FakeScraper  returns a batch of synthetic posts (instead of Apify)
+- FakeBackend  from backend/llm_backends.py behind the real LLMAnalizer
+               (optionally returning malformed JSON, --llm-malformed-rate)
+- FakeBot      swallows Telegram messages
+
+Each fake has its own latency (seconds) and error rate (0..1). Scenarios:
+
+- run_pipeline     one scheduled run scraping --posts fresh posts
+- analyze_pending  a backlog of --posts unclassified posts, drained inline
+- server           /posts, /status and /runs through FastAPI's TestClient on the
+                   populated DB, plus a /run_now and /analyze_pending round trip
+
+The report (JSON) has throughput, p50/p95/p99 latencies per stage and the peak
+RSS of the process, so it can be diffed between commits.
+
+Usage:
+    python -m backend.utils.bench_pipeline --posts 2000
+    python -m backend.utils.bench_pipeline --posts 500 --llm-latency 0.05 --llm-error-rate 0.02 --out bench.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timedelta
+
+from backend.llm_backends import FakeBackend
+
+ZONES = ["San Salvario", "Crocetta", "Vanchiglia", "Aurora", "Centro", "Cit Turin", "San Donato",
+         "Borgo Po", "Santa Rita", "Lingotto", "Pozzo Strada", "Barriera di Milano"]
+ROOMS = ["stanza singola", "stanza doppia", "posto letto", "monolocale", "bilocale", "trilocale"]
+OPENERS = ["Affittasi", "Cerco coinquilina per", "Disponibile da subito", "Libera a breve",
+           "Cercasi", "Subentro per", "Offro"]
+EXTRAS = ["Spese incluse.", "Spese escluse, circa 50€ al mese.", "No agenzie.", "Zona ben servita, vicino alla metro.",
+          "Appartamento ristrutturato con lavatrice e wifi.", "Solo ragazze.", "Preferibilmente studenti.",
+          "Contratto regolare 4+4.", "Riscaldamento centralizzato.", "Scrivetemi in privato 🙏🏠"]
+GROUPS = ["https://www.facebook.com/groups/affittitorino", "https://www.facebook.com/groups/stanzetorino",
+          "https://www.facebook.com/groups/studentitorino"]
+
+
+def make_posts(n, seed=0, start=None, prefix='bench'):
+    """Generate `n` synthetic posts shaped like the Apify group scraper output."""
+    rnd = random.Random(seed)
+    start = start or datetime.now()
+    posts = []
+    for i in range(n):
+        zone = rnd.choice(ZONES)
+        room = rnd.choice(ROOMS)
+        price = rnd.randrange(250, 1200, 10)
+        lines = [f"{rnd.choice(OPENERS)} {room} in zona {zone}, {price}€ al mese."]
+        lines += rnd.sample(EXTRAS, rnd.randint(1, 4))
+        if rnd.random() < 0.3:
+            lines.append(f"Info: 3{rnd.randint(10, 99)} {rnd.randint(100, 999)} {rnd.randint(1000, 9999)}")
+        if rnd.random() < 0.2:
+            lines.append("#affitto #torino #stanza #studenti")
+        group = rnd.choice(GROUPS)
+        post_id = f"{prefix}-{seed}-{i}"
+        posts.append({
+            'id': post_id,
+            'url': f"{group}/posts/{post_id}",
+            'time': (start - timedelta(seconds=i * 37)).strftime('%Y-%m-%dT%H:%M:%S.000'),
+            'user': {'id': f"user-{rnd.randint(1, n)}", 'name': 'Bench User'},
+            'text': "\n".join(lines),
+            'topReactionsCount': rnd.randint(0, 20),
+            'likesCount': rnd.randint(0, 20),
+            'commentsCount': rnd.randint(0, 10),
+            'sharesCount': rnd.randint(0, 3),
+            'groupTitle': 'Affitti Torino',
+            'inputUrl': group,
+        })
+    return posts
+
+
+class FakeScraper():
+    def __init__(self, posts, latency=0.0, error_rate=0.0, seed=0):
+        self.posts = posts
+        self.latency = latency
+        self.error_rate = error_rate
+        self._rnd = random.Random(seed)
+
+    def scrape(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self._rnd.random() < self.error_rate:
+            raise RuntimeError('fake scraper: simulated Apify failure')
+        return list(self.posts)
+
+
+class FakeBot():
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.sent = 0
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def send_message(self, text, chat_id=None):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self.error_rate and self._rnd.random() < self.error_rate:
+                raise RuntimeError('fake bot: simulated Telegram failure')
+            self.sent += 1
+        return {'ok': True}
+
+
+class TimedBackend():
+    """Wraps a backend and records the latency of every chat call."""
+
+    def __init__(self, backend):
+        self.name = backend.name
+        self.backend = backend
+        self.latencies = []
+        self.errors = 0
+
+    def chat(self, system, user, schema, model, options=None):
+        t0 = time.perf_counter()
+        try:
+            return self.backend.chat(system, user, schema, model, options=options)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.latencies.append(time.perf_counter() - t0)
+
+
+def percentiles(samples):
+    if not samples:
+        return {'count': 0}
+    s = sorted(samples)
+
+    def pct(p):
+        return round(s[min(len(s) - 1, int(p / 100 * len(s)))] * 1000, 2)
+    return {'count': len(s), 'p50_ms': pct(50), 'p95_ms': pct(95), 'p99_ms': pct(99),
+            'max_ms': round(s[-1] * 1000, 2), 'mean_ms': round(sum(s) / len(s) * 1000, 2)}
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _fakes(args, seed=0):
+    from backend.analyzer import LLMAnalizer
+    llm = TimedBackend(FakeBackend(latency=args.llm_latency, error_rate=args.llm_error_rate,
+                                   malformed_rate=args.llm_malformed_rate))
+    analyzer = LLMAnalizer(os.getenv('OLLAMA_MODEL', 'llama3:latest'), backend=llm)
+    bot = FakeBot(latency=args.bot_latency, error_rate=args.bot_error_rate, seed=seed)
+    return analyzer, llm, bot
+
+
+def _stage_report(db_path, elapsed, processed, llm, bot):
+    from backend.database import DB
+    db = DB(path=db_path)
+    try:
+        counts = {r[0] or 'NULL': r[1] for r in db.c.execute(
+            "SELECT status, count(*) FROM facebook_posts GROUP BY status").fetchall()}
+        queue = db.queue_stats()
+        decoding = dict(db.c.execute(
+            "SELECT coalesce(sum(repaired), 0) AS repaired, coalesce(sum(retries), 0) AS retries, "
+            "coalesce(sum(decode_failures), 0) AS failed, round(coalesce(sum(wasted_ms), 0), 1) AS wasted_ms "
+            "FROM stats_llm").fetchone())
+    finally:
+        db.close()
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'posts_processed': processed,
+        'throughput_posts_per_s': round(processed / elapsed, 1) if elapsed else None,
+        'llm_latency': percentiles(llm.latencies),
+        'llm_errors': llm.errors,
+        'decoding': decoding,
+        'telegram_sent': bot.sent,
+        'status_counts': counts,
+        'queue_left': queue,
+    }
+
+
+def bench_run_pipeline(args, db_path):
+    from backend.run_pipeline import run_pipeline
+    analyzer, llm, bot = _fakes(args, seed=1)
+    scraper = FakeScraper(make_posts(args.posts, seed=1), latency=args.scrape_latency,
+                          error_rate=args.scrape_error_rate, seed=1)
+    t0 = time.perf_counter()
+    accepted = run_pipeline(db_path=db_path, scraper=scraper, analyzer=analyzer, bot=bot,
+                            telegram_notification=True, inline_analysis=True)
+    report = _stage_report(db_path, time.perf_counter() - t0, len(llm.latencies), llm, bot)
+    report['accepted'] = len(accepted)
+    return report
+
+
+def bench_analyze_pending(args, db_path):
+    from backend.database import DB
+    from backend.run_pipeline import analyze_pending
+    db = DB(path=db_path)
+    try:
+        db.add_items_to_db(make_posts(args.posts, seed=2), table='facebook_posts')
+    finally:
+        db.close()
+    analyzer, llm, bot = _fakes(args, seed=2)
+    t0 = time.perf_counter()
+    accepted = analyze_pending(db_path=db_path, limit=args.posts, analyzer=analyzer, bot=bot)
+    report = _stage_report(db_path, time.perf_counter() - t0, len(llm.latencies), llm, bot)
+    report['accepted'] = len(accepted)
+    return report
+
+
+@contextmanager
+def _patched(module, **attrs):
+    old = {k: getattr(module, k) for k in attrs}
+    for k, v in attrs.items():
+        setattr(module, k, v)
+    try:
+        yield
+    finally:
+        for k, v in old.items():
+            setattr(module, k, v)
+
+
+def bench_server(args, db_path, requests_per_endpoint=50):
+    """Drive the HTTP API in-process. The server builds its own scraper, LLM
+    and bot, so the fakes are swapped in on the modules it uses.
+    """
+    os.environ['DB_PATH'] = db_path
+    os.environ.setdefault('ANALYSIS_WORKERS', '0')
+    from fastapi.testclient import TestClient
+    import backend.analyzer
+    import backend.run_pipeline
+    import server
+
+    llm = TimedBackend(FakeBackend(latency=args.llm_latency, error_rate=args.llm_error_rate,
+                                   malformed_rate=args.llm_malformed_rate))
+    bot = FakeBot(latency=args.bot_latency, error_rate=args.bot_error_rate, seed=3)
+    posts = make_posts(args.posts, seed=3)
+    endpoints = {
+        'GET /posts': ('get', '/posts?limit=50'),
+        'GET /posts?search': ('get', '/posts?limit=50&search=singola'),
+        'GET /posts?filters': ('get', '/posts?limit=50&max_price=600&zone=Crocetta'),
+        'GET /posts good': ('get', '/posts?table=good_facebook_posts&limit=50'),
+        'GET /status': ('get', '/status'),
+        'GET /runs': ('get', '/runs'),
+    }
+    report = {'endpoints': {}}
+    def scraper(**kwargs):
+        return FakeScraper(posts, latency=args.scrape_latency, error_rate=args.scrape_error_rate, seed=3)
+
+    with _patched(backend.analyzer, _BACKEND=llm), \
+            _patched(backend.run_pipeline, BOT=lambda: bot, Scraper=scraper, PostScraper=scraper), \
+            TestClient(server.app) as client:
+        # Background tasks run before the response is returned by TestClient
+        t0 = time.perf_counter()
+        r = client.post('/run_now')
+        report['run_now'] = {'status_code': r.status_code, 'elapsed_s': round(time.perf_counter() - t0, 3)}
+        t0 = time.perf_counter()
+        r = client.post('/analyze_pending')
+        report['analyze_pending'] = {'status_code': r.status_code, 'elapsed_s': round(time.perf_counter() - t0, 3)}
+
+        for name, (method, url) in endpoints.items():
+            samples = []
+            t_all = time.perf_counter()
+            for _ in range(requests_per_endpoint):
+                t0 = time.perf_counter()
+                r = getattr(client, method)(url)
+                samples.append(time.perf_counter() - t0)
+                if r.status_code != 200:
+                    raise RuntimeError(f"{name} returned HTTP {r.status_code}: {r.text[:200]}")
+            total = time.perf_counter() - t_all
+            report['endpoints'][name] = dict(percentiles(samples),
+                                             requests_per_s=round(len(samples) / total, 1))
+    report['llm_latency'] = percentiles(llm.latencies)
+    report['telegram_sent'] = bot.sent
+    return report
+
+
+SCENARIOS = {
+    'run_pipeline': bench_run_pipeline,
+    'analyze_pending': bench_analyze_pending,
+    'server': bench_server,
+}
+
+
+def main(args):
+    report = {
+        'started_at': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {k: v for k, v in vars(args).items() if k != 'out'},
+        'scenarios': {},
+    }
+    # The analyzer prints every verdict; keep stdout for the report
+    with tempfile.TemporaryDirectory() as tmp, redirect_stdout(sys.stderr):
+        for name in args.scenarios:
+            # Fresh DB per scenario so results don't depend on the order
+            db_path = args.db or os.path.join(tmp, f'{name}.db')
+            t0 = time.perf_counter()
+            report['scenarios'][name] = SCENARIOS[name](args, db_path)
+            report['scenarios'][name]['wall_s'] = round(time.perf_counter() - t0, 3)
+            report['scenarios'][name]['peak_rss_mb'] = peak_rss_mb()
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=1000, help='synthetic posts per scenario')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--db', help='SQLite path to use instead of a fresh temporary DB per scenario')
+    parser.add_argument('--scrape-latency', type=float, default=0.0)
+    parser.add_argument('--scrape-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-latency', type=float, default=0.0)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-malformed-rate', type=float, default=0.0, help='share of broken JSON replies')
+    parser.add_argument('--bot-latency', type=float, default=0.0)
+    parser.add_argument('--bot-error-rate', type=float, default=0.0)
+    parser.add_argument('--out', help='also write the JSON report to this file')
+    args = parser.parse_args()
+    result = main(args)
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
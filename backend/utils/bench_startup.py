@@ -0,0 +1,93 @@
+"""Startup benchmark: import time of server.py and time to first request.
+
+Each measurement runs in a fresh interpreter so module caches don't help.
+Time to first request starts uvicorn and polls GET /status until it answers.
+
+Usage (from the repo root, or inside the container):
+    python -m backend.utils.bench_startup
+    docker compose run --rm api python -m backend.utils.bench_startup --runs 5
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def import_time(env):
+    code = "import time; t = time.perf_counter(); import server; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(env, top=10):
+    """Top modules by cumulative import time, from `python -X importtime`."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server"],
+                         env=env, capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return [{'module': name, 'cumulative_ms': round(us / 1000, 1)} for us, name in rows[:top]]
+
+
+def time_to_first_request(env, timeout=60):
+    port = _free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port)],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - t0 < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/status", timeout=1) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - t0
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError("server did not answer within %ds" % timeout)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main(runs=3, db_path=None):
+    env = dict(os.environ)
+    tmpdir = None
+    if not db_path:
+        tmpdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmpdir.name, 'bench.db')
+    env['DB_PATH'] = db_path
+
+    imports = [import_time(env) for _ in range(runs)]
+    first = [time_to_first_request(env) for _ in range(runs)]
+    report = {
+        'runs': runs,
+        'import_server_s': {'median': round(statistics.median(imports), 3), 'min': round(min(imports), 3)},
+        'time_to_first_request_s': {'median': round(statistics.median(first), 3), 'min': round(min(first), 3)},
+        'slowest_imports': slowest_imports(env),
+    }
+    if tmpdir:
+        tmpdir.cleanup()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--db', help='SQLite path to start against (default: a fresh temporary DB)')
+    args = parser.parse_args()
+    print(json.dumps(main(args.runs, args.db), indent=2))
@@ -1,11 +1,12 @@
-import os 
+import json
+import os
 import sqlite3
+import sys
 
-def stats():
-    # return db statistics db is in /data/facebook_posts.db
 
-
-    db_path = "data/facebook_posts.db"
+def stats(db_path=None):
+    # return db statistics for DB_PATH (or the path given on the command line)
+    db_path = db_path or os.getenv('DB_PATH', 'facebook_posts.db')
     if not os.path.exists(db_path):
         print(f"Database not found at {db_path}")
         print(f"Current working directory: {os.getcwd()}")
@@ -28,11 +29,21 @@ def stats():
 
     conn.close()
 
+    # Aggregates (same data as GET /stats)
+    from backend.database import DB
+    db = DB(path=db_path)
+    try:
+        rollups = db.fetch_stats()
+    finally:
+        db.close()
+
     return {
         "table_count": table_count,
-        "row_counts": row_counts
+        "row_counts": row_counts,
+        "status_counts": rollups["status_counts"],
+        "groups": rollups["groups"],
     }
 
 if __name__ == "__main__":
-    s = stats()
-    print(s)
\ No newline at end of file
+    s = stats(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(json.dumps(s, indent=2))
@@ -0,0 +1,210 @@
+"""Local fake image CDN for the attachment pipeline (backend/attachments.py).
+
+Serves deterministic generated images so thumbnails can be exercised without
+Facebook:
+
+    /img/<n>.jpg     a JPEG (PNG without Pillow) derived from n; same n, same bytes
+    /flaky/<n>.jpg   the same image, but every other request fails with HTTP 503
+    /gone/<n>.jpg    HTTP 404, like an expired CDN link
+    /page/<n>        an HTML page instead of an image
+
+`serve()` starts it on a background thread for scripts and tests. Run as a
+module it checks the whole stage end to end: it inserts --posts synthetic
+accepted posts with --images attachments each (a share of them duplicates,
+expired or flaky) into a temporary DB, drains them with an AttachmentWorker
+and prints the outcome, cache size and timing as JSON.
+
+Usage:
+    python -m backend.utils.fake_image_server --serve --port 8099
+    python -m backend.utils.fake_image_server --posts 200 --images 3 --cache-mb 1
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backend.utils.bench_pipeline import make_posts
+
+
+def _png(width, height, rgb):
+    """Solid-colour PNG, for when Pillow is not installed."""
+    def chunk(kind, data):
+        return len(data).to_bytes(4, 'big') + kind + data + zlib.crc32(kind + data).to_bytes(4, 'big')
+    raw = b''.join(b'\x00' + bytes(rgb) * width for _ in range(height))
+    header = width.to_bytes(4, 'big') + height.to_bytes(4, 'big') + b'\x08\x02\x00\x00\x00'
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b'')
+
+
+def make_image(n, width=1280, height=960):
+    """Deterministic image bytes and content type for `n`."""
+    rnd = random.Random(n)
+    rgb = (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256))
+    try:
+        from PIL import Image, ImageDraw
+    except ImportError:
+        return _png(width // 8, height // 8, rgb), 'image/png'
+    img = Image.new('RGB', (width, height), rgb)
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x, y = rnd.randrange(width), rnd.randrange(height)
+        draw.rectangle([x, y, x + rnd.randrange(20, 300), y + rnd.randrange(20, 300)],
+                       fill=(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)))
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=90)
+    return out.getvalue(), 'image/jpeg'
+
+
+class FakeImageHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    requests_served = 0
+    _flaky = {}
+    _lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', ctype='text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with self._lock:
+            FakeImageHandler.requests_served += 1
+        if self.latency:
+            time.sleep(self.latency)
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 2:
+            return self._send(404)
+        kind, name = parts
+        try:
+            n = int(name.split('.')[0])
+        except ValueError:
+            return self._send(404)
+        if kind == 'gone':
+            return self._send(404)
+        if kind == 'page':
+            return self._send(200, b'<html><body>Not an image</body></html>', 'text/html; charset=utf-8')
+        if kind == 'flaky':
+            with self._lock:
+                self._flaky[n] = self._flaky.get(n, 0) + 1
+                fail = self._flaky[n] % 2 == 1
+            if fail:
+                return self._send(503)
+        if kind in ('img', 'flaky'):
+            body, ctype = make_image(n)
+            return self._send(200, body, ctype)
+        return self._send(404)
+
+
+def serve(port=0, latency=0.0):
+    """Start the fake CDN on a daemon thread. Returns (server, base url)."""
+    FakeImageHandler.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def make_attached_posts(base_url, posts, images, seed=0):
+    """Synthetic posts with `images` attachments each, shaped like the group scraper
+    output: 70% unique images, 15% duplicates of earlier ones, 5% expired links,
+    5% flaky and 5% HTML pages.
+    """
+    rnd = random.Random(seed)
+    items = make_posts(posts, seed=seed, prefix='img')
+    counter = 0
+    for item in items:
+        attachments = []
+        for _ in range(images):
+            counter += 1
+            roll = rnd.random()
+            if roll < 0.70:
+                path = f'img/{counter}.jpg'
+            elif roll < 0.85:
+                path = f'img/{rnd.randint(1, max(1, counter // 2))}.jpg'
+            elif roll < 0.90:
+                path = f'gone/{counter}.jpg'
+            elif roll < 0.95:
+                path = f'flaky/{counter}.jpg'
+            else:
+                path = f'page/{counter}'
+            attachments.append({'__typename': 'Photo', 'url': f'https://www.facebook.com/photo/?fbid={counter}',
+                                'photo_image': {'uri': f'{base_url}/{path}'}})
+        item['attachments'] = attachments
+    return items
+
+
+def check(posts, images, cache_mb, concurrency, latency):
+    from backend.attachments import AttachmentWorker, ThumbnailCache
+    from backend.database import DB
+
+    server, base_url = serve(latency=latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'attachments.db')
+        db = DB(path=db_path)
+        items = make_attached_posts(base_url, posts, images)
+        with redirect_stdout(sys.stderr):
+            db.add_items_to_db(items)
+        for item in items:
+            db.promote(item['id'])
+        cache = ThumbnailCache(root=os.path.join(tmp, 'thumbs'), max_bytes=int(cache_mb * 2 ** 20))
+        worker = AttachmentWorker(db_path=db_path, cache=cache, concurrency=concurrency)
+        t0 = time.perf_counter()
+        rounds = 0
+        while rounds < 10:
+            rounds += 1
+            worker.run_once(db)
+            # Retry failures at once instead of after the backoff
+            db.c.execute("UPDATE post_attachments SET next_attempt_at = 0 WHERE status = 'pending'")
+            db.conn.commit()
+            if db.next_attachment_due() is None:
+                break
+        elapsed = time.perf_counter() - t0
+        worker.close()
+        files = sum(len(f) for _, _, f in os.walk(cache.root))
+        report = {
+            'posts': posts,
+            'attachments': posts * images,
+            'elapsed_s': round(elapsed, 3),
+            'attachments_per_s': round(posts * images / elapsed, 1),
+            'rounds': rounds,
+            'http_requests': FakeImageHandler.requests_served,
+            'worker': worker.stats(),
+            'db': db.attachment_stats(),
+            'files_on_disk': files,
+        }
+        db.close()
+    server.shutdown()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--serve', action='store_true', help='only run the fake CDN until interrupted')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per request')
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--images', type=int, default=3, help='attachments per post')
+    parser.add_argument('--cache-mb', type=float, default=500)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+    if args.serve:
+        server, url = serve(args.port, args.latency)
+        print(f'Serving fake images at {url}/img/<n>.jpg', file=sys.stderr)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        print(json.dumps(check(args.posts, args.images, args.cache_mb, args.concurrency, args.latency), indent=2))
@@ -0,0 +1,99 @@
+"""Measure what text normalization saves and whether it changes verdicts.
+
+Runs the analyzer twice on a labeled sample, once on the raw text and once on
+the normalized text, and reports prompt token savings, agreement with the
+stored labels and drift between the two runs.
+
+The sample is read from the DB (classified rows of facebook_posts) or from a
+JSONL file with {"text": ..., "status": "ACCETTATO"|"SCARTATO"} per line.
+
+Usage:
+    python -m backend.utils.preprocess_eval --limit 200
+    python -m backend.utils.preprocess_eval --sample labeled.jsonl --tokens-only
+"""
+import argparse
+import json
+import os
+import time
+
+from backend.preprocess import normalize_post_text, estimate_tokens
+
+
+def load_sample(sample_path=None, db_path=None, limit=200):
+    if sample_path:
+        with open(sample_path, 'r', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        return rows[:limit]
+    from backend.database import DB
+    db = DB(path=db_path)
+    try:
+        rows = db.c.execute(
+            "SELECT id, text, status FROM facebook_posts "
+            "WHERE status IN ('ACCETTATO', 'SCARTATO') AND text IS NOT NULL "
+            "ORDER BY time DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        db.close()
+
+
+def evaluate(rows, tokens_only=False):
+    raw_tokens = 0
+    norm_tokens = 0
+    for r in rows:
+        raw_tokens += estimate_tokens(r['text'])
+        norm_tokens += estimate_tokens(normalize_post_text(r['text']))
+    report = {
+        'posts': len(rows),
+        'raw_tokens': raw_tokens,
+        'normalized_tokens': norm_tokens,
+        'token_savings_pct': round(100 * (1 - norm_tokens / raw_tokens), 1) if raw_tokens else 0.0,
+    }
+    if tokens_only or not rows:
+        return report
+
+    from backend.analyzer import LLMAnalizer
+    model = os.getenv('OLLAMA_MODEL', 'llama3:latest')
+    raw_analyzer = LLMAnalizer(model, preprocess=False)
+    norm_analyzer = LLMAnalizer(model, preprocess=True)
+
+    def verdict(analyzer, row):
+        t0 = time.perf_counter()
+        try:
+            status = analyzer.analize_post({'text': row['text']}).get('status')
+        except Exception:
+            status = None
+        return (status or '').strip().upper(), time.perf_counter() - t0
+
+    agree_raw = agree_norm = drift = 0
+    raw_time = norm_time = 0.0
+    for row in rows:
+        label = (row.get('status') or '').strip().upper()
+        v_raw, t_raw = verdict(raw_analyzer, row)
+        v_norm, t_norm = verdict(norm_analyzer, row)
+        raw_time += t_raw
+        norm_time += t_norm
+        agree_raw += v_raw == label
+        agree_norm += v_norm == label
+        drift += v_raw != v_norm
+
+    n = len(rows)
+    report.update({
+        'label_agreement_raw_pct': round(100 * agree_raw / n, 1),
+        'label_agreement_normalized_pct': round(100 * agree_norm / n, 1),
+        'raw_vs_normalized_drift_pct': round(100 * drift / n, 1),
+        'avg_latency_raw_s': round(raw_time / n, 3),
+        'avg_latency_normalized_s': round(norm_time / n, 3),
+    })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sample', help='JSONL file with text/status rows (default: read from DB)')
+    parser.add_argument('--db', help='SQLite path (default: DB_PATH)')
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--tokens-only', action='store_true', help='skip the LLM, only count tokens')
+    args = parser.parse_args()
+    rows = load_sample(args.sample, args.db, args.limit)
+    print(json.dumps(evaluate(rows, tokens_only=args.tokens_only), indent=2))
@@ -0,0 +1,152 @@
+"""Webhook delivery: persistent outbox, pooled HTTP client, retries.
+
+`enqueue()` only writes the payload to the `webhook_outbox` table, once per
+target (every active subscriber, an optional ad-hoc url such as the one given
+to /start_every, and the webhook of each search profile for the posts it
+accepted), so callers like scheduled_run never wait on the network.
+A WebhookDispatcher thread leases due entries, POSTs them
+concurrently through one keep-alive `requests.Session`, and reschedules
+failures with exponential backoff until WEBHOOK_MAX_ATTEMPTS. Entries survive
+restarts.
+
+With a secret (per subscriber, or WEBHOOK_SECRET for the ad-hoc url) each
+request carries
+    X-Webhook-Timestamp: <unix seconds>
+    X-Webhook-Signature: sha256=<hex HMAC-SHA256 of "<timestamp>.<body>">
+
+Configuration:
+    WEBHOOK_CONCURRENCY   parallel deliveries            (default 4)
+    WEBHOOK_TIMEOUT       per-request timeout, seconds   (default 10)
+    WEBHOOK_MAX_ATTEMPTS  attempts before giving up      (default 8)
+    WEBHOOK_BACKOFF       first retry delay, seconds     (default 5, doubled each attempt, max 1h)
+    WEBHOOK_SECRET        signing secret for the ad-hoc url (optional)
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from collections import deque
+
+import requests
+
+from backend.database import item_id
+from backend.polling import HttpWorker, backoff
+from backend.profiles import load_profiles
+
+logging.basicConfig(level=logging.INFO)
+
+MAX_BACKOFF = 3600
+
+
+def build_payload(items):
+    return {
+        'new_good_count': len(items),
+        'ids': [item_id(i) for i in items],
+        'samples': [(i.get('text') or i.get('message') or '')[:200] for i in items],
+    }
+
+
+def sign(secret, timestamp, body):
+    mac = hmac.new(secret.encode('utf-8'), f"{timestamp}.".encode('utf-8') + body, hashlib.sha256)
+    return f"sha256={mac.hexdigest()}"
+
+
+def enqueue(db, items, webhook_url=None, subscribers=True):
+    """Queue a notification about `items` for every subscriber (and `webhook_url`),
+    plus one per search profile with a webhook about the items it accepted.
+    With subscribers=False only `webhook_url` is notified.
+    Returns the number of deliveries queued.
+    """
+    secret = os.getenv('WEBHOOK_SECRET') or None
+    targets = [(s['url'], s['secret']) for s in db.fetch_webhook_subscribers()] if subscribers else []
+    if webhook_url and webhook_url not in {url for url, _ in targets}:
+        targets.append((webhook_url, secret))
+    if targets:
+        db.enqueue_webhooks(json.dumps(build_payload(items), ensure_ascii=False), targets)
+    queued = len(targets)
+
+    profiles = [p for p in load_profiles() if p.webhook] if subscribers else []
+    if profiles:
+        accepted = db.accepted_profiles(item_id(i) for i in items)
+        for p in profiles:
+            matched = [i for i in items if p.name in accepted.get(item_id(i), ())]
+            if matched:
+                payload = dict(build_payload(matched), profile=p.name)
+                db.enqueue_webhooks(json.dumps(payload, ensure_ascii=False), [(p.webhook, secret)])
+                queued += 1
+    return queued
+
+
+class WebhookDispatcher(HttpWorker):
+    """Drains the webhook outbox. Call `wake()` after enqueueing to deliver at once."""
+    counters = ('delivered', 'retried', 'failed')
+
+    def __init__(self, db_path=None, concurrency=None, timeout=None, max_attempts=None, poll_interval=30.0):
+        super().__init__('webhook-dispatcher', int(concurrency or os.getenv('WEBHOOK_CONCURRENCY', '4')),
+                         db_path=db_path, poll_interval=poll_interval)
+        self.timeout = float(timeout or os.getenv('WEBHOOK_TIMEOUT', '10'))
+        self.max_attempts = int(max_attempts or os.getenv('WEBHOOK_MAX_ATTEMPTS', '8'))
+        self.backoff_base = float(os.getenv('WEBHOOK_BACKOFF', '5'))
+        self._latencies = deque(maxlen=1000)
+
+    def _post(self, entry):
+        body = entry['payload'].encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if entry['secret']:
+            ts = str(int(time.time()))
+            headers['X-Webhook-Timestamp'] = ts
+            headers['X-Webhook-Signature'] = sign(entry['secret'], ts, body)
+        t0 = time.monotonic()
+        try:
+            r = self.session.post(entry['url'], data=body, headers=headers, timeout=self.timeout)
+            error = None if 200 <= r.status_code < 300 else f"HTTP {r.status_code}"
+        except requests.RequestException as e:
+            error = str(e)[:500]
+        return entry, (time.monotonic() - t0) * 1000, error
+
+    def _record(self, db, entry, latency_ms, error):
+        with self._lock:
+            self._latencies.append(latency_ms)
+            if error is None:
+                self._counters['delivered'] += 1
+            elif entry['attempts'] >= self.max_attempts:
+                self._counters['failed'] += 1
+            else:
+                self._counters['retried'] += 1
+        if error is None:
+            db.mark_webhook_delivered(entry['id'], latency_ms)
+        elif entry['attempts'] >= self.max_attempts:
+            logging.warning('Giving up on webhook %s after %d attempts: %s', entry['url'], entry['attempts'], error)
+            db.mark_webhook_failed(entry['id'], error)
+        else:
+            retry_at = time.time() + backoff(entry['attempts'], self.backoff_base, MAX_BACKOFF)
+            db.mark_webhook_failed(entry['id'], error, retry_at=retry_at)
+
+    def run_once(self, db):
+        """Deliver every entry that is due. Returns the number of attempts made."""
+        done = 0
+        while not self._stop_event.is_set():
+            entries = db.claim_webhooks(limit=self.concurrency * 4)
+            if not entries:
+                break
+            for entry, latency_ms, error in self.pool.map(self._post, entries):
+                self._record(db, entry, latency_ms, error)
+            done += len(entries)
+        return done
+
+    def next_due(self, db):
+        return db.next_webhook_due()
+
+    def purge(self, db):
+        db.purge_webhooks()
+
+    def stats(self):
+        with self._lock:
+            lat = sorted(self._latencies)
+            counters = dict(self._counters)
+
+        def pct(p):
+            return round(lat[min(len(lat) - 1, int(p / 100 * len(lat)))], 1) if lat else None
+        return dict(counters, latency_ms={'p50': pct(50), 'p95': pct(95), 'max': round(lat[-1], 1) if lat else None})
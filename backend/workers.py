@@ -0,0 +1,267 @@
+"""Worker mode: the pipeline split over separate processes.
+
+By default server.py scrapes, analyzes and notifies in its own process. With
+WORKER_MODE=1 it only serves reads and enqueues work, and these processes do
+the rest, coordinated through the SQLite DB:
+
+    scraper    runs 'scrape' jobs (run_pipeline) enqueued by /run_now and the
+               schedule; scraped posts go to the analysis queue
+    analyzer   drains the analysis queue with --threads AnalysisWorkers; run
+               one per core (or per LLM endpoint) to scale inference
+    notifier   runs the 'notify' job each accepted post gets: Telegram
+               messages and webhooks, delivered by its WebhookDispatcher
+
+Jobs live in the `jobs` table. A worker leases them (JOB_LEASE seconds) and a
+heartbeat thread renews the leases of its process every WORKER_HEARTBEAT
+seconds while registering it in `workers`; jobs of a process that stops
+heartbeating are leased again by another worker once their lease expires,
+and its pipeline runs are marked interrupted only then. Failed jobs are
+retried with backoff. Posts are analyzed through the same leased
+`analysis_queue` as the in-process AnalysisWorkers.
+
+Usage:
+    python -m backend.workers scraper
+    python -m backend.workers analyzer --threads 2
+    python -m backend.workers notifier
+
+Configuration:
+    WORKER_HEARTBEAT      heartbeat interval, seconds              (default 10)
+    WORKER_STALE_SECONDS  silence after which a process is dead    (default 60)
+    JOB_LEASE             job lease, renewed by heartbeats, s      (default 60)
+"""
+import abc
+import argparse
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+
+from backend import webhooks
+from backend.database import DB, item_id, process_owner
+from backend.polling import PollingWorker, backoff
+from backend.run_pipeline import AnalysisWorker, run_pipeline, send_telegram
+from backend.telegram_bot import BOT
+
+logging.basicConfig(level=logging.INFO)
+
+ROLES = ('scraper', 'analyzer', 'notifier')
+
+
+def job_lease():
+    return float(os.getenv('JOB_LEASE', '60'))
+
+
+class Heartbeat(threading.Thread):
+    """Registers this process in `workers` and renews its job leases until stopped."""
+
+    def __init__(self, role, db_path=None, interval=None):
+        super().__init__(name='heartbeat', daemon=True)
+        self.role = role
+        self.db_path = db_path or os.getenv('DB_PATH', 'facebook_posts.db')
+        self.interval = float(interval or os.getenv('WORKER_HEARTBEAT', '10'))
+        self.owner = process_owner()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        db = DB(path=self.db_path)
+        try:
+            while True:
+                try:
+                    db.heartbeat(self.owner, self.role, lease_seconds=job_lease())
+                except Exception as e:
+                    logging.exception('Heartbeat: %s', e)
+                if self._stop_event.wait(self.interval):
+                    break
+            db.remove_worker(self.owner)
+        finally:
+            db.close()
+
+
+class JobWorker(PollingWorker):
+    """Leases jobs of `kinds` (up to `batch_size` at a time) and hands them to
+    `process()`, which subclasses implement.
+    """
+    kinds = ()
+    batch_size = 1
+    max_attempts = 3
+    retry_errors = True
+    counters = ('done', 'retried', 'failed')
+
+    def __init__(self, db_path=None, poll_interval=2.0, name=None):
+        super().__init__(name or f'{self.kinds[0]}-worker', db_path=db_path, poll_interval=poll_interval)
+        self.owner = process_owner()
+
+    @abc.abstractmethod
+    def process(self, db, jobs):
+        """Run leased `jobs`; returns {job id: result dict or exception}."""
+
+    def run_once(self, db):
+        """Lease and run one batch of due jobs. Returns the number of jobs run."""
+        jobs = db.claim_jobs(self.kinds, self.owner, limit=self.batch_size, lease_seconds=job_lease(),
+                             max_attempts=self.max_attempts)
+        if not jobs:
+            return 0
+        try:
+            outcome = self.process(db, jobs)
+        except Exception as e:
+            logging.exception('%s: %s', self.name, e)
+            outcome = {job['id']: e for job in jobs}
+        for job in jobs:
+            result = outcome.get(job['id'])
+            if not isinstance(result, Exception):
+                db.finish_job(job['id'], self.owner, result)
+                key = 'done'
+            elif not self.retry_errors or job['attempts'] >= self.max_attempts:
+                logging.warning('Giving up on %s job %s: %s', job['kind'], job['id'], result)
+                db.fail_job(job['id'], self.owner, result)
+                key = 'failed'
+            else:
+                db.fail_job(job['id'], self.owner, result, retry_at=time.time() + backoff(job['attempts'], 15, 600))
+                key = 'retried'
+            self.count(key)
+        return len(jobs)
+
+    def next_due(self, db):
+        return db.next_job_due(self.kinds)
+
+    def purge(self, db):
+        db.purge_jobs()
+
+    def run(self):
+        logging.info('%s started (%s)', self.name, self.owner)
+        super().run()
+
+
+class ScrapeWorker(JobWorker):
+    """Runs 'scrape' jobs: one pipeline run each, analysis left to the analyzers.
+    A job whose process died mid-run is run once more; a failed scrape is not
+    retried, the next scheduled one starts from the same time.
+    """
+    kinds = ('scrape',)
+    max_attempts = 2
+    retry_errors = False
+
+    def process(self, db, jobs):
+        job = jobs[0]
+        payload = job['payload']
+        interrupted = db.mark_interrupted_runs()
+        if interrupted:
+            logging.info('Marked runs %s of dead processes interrupted', interrupted)
+        start_time = payload.get('start_time') or db.get_last_run_time()
+        accepted = run_pipeline(db_path=self.db_path, start_time=start_time, inline_analysis=False,
+                                profile=payload.get('profile'))
+        # Next run starts from here, as in server.scheduled_run
+        db.set_last_run_time(datetime.now().strftime('%Y-%m-%dT%H:%M:%S.000'))
+        db.upsert_scheduler_config(last_scrape_time_from=start_time)
+        # The notifier covers subscribers and the configured webhook; a one-off one is only told about this run
+        webhook = payload.get('webhook')
+        if accepted and webhook and webhook != db.get_scheduler_config().get('webhook'):
+            webhooks.enqueue(db, accepted, webhook_url=webhook, subscribers=False)
+        return {job['id']: {'accepted': len(accepted), 'start_time': start_time}}
+
+
+class NotifyWorker(JobWorker):
+    """Runs 'notify' jobs, one per accepted post: a Telegram message per
+    interested chat, and one webhook payload per batch of posts.
+
+    A post is marked notified as soon as its Telegram messages are out. When
+    the webhooks can't be queued the jobs are retried, and a retry of a post
+    already notified only queues its webhook: no message is sent twice.
+    """
+    kinds = ('notify',)
+    batch_size = 50
+    max_attempts = 5
+
+    def __init__(self, db_path=None, dispatcher=None, telegram_notification=True, **kwargs):
+        super().__init__(db_path=db_path, **kwargs)
+        self.dispatcher = dispatcher
+        self.telegram_notification = telegram_notification
+        self.bot = BOT()
+
+    def process(self, db, jobs):
+        outcome = {}
+        items = []
+        rows = {item_id(r): r for r in db.fetch_posts_by_ids([job['payload'].get('id') for job in jobs])}
+        for job in jobs:
+            item = rows.get(job['payload'].get('id'))
+            webhook_only = item is not None and item['stage'] == 'notified' and job['attempts'] > 1
+            if item is None or (item['stage'] != 'promoted' and not webhook_only):
+                # Archived, or notified by another path meanwhile
+                outcome[job['id']] = {'skipped': True}
+                continue
+            if not webhook_only:
+                try:
+                    if self.telegram_notification:
+                        send_telegram(db, self.bot, item)
+                except Exception as e:
+                    outcome[job['id']] = e
+                    continue
+                db.mark_notified(item_id(item))
+            items.append((job, item))
+            outcome[job['id']] = {'notified': item_id(item)}
+        if items:
+            try:
+                queued = webhooks.enqueue(db, [item for _, item in items],
+                                          webhook_url=db.get_scheduler_config().get('webhook'))
+            except Exception as e:
+                logging.exception('Failed to queue webhooks of %d notified posts: %s', len(items), e)
+                for job, _ in items:
+                    outcome[job['id']] = e
+                return outcome
+            if queued and self.dispatcher is not None:
+                self.dispatcher.wake()
+            logging.info('Notified %d accepted posts (%d webhook deliveries)', len(items), queued)
+        return outcome
+
+
+def start(role, threads=1, telegram_notification=True, db_path=None):
+    """Start the threads of `role` in this process. Returns them, heartbeat first."""
+    started = [Heartbeat(role, db_path=db_path)]
+    if role == 'scraper':
+        started.append(ScrapeWorker(db_path=db_path))
+    elif role == 'analyzer':
+        started += [AnalysisWorker(db_path=db_path, name=f'analysis-worker-{n}', notify_inline=False,
+                                   telegram_notification=telegram_notification) for n in range(threads)]
+    elif role == 'notifier':
+        dispatcher = webhooks.WebhookDispatcher(db_path=db_path)
+        started += [dispatcher, NotifyWorker(db_path=db_path, dispatcher=dispatcher,
+                                             telegram_notification=telegram_notification)]
+    else:
+        raise ValueError(f'Unknown worker role {role!r}, expected one of {ROLES}')
+    for thread in started:
+        thread.start()
+    return started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('role', choices=ROLES)
+    parser.add_argument('--threads', type=int, default=int(os.getenv('ANALYSIS_WORKERS', '1')) or 1,
+                        help='analysis threads of an analyzer process')
+    parser.add_argument('--no-telegram', action='store_true', help='mark posts notified without Telegram messages')
+    args = parser.parse_args(argv)
+
+    stopping = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopping.set())
+    started = start(args.role, threads=max(1, args.threads), telegram_notification=not args.no_telegram)
+    logging.info('%s worker %s running %d threads', args.role, process_owner(), len(started) - 1)
+    stopping.wait()
+    logging.info('Stopping %s worker %s', args.role, process_owner())
+    # Work in progress finishes before the heartbeat stops and the process is considered gone
+    heartbeat, threads = started[0], started[1:]
+    for thread in threads:
+        thread.stop()
+    for thread in threads:
+        thread.join(timeout=30)
+    heartbeat.stop()
+    heartbeat.join(timeout=5)
+
+
+if __name__ == '__main__':
+    main()
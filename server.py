@@ -1,24 +1,34 @@
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 import os
 import logging
+import threading
 from datetime import timedelta, datetime
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, Response, StreamingResponse
 from pathlib import Path
 
-from backend.run_pipeline import run_pipeline, analyze_pending
-from backend.database import DB
+from backend.run_pipeline import run_pipeline, analyze_pending, resume_interrupted, AnalysisWorker
+from backend.analyzer import get_backend
+from backend.database import DB, item_id
+from backend.seen_ids import SeenIds
 from backend.scraper import Scraper
+from backend.retention import run_retention
+from backend.export import export_stream, has_parquet, FORMATS as EXPORT_FORMATS
+from backend import attachments, decoding, profiling, webhooks
+from backend.profiles import load_profiles
 
 logging.basicConfig(level=logging.INFO)
 
 app = FastAPI(title='Pipeline Scheduler')
-db = DB()
+# Any request with ?profiling=1 is profiled; /run_now and /analyze_pending take ?profile=1 for their run
+app.router.route_class = profiling.ProfiledRoute
+app.add_middleware(profiling.ProfilingMiddleware, get_db=lambda: db, skip=('/run_now', '/analyze_pending'))
+db = None  # opened in startup() so importing this module stays cheap
 LAST_RUN_TIME = None  # ISO-like string used for next scheduled run start (persisted)
 LAST_SKIPPED_BASELINE = None  # Guard to avoid repeated skip resets until a successful run advances LAST_RUN_TIME
 
@@ -41,31 +51,70 @@ class NotifyConfig(BaseModel):
     webhook: Optional[str] = None
 
 
-scheduler = BackgroundScheduler()
-scheduler.start()
+class WebhookSubscriber(BaseModel):
+    url: str
+    secret: Optional[str] = None
+
+
+scheduler = BackgroundScheduler()  # started in startup()
+
+# Last archival/vacuum run (nightly or POST /retention), reported by /status
+LAST_RETENTION = None
+_RETENTION_LOCK = threading.Lock()
+
+# Worker mode: scraping, analysis and notifications run in separate processes
+# (python -m backend.workers scraper|analyzer|notifier); this one only enqueues jobs and serves reads
+WORKER_MODE = os.getenv('WORKER_MODE', '0') == '1'
+HEARTBEAT = None
+
+# Long-lived analysis workers draining the DB work queue (0 = analyze inline in each run)
+ANALYSIS_WORKERS = 0 if WORKER_MODE else int(os.getenv('ANALYSIS_WORKERS', '1'))
+WORKERS = []
+
+# Delivers queued webhook notifications in background (created in startup(); the notifier process in worker mode)
+DISPATCHER = None
+
+# Semantic search over post embeddings, opt-in (needs numpy; see backend/embeddings.py)
+EMBEDDINGS = os.getenv('EMBEDDINGS', '0') == '1'
+SEMANTIC_CANDIDATES = int(os.getenv('SEMANTIC_CANDIDATES', '1000'))
+EMBEDDING_WORKER = None
+
+# Thumbnails of the images of accepted posts, served from a local cache (see backend/attachments.py)
+THUMBNAILS = os.getenv('THUMBNAILS', '1') == '1'
+ATTACHMENTS = None
 
 # Keep last seen ids to notify only on new goods
-LAST_SEEN_IDS = set()  # persisted via DB (initialized at startup from good_facebook_posts)
+LAST_SEEN_IDS = SeenIds()  # compact hashed set, initialized at startup from good_facebook_posts
+_SEEN_LOCK = threading.Lock()
+
+
+def claim_unseen(items):
+    """The items not reported yet, marked seen. A run and the analysis workers
+    finishing its posts after it stopped waiting report each post only once.
+    """
+    with _SEEN_LOCK:
+        unseen = [i for i in items if not LAST_SEEN_IDS.contains_item(i)]
+        for i in unseen:
+            LAST_SEEN_IDS.add_item(i)
+    return unseen
 
 
-def notify_new_items(new_items, webhook_url=None):
+def notify_new_items(new_items, webhook_url=None, conn=None):
+    """Queue a webhook notification for every subscriber and `webhook_url`.
+    Delivery happens on the WebhookDispatcher thread, never in the caller.
+    Callers on another thread pass their own DB as `conn`.
+    """
     if not new_items:
         return
-    # Simple notification: either POST to webhook URL with JSON or log
-    payload = {
-        'new_good_count': len(new_items),
-        'ids': [i.get('id') for i in new_items],
-        'samples': [i.get('text')[:200] for i in new_items]
-    }
-    if webhook_url:
-        try:
-            import requests
-            requests.post(webhook_url, json=payload, timeout=10)
-            logging.info('Notified webhook %s about %d new items', webhook_url, len(new_items))
-        except Exception as e:
-            logging.exception('Failed to notify webhook: %s', e)
+    if ATTACHMENTS is not None:
+        ATTACHMENTS.wake()
+    queued = webhooks.enqueue(conn or db, new_items, webhook_url=webhook_url)
+    if queued:
+        if DISPATCHER is not None:
+            DISPATCHER.wake()
+        logging.info('Queued %d webhook deliveries about %d new items', queued, len(new_items))
     else:
-        logging.info('New good items found: %s', payload)
+        logging.info('New good items found: %s', webhooks.build_payload(new_items))
 
 
 def _normalize_start_time(ts: str | None) -> str | None:
@@ -87,19 +136,33 @@ def _normalize_start_time(ts: str | None) -> str | None:
     return ts
 
 
-def scheduled_run(webhook_url=None, start_time: str | None = None):
+def enqueue_scrape(webhook_url=None, start_time: str | None = None, profile=None):
+    """Worker mode: queue a 'scrape' job for a scraper process. At most one scrape
+    waits or runs at a time. Returns the job id, or None if one is already queued.
+    """
+    global LAST_RUN_TIME
+    # Scraper processes advance it in the DB
+    LAST_RUN_TIME = db.get_last_run_time()
+    job = db.enqueue_job('scrape', {'start_time': _normalize_start_time(start_time), 'webhook': webhook_url,
+                                    'profile': profile}, key='scrape')
+    if job is None:
+        logging.info('A scrape job is already queued or running; not queueing another')
+    return job
+
+
+def scheduled_run(webhook_url=None, start_time: str | None = None, profile=None):
+    if WORKER_MODE:
+        enqueue_scrape(webhook_url, start_time, profile)
+        return
     logging.info('Scheduled run starting...')
     global LAST_RUN_TIME
     # For scheduled runs: use provided start_time override or fallback to LAST_RUN_TIME
     eff_start = _normalize_start_time(start_time) or LAST_RUN_TIME
-    new_good = run_pipeline(start_time=eff_start)
+    new_good = run_pipeline(start_time=eff_start, inline_analysis=not WORKERS, profile=profile)
     # filter only items not seen before
-    global LAST_SEEN_IDS
-    unseen = [i for i in new_good if i.get('id') not in LAST_SEEN_IDS]
+    unseen = claim_unseen(new_good)
     if unseen:
         notify_new_items(unseen, webhook_url=webhook_url)
-        for i in unseen:
-            LAST_SEEN_IDS.add(i.get('id'))
     else:
         logging.info('No new accepted items since last run')
     # After a successful run, set LAST_RUN_TIME to now for the next iteration
@@ -116,19 +179,67 @@ def scheduled_run(webhook_url=None, start_time: str | None = None):
         pass
 
 
-def analyze_pending_run(webhook_url=None):
+def analyze_pending_run(webhook_url=None, profile=None):
     logging.info('Analyze-pending run starting...')
-    new_good = analyze_pending()
-    global LAST_SEEN_IDS
-    unseen = [i for i in new_good if i.get('id') not in LAST_SEEN_IDS]
+    new_good = analyze_pending(inline_analysis=not (WORKERS or WORKER_MODE), profile=profile)
+    unseen = claim_unseen(new_good)
     if unseen:
         notify_new_items(unseen, webhook_url=webhook_url)
-        for i in unseen:
-            LAST_SEEN_IDS.add(i.get('id'))
     else:
         logging.info('No new accepted items from pending analysis')
 
 
+def retention_run(days=None):
+    """Archive old posts and vacuum (see backend/retention.py), one run at a
+    time; the outcome is kept in LAST_RETENTION for /status.
+    """
+    global LAST_RETENTION
+    if not _RETENTION_LOCK.acquire(blocking=False):
+        logging.info('Retention already running, skipped')
+        return
+    try:
+        LAST_RETENTION = {'status': 'running', 'started_at': datetime.now().isoformat(timespec='seconds')}
+        try:
+            report = run_retention(days=days)
+        except Exception as e:
+            logging.exception('Retention failed: %s', e)
+            LAST_RETENTION = dict(LAST_RETENTION, status='failed', error=str(e)[:500])
+        else:
+            LAST_RETENTION = dict(LAST_RETENTION, status='done', report=report)
+        LAST_RETENTION['finished_at'] = datetime.now().isoformat(timespec='seconds')
+    finally:
+        _RETENTION_LOCK.release()
+
+
+def resume_run(webhook_url=None):
+    """Finish items left mid-pipeline by a previous process (crash/restart)."""
+    if WORKER_MODE:
+        # Analysis and notifications are queued for the worker processes
+        resume_interrupted(inline_analysis=False, notify_inline=False)
+        return
+    new_good = resume_interrupted(inline_analysis=not WORKERS)
+    unseen = claim_unseen(new_good)
+    if unseen:
+        notify_new_items(unseen, webhook_url=webhook_url)
+
+
+def on_worker_accepted(item, source, worker_db):
+    """Webhook for posts accepted by the analysis workers outside a run
+    (backlog and resumed posts, and posts of a run that stopped waiting for
+    them); a run still in progress notifies its own results. Runs on the
+    worker thread, so every query goes through the worker's `worker_db`.
+    """
+    if source == 'scrape' and item.get('run_id') is not None and worker_db.run_status(item['run_id']) == 'running':
+        return
+    if not claim_unseen([item]):
+        return
+    try:
+        webhook = worker_db.get_scheduler_config().get('webhook')
+    except Exception:
+        webhook = None
+    notify_new_items([item], webhook_url=webhook, conn=worker_db)
+
+
 def _minutes_from_cfg(cfg: dict | None) -> int | None:
     """Return a representative minutes interval from scheduler cfg.
     For day/night mode, prefer the currently active window's minutes.
@@ -170,7 +281,9 @@ def check_missed_runs():
     """Background monitor that detects missed runs and schedules a catch-up run if overdue."""
     try:
         cfg = db.get_scheduler_config()
-        global LAST_SKIPPED_BASELINE
+        global LAST_SKIPPED_BASELINE, LAST_RUN_TIME
+        if WORKER_MODE:
+            LAST_RUN_TIME = db.get_last_run_time()
         if not cfg or not cfg.get('active') or not LAST_RUN_TIME:
             return
         last_run = datetime.fromisoformat(LAST_RUN_TIME.replace('.000', ''))
@@ -243,8 +356,10 @@ def _schedule_day_night(minutes_day: int | None, minutes_night: int | None, day_
 
 @app.on_event('startup')
 def startup():
-    """Restore persisted scheduler state and seen IDs."""
-    global LAST_RUN_TIME, LAST_SEEN_IDS, LAST_SKIPPED_BASELINE
+    """Open the DB, start the scheduler and restore persisted scheduler state and seen IDs."""
+    global db, LAST_RUN_TIME, LAST_SEEN_IDS, LAST_SKIPPED_BASELINE
+    db = DB()
+    scheduler.start()
     try:
         # Restore last run time
         LAST_RUN_TIME = db.get_last_run_time()
@@ -253,9 +368,11 @@ def startup():
 
     try:
         # Initialize seen ids from accepted posts
-        LAST_SEEN_IDS = set(db.fetch_good_ids())
-    except Exception:
-        LAST_SEEN_IDS = set()
+        LAST_SEEN_IDS = SeenIds.from_db(db)
+        logging.info('Loaded %d seen ids (%d bytes)', len(LAST_SEEN_IDS), LAST_SEEN_IDS.nbytes())
+    except Exception as e:
+        logging.exception('Failed to load seen ids: %s', e)
+        LAST_SEEN_IDS = SeenIds()
 
     # Restore scheduled job(s) if persisted as active
     try:
@@ -308,8 +425,90 @@ def startup():
     except Exception as e:
         logging.exception(f"Failed to initialize missed-run detection: {e}")
 
+    # Analysis workers: fresh posts first, the backlog of unclassified posts in idle time
+    try:
+        for n in range(ANALYSIS_WORKERS):
+            worker = AnalysisWorker(on_accepted=on_worker_accepted, name=f'analysis-worker-{n}')
+            worker.start()
+            WORKERS.append(worker)
+        if WORKERS:
+            logging.info('Started %d analysis workers; %d backlog items queued', len(WORKERS), db.enqueue_backlog())
+    except Exception as e:
+        logging.exception(f"Failed to start analysis workers: {e}")
+
+    # Worker mode: the analysis queue is drained by analyzer processes
+    global HEARTBEAT
+    if WORKER_MODE:
+        try:
+            from backend.workers import Heartbeat
+            HEARTBEAT = Heartbeat('api')
+            HEARTBEAT.start()
+            logging.info('Worker mode: %d backlog items queued for analyzer processes', db.enqueue_backlog())
+        except Exception as e:
+            logging.exception(f"Failed to start worker mode heartbeat: {e}")
+
+    # Webhook deliveries queued before a restart go out now (by the notifier process in worker mode)
+    global DISPATCHER
+    try:
+        if not WORKER_MODE:
+            DISPATCHER = webhooks.WebhookDispatcher()
+            DISPATCHER.start()
+    except Exception as e:
+        logging.exception(f"Failed to start webhook dispatcher: {e}")
+
+    # Embedding index: loads stored vectors, then embeds new posts as they arrive
+    global EMBEDDING_WORKER
+    if EMBEDDINGS:
+        try:
+            from backend.embeddings import EmbeddingWorker
+            EMBEDDING_WORKER = EmbeddingWorker()
+            EMBEDDING_WORKER.start()
+        except Exception as e:
+            logging.exception(f"Failed to start embedding worker: {e}")
+
+    # Fetches images of accepted posts into the thumbnail cache
+    global ATTACHMENTS
+    if THUMBNAILS:
+        try:
+            ATTACHMENTS = attachments.AttachmentWorker()
+            ATTACHMENTS.start()
+        except Exception as e:
+            logging.exception(f"Failed to start attachment worker: {e}")
+
+    # Resume any run interrupted by a crash/restart, in background so startup stays fast
+    try:
+        scheduler.add_job(resume_run, kwargs={'webhook_url': db.get_scheduler_config().get('webhook')}, id='resume_interrupted')
+    except Exception as e:
+        logging.exception(f"Failed to schedule resume of interrupted runs: {e}")
+
+    # Nightly archival of old classified posts, enabled by RETENTION_DAYS
+    try:
+        if os.getenv('RETENTION_DAYS') and scheduler.get_job('retention_job') is None:
+            scheduler.add_job(retention_run, CronTrigger(hour=int(os.getenv('RETENTION_HOUR', '4')), minute=0), id='retention_job')
+            logging.info('Scheduled retention job: archive classified posts older than %s days', os.getenv('RETENTION_DAYS'))
+    except Exception as e:
+        logging.exception(f"Failed to schedule retention job: {e}")
+
+    # Periodically probe LLM endpoints marked down by the load balancer
+    try:
+        backend = get_backend()
+        if hasattr(backend, 'check_health') and scheduler.get_job('llm_health_check') is None:
+            scheduler.add_job(backend.check_health, 'interval', seconds=backend.cooldown, id='llm_health_check')
+    except Exception as e:
+        logging.exception(f"Failed to initialize LLM health checks: {e}")
+
 @app.on_event('shutdown')
 def shutdown():
+    for worker in WORKERS:
+        worker.stop()
+    if DISPATCHER is not None:
+        DISPATCHER.stop()
+    if HEARTBEAT is not None:
+        HEARTBEAT.stop()
+    if EMBEDDING_WORKER is not None:
+        EMBEDDING_WORKER.stop()
+    if ATTACHMENTS is not None:
+        ATTACHMENTS.stop()
     try:
         scheduler.shutdown(wait=False)
     except Exception:
@@ -372,20 +571,108 @@ def start_every(minutes: int | None = 30, day_minutes: int | None = None, night_
 
 
 @app.post('/run_now')
-def run_now(background_tasks: BackgroundTasks, start_time: str | None = None, cfg: NotifyConfig = None):
+def run_now(background_tasks: BackgroundTasks, start_time: str | None = None, cfg: NotifyConfig = None,
+            profile: bool = False):
+    """Start a pipeline run now; with ?profile=1 the run is profiled (see /profiling)."""
     webhook = cfg.webhook if cfg else None
     # Use provided start_time if given (from UI), else fallback to LAST_RUN_TIME
+    if WORKER_MODE:
+        # A scraper process picks it up; without start_time it continues from the last run
+        job = enqueue_scrape(webhook, start_time, profile or None)
+        return {'status': 'queued' if job else 'already_queued', 'job': job, 'webhook': webhook,
+                'start_time': _normalize_start_time(start_time), 'profile': profile}
     start_time = _normalize_start_time(start_time) or LAST_RUN_TIME
-    background_tasks.add_task(scheduled_run, webhook, start_time)
-    return {'status': 'scheduled_now', 'webhook': webhook, 'start_time': start_time}
+    background_tasks.add_task(scheduled_run, webhook, start_time, profile or None)
+    return {'status': 'scheduled_now', 'webhook': webhook, 'start_time': start_time, 'profile': profile}
 
 
 @app.post('/analyze_pending')
-def analyze_pending_endpoint(background_tasks: BackgroundTasks, cfg: NotifyConfig = None):
-    """Analyze only posts with NULL status in background. Optional JSON {"webhook": "https://..."}."""
+def analyze_pending_endpoint(background_tasks: BackgroundTasks, cfg: NotifyConfig = None, profile: bool = False):
+    """Analyze only posts with NULL status in background. Optional JSON {"webhook": "https://..."}.
+    With ?profile=1 the run is profiled.
+    """
     webhook = cfg.webhook if cfg else None
-    background_tasks.add_task(analyze_pending_run, webhook)
-    return {'status': 'analyze_pending_scheduled', 'webhook': webhook}
+    background_tasks.add_task(analyze_pending_run, webhook, profile or None)
+    return {'status': 'analyze_pending_scheduled', 'webhook': webhook, 'profile': profile}
+
+@app.post('/analyze_failed')
+def analyze_failed():
+    """Queue again the posts whose LLM reply could not be decoded (stage 'failed'),
+    e.g. after changing model or prompt. The analysis workers, or the next
+    /analyze_pending without workers, pick them up.
+    """
+    reset = db.requeue_failed_analysis()
+    queued = db.enqueue_backlog()
+    return {'status': 'requeued', 'posts': reset, 'queued': queued}
+
+@app.get('/webhooks')
+def list_webhooks():
+    """Webhook subscribers (secrets hidden), outbox counts and delivery metrics."""
+    subscribers = [dict(s, secret=bool(s['secret'])) for s in db.fetch_webhook_subscribers(active_only=False)]
+    return {'subscribers': subscribers, 'outbox': db.webhook_outbox_stats(),
+            'delivery': DISPATCHER.stats() if DISPATCHER is not None else None}
+
+@app.post('/webhooks')
+def add_webhook(sub: WebhookSubscriber):
+    """Subscribe `url` to accepted-post notifications; with `secret` requests are HMAC signed."""
+    return {'id': db.add_webhook_subscriber(sub.url, sub.secret), 'url': sub.url}
+
+@app.delete('/webhooks/{subscriber_id}')
+def remove_webhook(subscriber_id: int):
+    if not db.remove_webhook_subscriber(subscriber_id):
+        raise HTTPException(status_code=404, detail='No such subscriber')
+    return {'status': 'removed', 'id': subscriber_id}
+
+@app.get('/profiles')
+def profiles():
+    """Configured search profiles with their classified/accepted post counts."""
+    counts = db.profile_stats()
+    return {'profiles': [dict(p.model_dump(exclude={'criteria'}), criteria=bool(p.criteria),
+                              **counts.get(p.name, {'classified': 0, 'accepted': 0}))
+                         for p in load_profiles()]}
+
+@app.get('/runs')
+def runs(limit: int = 20):
+    """Pipeline run journal, newest first."""
+    return {'runs': db.fetch_runs(limit=limit)}
+
+@app.get('/workers')
+def workers(limit: int = 20):
+    """Worker mode: registered processes with their heartbeats, job counts and the latest jobs."""
+    return {'worker_mode': WORKER_MODE, 'workers': db.fetch_workers(), 'jobs': db.job_stats(),
+            'recent_jobs': db.fetch_jobs(limit=limit)}
+
+@app.get('/profiling')
+def list_run_profiles(limit: int = 20):
+    """Recorded profiles (PROFILE=1, ?profile=1 on runs, ?profiling=1 on requests), newest first, with their summary."""
+    return {'profiles': db.fetch_profiles(limit=limit)}
+
+@app.get('/profiling/{profile_id}')
+def run_profile(profile_id: int):
+    profile = db.fetch_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail='Profile not found')
+    return profile
+
+@app.get('/profiling/{profile_id}/{name}')
+def run_profile_artifact(profile_id: int, name: str):
+    """Download one artifact of a profile: cpu.prof, cpu.txt, wall.txt, wall.folded or memory.txt."""
+    data = db.fetch_profile_artifact(profile_id, name)
+    if data is None:
+        raise HTTPException(status_code=404, detail='Profile artifact not found')
+    media_type = profiling.CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream')
+    return Response(data, media_type=media_type,
+                    headers={'Content-Disposition': f'attachment; filename="profile-{profile_id}-{name}"'})
+
+@app.post('/retention')
+def retention(background_tasks: BackgroundTasks, days: int | None = None):
+    """Archive classified posts older than `days` (default RETENTION_DAYS or 30) and vacuum the DB
+    in background; the report shows up under `retention` in /status.
+    """
+    if _RETENTION_LOCK.locked():
+        return {'status': 'already_running', 'retention': LAST_RETENTION}
+    background_tasks.add_task(retention_run, days)
+    return {'status': 'retention_scheduled', 'days': days}
 
 @app.post('/populate_db')
 def populate_db():
@@ -445,6 +732,32 @@ def status():
             pass
     except Exception:
         pass
+    info['seen_ids'] = LAST_SEEN_IDS.stats()
+    info['retention'] = LAST_RETENTION
+    try:
+        info['analysis_queue'] = db.queue_stats()
+        info['analysis_workers'] = len(WORKERS)
+        info['decoding'] = dict(decoding.stats(), failed_posts=db.failed_analysis_count())
+    except Exception:
+        pass
+    if EMBEDDING_WORKER is not None:
+        info['embeddings'] = EMBEDDING_WORKER.stats()
+    if ATTACHMENTS is not None:
+        try:
+            info['thumbnails'] = dict(ATTACHMENTS.stats(), **db.attachment_stats())
+        except Exception:
+            pass
+    try:
+        info['webhooks'] = dict(DISPATCHER.stats() if DISPATCHER is not None else {},
+                                outbox=db.webhook_outbox_stats())
+    except Exception:
+        pass
+    try:
+        backend = get_backend()
+        if hasattr(backend, 'stats'):
+            info['llm_endpoints'] = backend.stats()
+    except Exception:
+        pass
     return info
 
 
@@ -466,9 +779,106 @@ def cancel():
 
 
 @app.get('/posts')
-def get_posts(table: str = 'facebook_posts', limit: int = 50, offset: int = 0, search: Optional[str] = None):
+def get_posts(table: str = 'facebook_posts', limit: int = 50, offset: int = 0, search: Optional[str] = None,
+              min_price: Optional[int] = None, max_price: Optional[int] = None, zone: Optional[str] = None,
+              room_type: Optional[str] = None, available_by: Optional[str] = None, profile: Optional[str] = None,
+              semantic: Optional[str] = None, since: Optional[int] = None):
     """List posts from the database. Table can be 'facebook_posts' or 'good_facebook_posts'.
-    Supports optional text search (on `text`), limit and offset.
+    Supports optional text search (on `text`), limit and offset, and indexed filters on the
+    extracted listing fields: min_price/max_price (€), zone, room_type and available_by (YYYY-MM-DD).
+    `profile` keeps only posts accepted by that search profile.
+    `semantic` ranks posts by meaning instead of time (needs EMBEDDINGS=1); every item gets a `score`.
+    `since` returns only rows added or changed after that cursor (start with 0), oldest
+    change first and up to 1000 per call, with the `cursor` to pass next and `more` when
+    another page is ready: clients keep a copy of the table and fetch only deltas.
     """
-    items = db.fetch_items(table=table, limit=limit, offset=offset, search=search)
+    if since is not None and semantic:
+        raise HTTPException(status_code=400, detail='since cannot be combined with semantic search')
+    ids = scores = None
+    if semantic:
+        worker = _embedding_worker()
+        hits = worker.index.search(worker.embedder.embed([semantic])[0], k=SEMANTIC_CANDIDATES)
+        scores = dict(hits)
+        ids = [pid for pid, _ in hits]
+    items = db.fetch_items(table=table, limit=limit, offset=offset, search=search,
+                           min_price=min_price, max_price=max_price, zone=zone,
+                           room_type=room_type, available_by=available_by, profile=profile, ids=ids,
+                           since=since)
+    if scores is not None:
+        for item in items:
+            item['score'] = round(scores[item['id']], 4)
+    if since is not None:
+        cursor = items[-1]['seq'] if items else since
+        return {'count': len(items), 'items': items, 'cursor': cursor, 'more': len(items) == max(1, min(limit, 1000))}
     return { 'count': len(items), 'items': items }
+
+
+def _embedding_worker():
+    if EMBEDDING_WORKER is None:
+        raise HTTPException(status_code=400, detail='Semantic search is disabled, set EMBEDDINGS=1')
+    if not EMBEDDING_WORKER.ready:
+        raise HTTPException(status_code=503, detail='Embedding index is loading')
+    return EMBEDDING_WORKER
+
+
+@app.get('/posts/{post_id}/similar')
+def similar_posts(post_id: str, table: str = 'facebook_posts', limit: int = 10):
+    """Posts closest in meaning to `post_id` (needs EMBEDDINGS=1), best first, with a `score`."""
+    worker = _embedding_worker()
+    vector = worker.index.vector(post_id)
+    if vector is None:
+        rows = db.fetch_posts_by_ids([post_id])
+        if not rows:
+            raise HTTPException(status_code=404, detail='No such post')
+        vector = worker.embedder.embed([rows[0]['text'] or ''])[0]
+    limit = max(1, min(int(limit), 200))
+    hits = worker.index.search(vector, k=SEMANTIC_CANDIDATES, exclude=post_id)
+    scores = dict(hits)
+    items = db.fetch_items(table=table, limit=limit, ids=[pid for pid, _ in hits])
+    for item in items:
+        item['score'] = round(scores[item['id']], 4)
+    return {'count': len(items), 'items': items}
+
+
+@app.get('/export')
+def export(table: str = 'facebook_posts', format: str = 'ndjson', since: Optional[str] = None,
+           until: Optional[str] = None, status: Optional[str] = None):
+    """Stream a whole table as NDJSON, CSV or Parquet (if pyarrow is installed), oldest first.
+    Optional time range since <= time < until (YYYY-MM-DD or ISO timestamp) and status
+    (ACCETTATO, SCARTATO or 'pending'). Rows are read in batches from a dedicated
+    connection, so memory stays flat and other requests are not blocked.
+    """
+    if table not in ('facebook_posts', 'good_facebook_posts'):
+        raise HTTPException(status_code=400, detail='table must be facebook_posts or good_facebook_posts')
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if format == 'parquet' and not has_parquet():
+        raise HTTPException(status_code=400, detail="Parquet export needs the optional 'pyarrow' package")
+    filename = f"{table}.{format}"
+    return StreamingResponse(export_stream(table=table, fmt=format, since=since, until=until, status=status),
+                             media_type=EXPORT_FORMATS[format],
+                             headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+@app.get('/stats')
+def stats(hours: int = 48):
+    """Counts per status, acceptance rate per group (inputUrl), posts per hour and LLM
+    latency per hour (last `hours` hours with data), read from incrementally
+    maintained rollup tables in constant time.
+    """
+    return db.fetch_stats(hours=hours)
+
+
+@app.get('/thumbs/{name}')
+def thumbnail(name: str):
+    """Cached thumbnail of a post image, by the `thumb` name returned with /posts items.
+    Names are content hashes, so responses are cacheable forever.
+    """
+    if ATTACHMENTS is None or not attachments.NAME_RE.match(name):
+        raise HTTPException(status_code=404, detail='Thumbnail not found')
+    path = ATTACHMENTS.cache.path(name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail='Thumbnail not found')
+    ATTACHMENTS.cache.touch(name)
+    return FileResponse(path, media_type=attachments.content_type(name),
+                        headers={'Cache-Control': 'public, max-age=31536000, immutable'})
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A migrated DB in a temporary directory; the repo root is the cwd, as for server.py."""
+    from backend.database import DB
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'test.db'))
+    db = DB(path=str(tmp_path / 'test.db'))
+    yield db
+    db.close()
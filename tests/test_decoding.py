@@ -0,0 +1,25 @@
+import pytest
+
+from backend.decoding import DecodeError, parse_status
+
+
+@pytest.mark.parametrize('value', ['ACCETTATO', 'Accettato', 'accettata', 'accepted', 'Approved', 'Valido',
+                                   'idonea', 'È stato accettato', 'ACCETTATO.', 'Non ci sono problemi: accettato',
+                                   'NOT a scam - accepted', True])
+def test_accepted(value):
+    assert parse_status(value) == 'ACCETTATO'
+
+
+@pytest.mark.parametrize('value', ['SCARTATO', 'scartata', 'rifiutato', 'rejected', 'NON ACCETTATO',
+                                   'not accepted', 'invalid', 'Not valid', 'non idoneo', 'unacceptable',
+                                   'Non approvato', 'not approved', 'not been accepted', 'non è stato accettato',
+                                   'disapproved', 'inaccettabile', False])
+def test_rejected(value):
+    assert parse_status(value) == 'SCARTATO'
+
+
+@pytest.mark.parametrize('value', ['accettato/scartato', 'accepted, rejected', 'not rejected', 'boh', '',
+                                   'unaccepted but valid', None, 1])
+def test_ambiguous_or_unknown_raises(value):
+    with pytest.raises(DecodeError):
+        parse_status(value)
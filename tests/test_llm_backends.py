@@ -0,0 +1,37 @@
+from backend.llm_backends import BalancedBackend, FakeBackend
+
+
+class Flaky(FakeBackend):
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.up = True
+        self.calls = 0
+
+    def chat(self, *args, **kwargs):
+        self.calls += 1
+        if not self.up:
+            raise ConnectionError(f"{self.name} is down")
+        return super().chat(*args, **kwargs)
+
+    def health(self):
+        return self.up
+
+
+def test_down_endpoint_waits_for_a_health_probe():
+    a, b = Flaky('a'), Flaky('b')
+    balanced = BalancedBackend([a, b], cooldown=0.0)
+    a.up = False
+    balanced.chat('system', 'user', {}, 'model')
+    assert a.calls == 1
+
+    # Even with the cooldown long over, only a successful probe brings `a` back
+    for _ in range(3):
+        balanced.chat('system', 'user', {}, 'model')
+    balanced.check_health()
+    assert a.calls == 1
+    assert [s['healthy'] for s in balanced.stats()] == [False, True]
+
+    a.up = True
+    balanced.check_health()
+    assert [s['healthy'] for s in balanced.stats()] == [True, True]
@@ -0,0 +1,106 @@
+import sqlite3
+
+import pytest
+
+from backend import migrations
+from backend.database import DB
+
+POST_COLUMNS = """
+    url TEXT, time TEXT, user TEXT, text TEXT, topReactionsCount INTEGER, feedbackId TEXT,
+    id TEXT PRIMARY KEY, legacyId TEXT, attachments TEXT, likesCount INTEGER, sharesCount INTEGER,
+    commentsCount INTEGER, facebookId TEXT, groupTitle TEXT, inputUrl TEXT, status TEXT"""
+
+# Schema written by DB() before versioning: posts, accepted posts and the scheduler singleton
+BASELINE_SCHEMA = f"""
+CREATE TABLE facebook_posts ({POST_COLUMNS}, motivo TEXT);
+CREATE TABLE good_facebook_posts ({POST_COLUMNS});
+CREATE TABLE scheduler_config (id INTEGER PRIMARY KEY CHECK (id = 1), active INTEGER DEFAULT 0, minutes INTEGER,
+                               webhook TEXT, last_run_time TEXT);
+"""
+
+# Pre-engine DBs with a single-row schema_version: the baseline plus scheduler columns, listing fields and tombstones
+SINGLE_ROW_VERSION_SCHEMA = BASELINE_SCHEMA + """
+ALTER TABLE scheduler_config ADD COLUMN minutes_day INTEGER;
+ALTER TABLE scheduler_config ADD COLUMN minutes_night INTEGER;
+ALTER TABLE scheduler_config ADD COLUMN day_start_hour INTEGER DEFAULT 8;
+ALTER TABLE scheduler_config ADD COLUMN night_start_hour INTEGER DEFAULT 20;
+ALTER TABLE scheduler_config ADD COLUMN last_scrape_time_from TEXT;
+CREATE TABLE listing_fields (id TEXT PRIMARY KEY, price INTEGER, zone TEXT COLLATE NOCASE, room_type TEXT,
+                             available_from TEXT);
+CREATE TABLE archived_ids (h INTEGER PRIMARY KEY);
+CREATE TABLE schema_version (version INTEGER NOT NULL);
+INSERT INTO schema_version (version) VALUES (1);
+INSERT INTO listing_fields (id, price, zone, room_type) VALUES ('p1', 450, 'San Salvario', 'singola');
+INSERT INTO archived_ids (h) VALUES (42);
+"""
+
+ROWS = """
+INSERT INTO facebook_posts (id, url, time, text, attachments, status, motivo) VALUES
+    ('p1', 'https://fb/p1', '2025-01-02T10:00:00.000', 'Stanza singola', 'https://www.facebook.com/photo/?fbid=1',
+     'ACCETTATO', 'ok'),
+    ('p2', 'https://fb/p2', '2025-01-02T11:00:00.000', 'Doppia', 'https://scontent.xx.fbcdn.net/v/1_n.jpg?x=1',
+     'SCARTATO', 'no'),
+    ('p3', 'https://fb/p3', '2025-01-02T12:00:00.000', 'Monolocale', NULL, NULL, NULL);
+INSERT INTO good_facebook_posts (id, url, time, text, status) VALUES
+    ('p1', 'https://fb/p1', '2025-01-02T10:00:00.000', 'Stanza singola', 'ACCETTATO');
+INSERT INTO scheduler_config (id, active, minutes, webhook, last_run_time) VALUES
+    (1, 1, 30, 'https://example.com/hook', '2025-01-02T12:30:00.000');
+"""
+
+
+def schema(conn):
+    return sorted(conn.execute("SELECT type, name, sql FROM sqlite_master").fetchall())
+
+
+@pytest.fixture(params=['baseline', 'single_row_version'])
+def old_db(request, tmp_path):
+    path = str(tmp_path / f'{request.param}.db')
+    conn = sqlite3.connect(path)
+    conn.executescript((BASELINE_SCHEMA if request.param == 'baseline' else SINGLE_ROW_VERSION_SCHEMA) + ROWS)
+    conn.commit()
+    yield path, conn
+    conn.close()
+
+
+def test_migrate_old_db_keeps_rows(old_db):
+    path, conn = old_db
+    assert migrations.migrate(conn) == [v for v, _, _ in migrations.MIGRATIONS]
+    assert migrations.current_version(conn) == migrations.LATEST_VERSION
+    names = [r[0] for r in conn.execute("SELECT name FROM schema_version ORDER BY version")]
+    assert names == [name for _, name, _ in migrations.MIGRATIONS]
+
+    posts = conn.execute("SELECT id, url, text, status, motivo FROM facebook_posts ORDER BY id").fetchall()
+    assert posts == [('p1', 'https://fb/p1', 'Stanza singola', 'ACCETTATO', 'ok'),
+                     ('p2', 'https://fb/p2', 'Doppia', 'SCARTATO', 'no'),
+                     ('p3', 'https://fb/p3', 'Monolocale', None, None)]
+    assert conn.execute("SELECT id, status FROM good_facebook_posts").fetchall() == [('p1', 'ACCETTATO')]
+    assert conn.execute("SELECT active, minutes, webhook, last_run_time FROM scheduler_config").fetchall() == [
+        (1, 30, 'https://example.com/hook', '2025-01-02T12:30:00.000')]
+    # Every existing row gets a change cursor
+    assert conn.execute("SELECT count(*) FROM facebook_posts WHERE seq IS NULL").fetchone()[0] == 0
+    # Only the attachment url that is an image is queued for a thumbnail
+    assert conn.execute("SELECT id FROM post_attachments").fetchall() == [('p2',)]
+    if 'single_row_version' in path:
+        assert conn.execute("SELECT price, zone FROM listing_fields WHERE id = 'p1'").fetchall() == [
+            (450, 'San Salvario')]
+        assert conn.execute("SELECT h FROM archived_ids").fetchall() == [(42,)]
+
+
+def test_migrate_twice_is_a_no_op(old_db):
+    path, conn = old_db
+    migrations.migrate(conn)
+    before = schema(conn)
+    assert migrations.migrate(conn) == []
+    assert schema(conn) == before
+    assert conn.execute("SELECT count(*) FROM schema_version").fetchone()[0] == migrations.LATEST_VERSION
+
+
+def test_db_opens_migrated_file(old_db):
+    path, conn = old_db
+    conn.close()
+    db = DB(path=path)
+    try:
+        assert [it['id'] for it in db.fetch_items(limit=10)] == ['p3', 'p2', 'p1']
+        assert migrations.current_version(db.conn) == migrations.LATEST_VERSION
+    finally:
+        db.close()
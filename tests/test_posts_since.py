@@ -0,0 +1,53 @@
+import server
+from backend.utils.bench_pipeline import make_posts
+
+
+def sync(since, limit):
+    return server.get_posts(table='facebook_posts', limit=limit, since=since)
+
+
+def test_since_returns_only_newer_rows_oldest_first(db, monkeypatch):
+    monkeypatch.setattr(server, 'db', db)
+    posts = make_posts(10, seed=1, prefix='since')
+    db.add_items_to_db(posts)
+
+    first = sync(0, 4)
+    assert [it['id'] for it in first['items']] == [p['id'] for p in posts[:4]]
+    assert first['more'] is True
+    seqs = [it['seq'] for it in first['items']]
+    assert seqs == sorted(seqs) and first['cursor'] == seqs[-1]
+
+    rest = sync(first['cursor'], 1000)
+    assert [it['id'] for it in rest['items']] == [p['id'] for p in posts[4:]]
+    assert rest['more'] is False
+
+    caught_up = sync(rest['cursor'], 1000)
+    assert caught_up['items'] == [] and caught_up['cursor'] == rest['cursor'] and caught_up['more'] is False
+
+    # An analyzed post and a new one come back as deltas, in change order
+    db.record_analysis(posts[2]['id'], 'ACCETTATO', 'ok', {})
+    db.add_items_to_db(make_posts(1, seed=2, prefix='since-late'))
+    delta = sync(caught_up['cursor'], 1000)
+    assert [it['id'] for it in delta['items']] == [posts[2]['id'], 'since-late-2-0']
+    assert delta['items'][0]['status'] == 'ACCETTATO'
+    assert all(it['seq'] > caught_up['cursor'] for it in delta['items'])
+    assert delta['more'] is False
+    assert sync(delta['cursor'], 1000)['items'] == []
+
+
+def test_cursor_never_goes_back_after_deletes(db, monkeypatch):
+    monkeypatch.setattr(server, 'db', db)
+    posts = make_posts(3, seed=3, prefix='del')
+    db.add_items_to_db(posts)
+    cursor = sync(0, 1000)['cursor']
+
+    # Re-analysed, then archived: the row holding the highest seq goes away
+    db.record_analysis(posts[0]['id'], 'SCARTATO', 'no', {})
+    cursor = sync(cursor, 1000)['cursor']
+    db.c.execute("DELETE FROM facebook_posts WHERE id = ?", (posts[0]['id'],))
+    db.conn.commit()
+
+    db.add_items_to_db(make_posts(1, seed=4, prefix='del-late'))
+    delta = sync(cursor, 1000)
+    assert [it['id'] for it in delta['items']] == ['del-late-4-0']
+    assert delta['cursor'] > cursor
@@ -0,0 +1,28 @@
+import pytest
+
+from backend.preprocess import PRICE_RE, normalize_post_text
+
+
+@pytest.mark.parametrize('text', ['Disponibile dal 01-09-2025', 'Libera dal 2025-09-01', 'Libera dal 1-9-25',
+                                  'Disponibile dal 01/10/2025'])
+def test_dates_survive(text):
+    assert normalize_post_text(text) == text
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Stanza singola, chiamare 333-123-4567', 'Stanza singola, chiamare <tel>'),
+    ('Stanza singola, chiamare +39 333 1234567', 'Stanza singola, chiamare <tel>'),
+    ('Libera dal 01-09-2025, chiamare 333 1234567', 'Libera dal 01-09-2025, chiamare <tel>'),
+])
+def test_phones_are_masked(text, expected):
+    assert normalize_post_text(text) == expected
+
+
+@pytest.mark.parametrize('text, is_price', [
+    ('450e al mese', True),
+    ('Stanza a 450€', True),
+    ('canone 400 euro', True),
+    ('tra 5 e 10 minuti dal Politecnico', False),
+])
+def test_price_cues(text, is_price):
+    assert bool(PRICE_RE.search(text)) is is_price
@@ -0,0 +1,24 @@
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from backend.profiles import Profile, load_profiles
+
+
+@pytest.mark.parametrize('name', ['json', 'schema', 'copy', 'dict', 'model_fields', 'model_x', '1st', 'a-b'])
+def test_invalid_names(name):
+    with pytest.raises(ValidationError):
+        Profile(name=name)
+
+
+@pytest.mark.parametrize('name', ['torino', 'Torino_centro', 'studenti2', 'Json'])
+def test_valid_names(name):
+    assert Profile(name=name).name == name
+
+
+def test_names_differing_only_in_case_are_rejected(tmp_path):
+    path = tmp_path / 'profiles.json'
+    path.write_text(json.dumps([{'name': 'Torino', 'criteria': 'a'}, {'name': 'torino', 'criteria': 'b'}]))
+    with pytest.raises(ValueError, match='unique'):
+        load_profiles(str(path))
@@ -0,0 +1,23 @@
+from fastapi.testclient import TestClient
+
+
+def test_request_profile_covers_sync_endpoint(db, monkeypatch):
+    # Sync routes run in the threadpool, not on the thread the middleware runs on
+    import server
+    monkeypatch.setattr(server, 'db', db)
+    client = TestClient(server.app)
+    assert client.get('/posts', params={'profiling': 1}).status_code == 200
+
+    profile = db.fetch_profiles(limit=1)[0]
+    assert profile['label'] == 'GET /posts'
+    cpu = db.fetch_profile_artifact(profile['id'], 'cpu.txt').decode('utf-8')
+    assert 'get_posts' in cpu
+    assert 'fetch_items' in cpu
+
+
+def test_unprofiled_request_records_nothing(db, monkeypatch):
+    import server
+    monkeypatch.setattr(server, 'db', db)
+    client = TestClient(server.app)
+    assert client.get('/posts').status_code == 200
+    assert db.fetch_profiles() == []
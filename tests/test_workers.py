@@ -0,0 +1,35 @@
+from backend import workers
+from backend.utils.bench_pipeline import make_posts
+
+
+def test_webhook_failure_does_not_resend_telegram(db, monkeypatch):
+    posts = make_posts(2, seed=4, prefix='notify')
+    db.add_items_to_db(posts)
+    for post in posts:
+        db.record_analysis(post['id'], 'ACCETTATO', 'ok', {})
+        db.promote(post['id'])
+        db.enqueue_job('notify', {'id': post['id']}, key=post['id'])
+
+    sent = []
+    monkeypatch.setattr(workers, 'send_telegram', lambda db, bot, item: sent.append(item['id']))
+    queued = []
+
+    def enqueue(db, items, webhook_url=None):
+        if not queued:
+            queued.append(None)
+            raise RuntimeError('database is locked')
+        queued.extend(item['id'] for item in items)
+        return len(items)
+    monkeypatch.setattr(workers.webhooks, 'enqueue', enqueue)
+    monkeypatch.setattr(workers, 'backoff', lambda attempts, base, cap: -1)
+
+    worker = workers.NotifyWorker()
+    assert worker.run_once(db) == 2
+    assert sorted(sent) == sorted(p['id'] for p in posts)
+    assert worker.stats()['retried'] == 2
+
+    # The retry queues the webhooks only
+    assert worker.run_once(db) == 2
+    assert len(sent) == 2
+    assert sorted(queued[1:]) == sorted(p['id'] for p in posts)
+    assert worker.stats()['done'] == 2